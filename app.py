@@ -1,18 +1,32 @@
-from flask import Flask, request, abort
+from flask import Flask, Response, g, request, abort, jsonify, has_request_context
 import os
-import urllib.parse
-from datetime import datetime, date, time
+import logging
+import hmac
+import ipaddress
+import threading
+from datetime import date
+from typing import List, Optional
 from dotenv import load_dotenv
 from database import DatabaseManager
+from repository import open_storage
+from webhook_queue import EventDispatcher
+from event_dedup import EventDeduplicator
+from line_client import LineApiHolder
+from catalog import CatalogCache, CatalogData
+from qr_service import QRCodeService
+from manifest import stream_manifest
+from cache import TTLCache
+from import_employees import import_employees, read_rows
+from postback_router import PostbackRouter
+from metrics import REGISTRY, Counter, GaugeFunc, Histogram
+from settings import DeadlineEvaluator, SettingsCache, taipei_today
+from lazy_import import lazy_classes, warm_up
+from i18n import CATALOG, StaticMessages
+from logs import (WebhookBody, bind_log_context, configure_logging, log_context, new_request_id,
+                  should_log_webhook, unbind_log_context)
 
-# 使用新版的LINE Bot SDK v3
-from linebot.v3 import WebhookHandler
-from linebot.v3.exceptions import InvalidSignatureError
-from linebot.v3.messaging import (
-    Configuration,
-    ApiClient,
-    MessagingApi,
-    ReplyMessageRequest,
+# 使用新版的LINE Bot SDK v3 (第一次使用時才載入，見 lazy_import.py)
+(
     TextMessage,
     ImageMessage,
     QuickReply,
@@ -21,196 +35,306 @@ from linebot.v3.messaging import (
     TemplateMessage,
     ButtonsTemplate,
     PostbackAction
+) = lazy_classes(
+    'linebot.v3.messaging',
+    'TextMessage', 'ImageMessage', 'QuickReply', 'QuickReplyItem',
+    'MessageAction', 'TemplateMessage', 'ButtonsTemplate', 'PostbackAction'
 )
-from linebot.v3.webhooks import (
-    MessageEvent,
-    TextMessageContent,
-    PostbackEvent
+MessageEvent, TextMessageContent, PostbackEvent = lazy_classes(
+    'linebot.v3.webhooks', 'MessageEvent', 'TextMessageContent', 'PostbackEvent'
 )
+WebhookParser, = lazy_classes('linebot.v3.webhook', 'WebhookParser')
+InvalidSignatureError, = lazy_classes('linebot.v3.exceptions', 'InvalidSignatureError')
 
 # 載入環境變數
 load_dotenv()
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
-db = DatabaseManager()
+# 資料表檢查與升級在 startup() 執行，import 時不連資料庫
+db = DatabaseManager(init=False)
+# 員工、預約、訂餐、目錄與設定的讀寫都經過 storage (DATABASE_URL 可改用 PostgreSQL，見 repository.py)；
+# Webhook 事件去重仍使用 db 的本機 SQLite 資料庫
+storage = open_storage(db)
+menu_catalog = CatalogCache(storage.catalog, check_interval=float(os.getenv('CATALOG_CHECK_INTERVAL', '30')))
+system_settings = SettingsCache(storage.settings, check_interval=float(os.getenv('SETTINGS_CHECK_INTERVAL', '5')))
+booking_deadlines = DeadlineEvaluator(system_settings)
+event_dedup = EventDeduplicator(
+    db,
+    ttl=float(os.getenv('WEBHOOK_DEDUP_TTL', '86400')),
+    maxsize=int(os.getenv('WEBHOOK_DEDUP_SIZE', '10000'))
+)
 
 # 設定LINE Bot
-configuration = Configuration(access_token=os.getenv('CHANNEL_ACCESS_TOKEN'))
-handler = WebhookHandler(os.getenv('CHANNEL_SECRET'))
+line_api = LineApiHolder()
+qr_service = QRCodeService(
+    os.getenv('QR_SIGNING_KEY') or os.getenv('CHANNEL_SECRET'),
+    maxsize=int(os.getenv('QR_CACHE_SIZE', '2000'))
+)
+QR_IMAGE_MAX_AGE = int(os.getenv('QR_IMAGE_MAX_AGE', '60'))
+# 廚房看板輪詢頻繁，訂餐數快取幾秒即可
+kitchen_cache = TTLCache(maxsize=64, ttl=float(os.getenv('KITCHEN_COUNTS_TTL', '5')))
+# /stats、/metrics 不需 ADMIN_TOKEN 的來源位址 (逗號分隔的 IP 或網段，預設只有本機)；
+# 經反向代理時 remote_addr 是代理的位址，外部的 Prometheus 請改用 Authorization: Bearer ADMIN_TOKEN
+MONITORING_ALLOW = [ipaddress.ip_network(net.strip(), strict=False)
+                    for net in os.getenv('METRICS_ALLOW', '127.0.0.1,::1').split(',') if net.strip()]
+
+# 監控指標 (/metrics)
+WEBHOOK_SECONDS = Histogram('linebot_webhook_request_seconds', '/callback 回應時間')
+WEBHOOK_REQUESTS = Counter('linebot_webhook_requests_total', '/callback 請求數', ['status'])
+EVENT_SECONDS = Histogram('linebot_event_seconds', '單一事件處理時間 (含送出回覆)', ['type'])
+GaugeFunc('linebot_db_pool_connections', '資料庫連線池連線數',
+          lambda: {(state,): value for state, value in db.pool.stats().items()}, ['state'])
+GaugeFunc('linebot_webhook_queue_depth', '非同步佇列中待處理的事件數',
+          lambda: event_dispatcher.depth() if event_dispatcher else None)
+GaugeFunc('linebot_webhook_queue_capacity', '非同步佇列容量',
+          lambda: event_dispatcher.stats()['capacity'] if event_dispatcher else None)
+GaugeFunc('linebot_webhook_queue_rejected_total', '佇列已滿而回應 503 的事件數',
+          lambda: event_dispatcher.stats()['rejected'] if event_dispatcher else None, type='counter')
+GaugeFunc('linebot_webhook_queue_wait_seconds_max', '事件在佇列中等待的最長時間',
+          lambda: event_dispatcher.stats()['wait_seconds_max'] if event_dispatcher else None)
+GaugeFunc('linebot_cache_hits_total', '快取命中次數',
+          lambda: {('employee',): storage.employees.cache.hits, ('menu_catalog',): menu_catalog.hits,
+                   ('qr_image',): qr_service.cache.hits, ('kitchen_counts',): kitchen_cache.hits},
+          ['cache'], type='counter')
+GaugeFunc('linebot_cache_misses_total', '快取未命中次數',
+          lambda: {('employee',): storage.employees.cache.misses, ('menu_catalog',): menu_catalog.misses,
+                   ('qr_image',): qr_service.cache.misses, ('kitchen_counts',): kitchen_cache.misses},
+          ['cache'], type='counter')
+_webhook_parser = None
+
+def webhook_parser():
+    """驗證簽章並解析 webhook 的 WebhookParser，第一次使用時才建立"""
+    global _webhook_parser
+    if _webhook_parser is None:
+        _webhook_parser = WebhookParser(os.getenv('CHANNEL_SECRET'))
+    return _webhook_parser
 
-# 🆕 加入這個函數和執行
 def auto_add_employees():
-    """啟動時自動新增測試員工"""
+    """啟動時匯入測試員工 (seed_employees.csv，已存在且沒變動的不會重寫)"""
+    seed_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'seed_employees.csv')
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        # 檢查員工是否已存在
-        cursor.execute('SELECT id FROM employees WHERE employee_id = ?', ('IGA1-01657',))
-        if not cursor.fetchone():
-            # 新增員工
-            cursor.execute('''
-                INSERT INTO employees (employee_id, name, department_id, shift_type, preferred_language)
-                VALUES (?, ?, ?, ?, ?)
-            ''', ('IGA1-01657', '測試員工01657', 1, 'day', 'zh'))
-            
-            conn.commit()
-            print("✅ 自動新增員工 IGA1-01657")
-        else:
-            print("👤 員工 IGA1-01657 已存在")
-            
-        conn.close()
-    except Exception as e:
-        print(f"員工新增錯誤: {e}")
-
-# 啟動時執行
-auto_add_employees()
-
-# 多語言支援
-MESSAGES = {
-    'zh': {
-        'welcome': '歡迎使用交通車預約訂餐系統！',
-        'bind_required': '請先輸入您的員工編號進行綁定\n格式：IGA1-02849',
-        'bind_success': '✅ 綁定成功！歡迎 {}！',
-        'bind_failed': '❌ 綁定失敗：{}',
-        'main_menu_title': '交通車預約訂餐系統',
-        'main_menu_text': '請選擇您要使用的功能：',
-        'bus_booking': '🚌 預約交通車',
-        'meal_booking': '🍱 訂餐服務',
-        'view_booking': '📋 查看我的預約',
-        'cancel_booking': '❌ 取消預約',
-        'route_selection': '選擇交通車路線',
-        'route_selection_text': '請選擇您要預約的路線：',
-        'schedule_selection_text': '請選擇班次時間：',
-        'meal_location': '選擇取餐地點',
-        'meal_location_text': '請選擇您要訂餐的地點：',
-        'back_to_menu': '🔙 返回主選單',
-        'booking_success': '✅ 預約成功！',
-        'booking_failed': '❌ 預約失敗：{}',
-        'time_limit_exceeded': '❌ 超過預約時間限制',
-        'no_bookings': '您目前沒有預約記錄',
-        'qr_code_title': '🍱 領餐認證QR碼',
-        'qr_code_desc': '請向餐廳人員出示此QR碼領取餐點',
-        'qr_code_invalid': '❌ 您今日沒有訂餐記錄，無法生成QR碼',
-        'language_changed': '✅ 語言已切換為：{}',
-        'cancel_success': '✅ 取消成功！',
-        'cancel_failed': '❌ 取消失敗：{}',
-        'nothing_to_cancel': '❌ 沒有可取消的預約'
-    },
-    'en': {
-        'welcome': 'Welcome to Bus & Meal Booking System!',
-        'bind_required': 'Please enter your employee ID for binding\nFormat: IGA1-02849',
-        'bind_success': '✅ Binding successful! Welcome {}!',
-        'bind_failed': '❌ Binding failed: {}',
-        'main_menu_title': 'Bus & Meal Booking System',
-        'main_menu_text': 'Please select the function you want to use:',
-        'bus_booking': '🚌 Book Bus',
-        'meal_booking': '🍱 Order Meal',
-        'view_booking': '📋 View My Bookings',
-        'cancel_booking': '❌ Cancel Booking',
-        'route_selection': 'Select Bus Route',
-        'route_selection_text': 'Please select the route you want to book:',
-        'schedule_selection_text': 'Please select departure time:',
-        'meal_location': 'Select Meal Location',
-        'meal_location_text': 'Please select where you want to order:',
-        'back_to_menu': '🔙 Back to Main Menu',
-        'booking_success': '✅ Booking successful!',
-        'booking_failed': '❌ Booking failed: {}',
-        'time_limit_exceeded': '❌ Booking time limit exceeded',
-        'no_bookings': 'You have no current bookings',
-        'qr_code_title': '🍱 Meal Pickup QR Code',
-        'qr_code_desc': 'Please show this QR code to restaurant staff',
-        'qr_code_invalid': '❌ No meal order today, cannot generate QR code',
-        'language_changed': '✅ Language changed to: {}',
-        'cancel_success': '✅ Cancelled successfully!',
-        'cancel_failed': '❌ Cancel failed: {}',
-        'nothing_to_cancel': '❌ Nothing to cancel'
-    },
-    'vi': {
-        'welcome': 'Chào mừng đến với Hệ thống Đặt xe & Đặt cơm!',
-        'bind_required': 'Vui lòng nhập mã nhân viên để liên kết\nĐịnh dạng: IGA1-02849',
-        'bind_success': '✅ Liên kết thành công! Chào mừng {}!',
-        'bind_failed': '❌ Liên kết thất bại: {}',
-        'main_menu_title': 'Hệ thống Đặt xe & Đặt cơm',
-        'main_menu_text': 'Vui lòng chọn chức năng bạn muốn sử dụng:',
-        'bus_booking': '🚌 Đặt xe',
-        'meal_booking': '🍱 Đặt cơm',
-        'view_booking': '📋 Xem đặt chỗ của tôi',
-        'cancel_booking': '❌ Hủy đặt chỗ',
-        'route_selection': 'Chọn tuyến xe',
-        'route_selection_text': 'Vui lòng chọn tuyến bạn muốn đặt:',
-        'schedule_selection_text': 'Vui lòng chọn giờ khởi hành:',
-        'meal_location': 'Chọn địa điểm ăn',
-        'meal_location_text': 'Vui lòng chọn nơi bạn muốn đặt cơm:',
-        'back_to_menu': '🔙 Về menu chính',
-        'booking_success': '✅ Đặt chỗ thành công!',
-        'booking_failed': '❌ Đặt chỗ thất bại: {}',
-        'time_limit_exceeded': '❌ Đã quá thời gian đặt chỗ',
-        'no_bookings': 'Bạn hiện tại không có đặt chỗ nào',
-        'qr_code_title': '🍱 Mã QR nhận cơm',
-        'qr_code_desc': 'Vui lòng xuất trình mã QR này cho nhân viên nhà hàng',
-        'qr_code_invalid': '❌ Không có đơn đặt cơm hôm nay, không thể tạo mã QR',
-        'language_changed': '✅ Đã chuyển ngôn ngữ sang: {}',
-        'cancel_success': '✅ Hủy thành công!',
-        'cancel_failed': '❌ Hủy thất bại: {}',
-        'nothing_to_cancel': '❌ Không có gì để hủy'
-    }
-}
+        result = import_employees(storage, read_rows(seed_file))
+        for error in result['errors']:
+            logger.warning("員工新增錯誤: %s", error)
+        if result['inserted'] or result['updated']:
+            logger.info("✅ 自動新增員工 %d 位，更新 %d 位", result['inserted'], result['updated'])
+        elif not result['rejected']:
+            logger.info("👤 測試員工皆已存在")
+    except Exception:
+        logger.exception("員工新增錯誤")
 
 @app.route("/", methods=['GET'])
 def home():
     return "交通車預約系統正在運行中！"
 
+@app.route("/stats", methods=['GET'])
+def stats():
+    """快取與連線池統計 (限 METRICS_ALLOW 或帶 ADMIN_TOKEN)"""
+    require_monitoring_access()
+    return jsonify({
+        'employee_cache': storage.employees.cache.stats(),
+        'db_pool': db.pool.stats(),
+        'storage': storage.stats(),
+        'menu_catalog': menu_catalog.stats(),
+        'system_settings': system_settings.stats(),
+        'kitchen_counts': kitchen_cache.stats(),
+        'postback_actions': postback_router.stats(),
+        'static_messages': static_messages.stats(),
+        'webhook_dedup': event_dedup.stats(),
+        'webhook_queue': event_dispatcher.stats() if event_dispatcher else None
+    })
+
+@app.route("/qr/meal/<int:employee_id>/<day>/<int:restaurant_id>.png", methods=['GET'])
+def meal_qr_image(employee_id, day, restaurant_id):
+    """領餐QR碼圖片 (本機產生，供LINE圖片訊息使用)"""
+    try:
+        pickup_date = date.fromisoformat(day)
+    except ValueError:
+        abort(404)
+    if not qr_service.verify(employee_id, pickup_date, restaurant_id, request.args.get('sig')):
+        abort(403)
+    
+    # 每次都確認訂單仍有效 (取消可能發生在其他程序)，快取只省下產生圖片的時間
+    row = storage.orders.pickup(employee_id, pickup_date, restaurant_id)
+    if not row:
+        abort(404)
+    cached = qr_service.get(employee_id, pickup_date, restaurant_id)
+    if cached is None:
+        cached = qr_service.render(employee_id, pickup_date, restaurant_id, meal_qr_content(*row, pickup_date))
+    
+    png, etag = cached
+    response = Response(png, mimetype='image/png')
+    response.set_etag(etag)
+    # 取消訂單後圖片就失效，不讓共用快取或瀏覽器長期保存
+    response.headers['Cache-Control'] = f'private, max-age={QR_IMAGE_MAX_AGE}'
+    return response.make_conditional(request)
+
+@app.route("/metrics", methods=['GET'])
+def metrics():
+    """Prometheus 監控指標 (限 METRICS_ALLOW 或帶 ADMIN_TOKEN)"""
+    require_monitoring_access()
+    return Response(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route("/kitchen/counts", methods=['GET'])
+def kitchen_meal_counts():
+    """廚房看板：各餐廳訂餐數 (?date=&floor=)"""
+    try:
+        day = date.fromisoformat(request.args['date']) if request.args.get('date') else taipei_today()
+    except ValueError:
+        abort(400)
+    floor = request.args.get('floor') or None
+    
+    key = (day, floor)
+    result = kitchen_cache.get(key)
+    if result is None:
+        restaurants = storage.orders.kitchen_counts(day, floor)
+        result = {
+            'date': day.isoformat(),
+            'restaurants': restaurants,
+            'total': sum(r['ordered'] for r in restaurants)
+        }
+        kitchen_cache.set(key, result)
+    
+    response = jsonify(result)
+    response.headers['Cache-Control'] = f'public, max-age={int(kitchen_cache.ttl)}'
+    return response
+
+def require_admin_token():
+    """管理用 API 需帶 ADMIN_TOKEN (Authorization: Bearer 或 ?token=)，未設定時一律拒絕"""
+    expected = os.getenv('ADMIN_TOKEN')
+    auth = request.headers.get('Authorization', '')
+    supplied = auth[len('Bearer '):] if auth.startswith('Bearer ') else request.args.get('token', '')
+    if not expected or not hmac.compare_digest(supplied.encode('utf-8'), expected.encode('utf-8')):
+        abort(403)
+
+def require_monitoring_access():
+    """監控端點：來源位址在 METRICS_ALLOW 內，或帶 ADMIN_TOKEN"""
+    try:
+        client = ipaddress.ip_address(request.remote_addr or '')
+    except ValueError:
+        client = None
+    if client is not None and any(client in net for net in MONITORING_ALLOW):
+        return
+    require_admin_token()
+
+@app.route("/manifest/bus", methods=['GET'])
+def bus_manifest():
+    """交通車乘客名單 (?date=&route=&schedule_id=&format=csv|json)，邊查詢邊輸出"""
+    require_admin_token()
+    try:
+        day = date.fromisoformat(request.args['date']) if request.args.get('date') else taipei_today()
+        schedule_id = int(request.args['schedule_id']) if request.args.get('schedule_id') else None
+    except ValueError:
+        abort(400)
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'json'):
+        abort(400)
+    
+    response = Response(
+        stream_manifest(storage, day, fmt, request.args.get('route') or None, schedule_id),
+        mimetype='application/json' if fmt == 'json' else 'text/csv'
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename="bus-manifest-{day}.{fmt}"'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.before_request
+def bind_request_id():
+    """請求期間的日誌都帶上 request_id (沿用上游的 X-Request-Id，沒有時產生一個)"""
+    g.request_id = request.headers.get('X-Request-Id', '')[:64] or new_request_id()
+    g.log_token = bind_log_context(request_id=g.request_id)
+
+@app.teardown_request
+def unbind_request_id(exc=None):
+    token = g.pop('log_token', None)
+    if token is not None:
+        unbind_log_context(token)
+
+@app.after_request
+def count_webhook_requests(response):
+    if request.endpoint == 'callback':
+        WEBHOOK_REQUESTS.labels(response.status_code).inc()
+    if 'request_id' in g:
+        response.headers['X-Request-Id'] = g.request_id
+    return response
+
 @app.route("/callback", methods=['POST'])
+@WEBHOOK_SECONDS.time()
 def callback():
     signature = request.headers['X-Line-Signature']
     body = request.get_data(as_text=True)
-    app.logger.info("Request body: " + body)
+    # 不記錄原文 (含 LINE user ID 與使用者輸入)，背景執行緒寫出時才整理成摘要
+    if should_log_webhook():
+        logger.info("webhook received", extra={'webhook': WebhookBody(body)})
     
+    parser = webhook_parser()
     try:
-        handler.handle(body, signature)
-    except InvalidSignatureError:
-        app.logger.info("Invalid signature. Please check your channel access token/channel secret.")
+        events = parser.parse(body, signature)
+    except InvalidSignatureError.resolve():  # except 需要真正的例外類別
+        logger.warning("Invalid signature. Please check your channel access token/channel secret.")
         abort(400)
     
+    # LINE 重送的事件 (webhookEventId 相同) 已處理過就略過，不會重複預約或回覆
+    events = [event for event in events if event_dedup.claim_event(event)]
+    
+    if event_dispatcher is None:
+        for index, event in enumerate(events):
+            try:
+                dispatch_event(event)
+            except Exception:
+                # 回應 500 讓 LINE 重送，尚未處理完的事件重送時要能再處理
+                for pending in events[index:]:
+                    event_dedup.release_event(pending)
+                raise
+    else:
+        # 非同步模式：驗證簽章後放入佇列，立即回應 LINE
+        for index, event in enumerate(events):
+            if not event_dispatcher.submit(event):
+                logger.warning("Webhook queue is full, asking LINE to retry later.")
+                for pending in events[index:]:
+                    event_dedup.release_event(pending)
+                abort(503)
+    
     return 'OK'
 
 def get_user_language(line_user_id: str) -> str:
     """取得使用者語言設定"""
-    employee = db.get_employee_by_line_id(line_user_id)
+    employee = storage.employees.get(line_user_id)
     if employee:
         return employee.get('preferred_language', 'zh')
     return 'zh'
 
-def get_message(key: str, lang: str = 'zh', *args) -> str:
-    """取得多語言訊息"""
-    message = MESSAGES.get(lang, MESSAGES['zh']).get(key, key)
-    if args:
-        return message.format(*args)
-    return message
+# 取得多語言訊息：get_message(key, lang='zh', *args)，字串見 i18n.py
+get_message = CATALOG.get
+
+# 主選單等固定訊息每種語言只建立一次
+static_messages = StaticMessages()
 
 def check_time_limit(shift_type: str, booking_type: str) -> bool:
-    """檢查是否超過預約時間限制"""
-    now = datetime.now().time()
-    
-    if booking_type == 'bus':
-        if shift_type == 'day':
-            limit = time(14, 30)  # 14:30
-        else:
-            limit = time(9, 0)    # 09:00
-    elif booking_type == 'meal':
-        if shift_type == 'day':
-            limit = time(9, 0)    # 09:00
-        else:
-            limit = time(21, 0)   # 21:00
-    
-    return True
-def generate_meal_verification_code(employee_data: dict, meal_data: dict) -> str:
+    """檢查是否還在預約時間內 (system_settings 的截止時間，台北時間)"""
+    return booking_deadlines.is_open(booking_type, shift_type)
+def generate_meal_verification_code(employee_data: dict, meal_data: dict, day: date = None) -> str:
     """生成領餐驗證碼"""
-    today = date.today()
+    today = day or taipei_today()
     verification_code = f"{employee_data['employee_id']}-{today.strftime('%Y%m%d')}"
     return verification_code
 
+def meal_qr_content(employee_code: str, employee_name: str, restaurant_name: str, floor: str, day: date) -> str:
+    """領餐QR碼內容"""
+    verification_code = generate_meal_verification_code({'employee_id': employee_code}, {}, day)
+    return f"員工：{employee_name}\n編號：{employee_code}\n餐廳：{restaurant_name}\n樓層：{floor}\n日期：{day}\n驗證碼：{verification_code}"
+
+def public_url(path: str):
+    """組出LINE可存取的https網址，優先使用 PUBLIC_BASE_URL"""
+    base = os.getenv('PUBLIC_BASE_URL')
+    if not base and has_request_context():
+        base = request.host_url.replace('http://', 'https://', 1)
+    if not base:
+        return None
+    return base.rstrip('/') + path
+
+@static_messages.register
 def create_main_menu(lang: str = 'zh'):
     """建立主選單"""
     buttons_template = ButtonsTemplate(
@@ -237,19 +361,14 @@ def create_main_menu(lang: str = 'zh'):
     )
     return TemplateMessage(alt_text=get_message('main_menu_title', lang), template=buttons_template)
 
+@static_messages.register
 def create_language_menu(current_lang: str = 'zh'):
     """建立語言選擇選單"""
-    languages = {
-        'zh': '中文 🇹🇼',
-        'en': 'English 🇺🇸', 
-        'vi': 'Tiếng Việt 🇻🇳'
-    }
-    
     actions = []
-    for lang_code, lang_name in languages.items():
+    for lang_code in CATALOG.languages:
         if lang_code != current_lang:  # 不顯示當前語言
             actions.append(PostbackAction(
-                label=lang_name,
+                label=get_message('language_label', lang_code),
                 data=f'action=change_language&lang={lang_code}'
             ))
     
@@ -259,48 +378,25 @@ def create_language_menu(current_lang: str = 'zh'):
     ))
     
     buttons_template = ButtonsTemplate(
-        title='語言設定 Language',
-        text='選擇語言 Choose Language:',
+        title=get_message('language_menu_title', current_lang),
+        text=get_message('language_menu_text', current_lang),
         actions=actions
     )
-    return TemplateMessage(alt_text='Language Settings', template=buttons_template)
+    return TemplateMessage(alt_text=get_message('language_menu_alt', current_lang), template=buttons_template)
 
+@static_messages.register
 def create_cancel_menu(lang: str = 'zh'):
     """建立取消預約選單"""
-    title_text = {
-        'zh': '取消預約',
-        'en': 'Cancel Booking', 
-        'vi': 'Hủy đặt chỗ'
-    }
-    
-    desc_text = {
-        'zh': '請選擇要取消的項目:',
-        'en': 'Select item to cancel:',
-        'vi': 'Chọn mục cần hủy:'
-    }
-    
-    bus_text = {
-        'zh': '🚌 取消交通車',
-        'en': '🚌 Cancel Bus',
-        'vi': '🚌 Hủy xe'
-    }
-    
-    meal_text = {
-        'zh': '🍱 取消訂餐',
-        'en': '🍱 Cancel Meal',
-        'vi': '🍱 Hủy cơm'
-    }
-    
     buttons_template = ButtonsTemplate(
-        title=title_text[lang],
-        text=desc_text[lang],
+        title=get_message('cancel_menu_title', lang),
+        text=get_message('cancel_menu_text', lang),
         actions=[
             PostbackAction(
-                label=bus_text[lang],
+                label=get_message('cancel_bus', lang),
                 data='action=cancel_confirm&type=bus'
             ),
             PostbackAction(
-                label=meal_text[lang],
+                label=get_message('cancel_meal', lang),
                 data='action=cancel_confirm&type=meal'
             ),
             PostbackAction(
@@ -309,18 +405,16 @@ def create_cancel_menu(lang: str = 'zh'):
             )
         ]
     )
-    return TemplateMessage(alt_text=title_text[lang], template=buttons_template)
+    return TemplateMessage(alt_text=get_message('cancel_menu_title', lang), template=buttons_template)
 
 def create_bus_route_menu(lang: str = 'zh'):
     """建立交通車路線選單"""
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT id, route_code, route_name_zh, route_name_en, route_name_vi FROM bus_routes WHERE is_active = TRUE')
-    routes = cursor.fetchall()
-    conn.close()
-    
+    return menu_catalog.get(('bus_route', lang), lambda catalog: render_bus_route_menu(catalog, lang))
+
+def render_bus_route_menu(catalog: CatalogData, lang: str = 'zh'):
+    """由目錄資料產生交通車路線選單"""
     actions = []
-    for route in routes:
+    for route in catalog.routes:
         route_id, code, name_zh, name_en, name_vi = route
         if lang == 'en':
             label = f'🚌 {name_en}'
@@ -348,26 +442,24 @@ def create_bus_route_menu(lang: str = 'zh'):
 
 def create_bus_schedule_menu(route_id: int, shift_type: str, lang: str = 'zh'):
     """建立班次選單"""
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT bs.id, bs.departure_time, bs.schedule_name_zh, bs.schedule_name_en, bs.schedule_name_vi,
-               br.route_name_zh, br.route_name_en, br.route_name_vi
-        FROM bus_schedules bs
-        JOIN bus_routes br ON bs.route_id = br.id
-        WHERE bs.route_id = ? AND bs.shift_type = ? AND bs.is_active = TRUE
-    ''', (route_id, shift_type))
-    schedules = cursor.fetchall()
-    conn.close()
+    return menu_catalog.get(
+        ('bus_schedule', lang, shift_type, route_id),
+        lambda catalog: render_bus_schedule_menu(catalog, route_id, shift_type, lang)
+    )
+
+def render_bus_schedule_menu(catalog: CatalogData, route_id: int, shift_type: str, lang: str = 'zh'):
+    """由目錄資料產生班次選單"""
+    schedules = catalog.schedules_for(route_id, shift_type)
     
     if not schedules:
         return TextMessage(text="目前沒有可用的班次")
     
     actions = []
-    route_name = schedules[0][5] if lang == 'zh' else schedules[0][6] if lang == 'en' else schedules[0][7]
+    route_name = schedules[0][7] if lang == 'zh' else schedules[0][8] if lang == 'en' else schedules[0][9]
     
     for schedule in schedules:
-        schedule_id, departure_time, name_zh, name_en, name_vi = schedule[:5]
+        schedule_id = schedule[0]
+        departure_time, name_zh, name_en, name_vi = schedule[3:7]
         
         if lang == 'en':
             label = f'🕐 {departure_time} {name_en}'
@@ -395,15 +487,13 @@ def create_bus_schedule_menu(route_id: int, shift_type: str, lang: str = 'zh'):
 
 def create_meal_location_menu(lang: str = 'zh'):
     """建立訂餐地點選單"""
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT id, floor, name_zh, name_en, name_vi FROM restaurants WHERE is_active = TRUE')
-    restaurants = cursor.fetchall()
-    conn.close()
-    
+    return menu_catalog.get(('meal_location', lang), lambda catalog: render_meal_location_menu(catalog, lang))
+
+def render_meal_location_menu(catalog: CatalogData, lang: str = 'zh'):
+    """由目錄資料產生訂餐地點選單"""
     # 按樓層分組
     floors = {}
-    for restaurant in restaurants:
+    for restaurant in catalog.restaurants:
         floor = restaurant[1]
         if floor not in floors:
             floors[floor] = []
@@ -441,19 +531,19 @@ def create_meal_location_menu(lang: str = 'zh'):
     )
     return TemplateMessage(alt_text=get_message('meal_location', lang), template=buttons_template)
 
-@handler.add(MessageEvent, message=TextMessageContent)
-def handle_message(event):
+def message_reply(event) -> list:
+    """文字訊息要回覆的訊息 (同步與 asyncio 路徑共用，送出由呼叫端負責)"""
     line_user_id = event.source.user_id
     user_message = event.message.text.strip()
     
     # 檢查使用者是否已綁定
-    employee = db.get_employee_by_line_id(line_user_id)
+    employee = storage.employees.get(line_user_id)
     lang = get_user_language(line_user_id)
     
     if not employee:
         # 檢查是否為員工編號格式 (例: IGA1-02849)
         if len(user_message) == 10 and '-' in user_message:
-            result = db.bind_line_user(line_user_id, user_message.upper())
+            result = storage.bindings.bind(line_user_id, user_message.upper())
             if result['success']:
                 reply_message = TextMessage(text=get_message('bind_success', lang, result['message']))
             else:
@@ -476,354 +566,320 @@ def handle_message(event):
                 )
             )
     
-    # 送出回覆
-    with ApiClient(configuration) as api_client:
-        line_bot_api = MessagingApi(api_client)
-        line_bot_api.reply_message_with_http_info(
-            ReplyMessageRequest(
-                reply_token=event.reply_token,
-                messages=[reply_message]
-            )
+    return [reply_message]
+
+@EVENT_SECONDS.labels('message').time()
+def handle_message(event):
+    send_reply(event, message_reply(event))
+
+class PostbackContext:
+    """postback 處理時的使用者資訊"""
+    
+    def __init__(self, event, employee: dict):
+        self.event = event
+        self.line_user_id = event.source.user_id
+        self.employee = employee
+        self.employee_id = employee.get('id')
+        self.lang = employee.get('preferred_language', 'zh')
+        self.shift_type = employee.get('shift_type')
+
+def back_to_menu_reply(text: str, label: str = "🏠 返回主選單", extra_items: list = None):
+    """附帶返回主選單快速按鈕的文字訊息"""
+    items = [QuickReplyItem(action=PostbackAction(label=label, data="action=main_menu"))]
+    items.extend(extra_items or [])
+    return TextMessage(text=text, quick_reply=QuickReply(items=items))
+
+def send_reply(event, messages: list):
+    """送出回覆 (所有事件共用)"""
+    if messages:
+        line_api.reply(event.reply_token, messages)
+
+postback_router = PostbackRouter()
+
+@postback_router.fallback
+def postback_unknown(ctx: PostbackContext):
+    return TextMessage(text="系統錯誤，請重新開始")
+
+@postback_router.action('main_menu')
+def postback_main_menu(ctx: PostbackContext):
+    return create_main_menu(ctx.lang)
+
+@postback_router.action('generate_qr')
+def postback_generate_qr(ctx: PostbackContext):
+    employee, employee_id, lang = ctx.employee, ctx.employee_id, ctx.lang
+    
+    # 檢查今日是否有訂餐記錄
+    today = taipei_today()
+    meal_record = storage.orders.for_day(employee_id, today)
+    
+    if not meal_record:
+        return TextMessage(text=get_message('qr_code_invalid', lang))
+    
+    # 生成驗證碼
+    verification_code = generate_meal_verification_code(employee, {
+        'restaurant_name': meal_record[0],
+        'floor': meal_record[1],
+        'ordered_at': str(meal_record[2])
+    }, today)
+    
+    # 在本機產生QR Code圖片並先放入快取，LINE來抓圖時直接命中
+    restaurant_id = meal_record[3]
+    qr_content = meal_qr_content(employee['employee_id'], employee['name'], meal_record[0], meal_record[1], today)
+    qr_service.render(employee_id, today, restaurant_id, qr_content)
+    qr_image_url = public_url(qr_service.image_path(employee_id, today, restaurant_id))
+    
+    # 文字 + QR Code圖片
+    messages = [
+        back_to_menu_reply(
+            f"{get_message('qr_code_title', lang)}\n\n{get_message('qr_code_desc', lang)}\n\n👤 {employee['name']}\n🍱 {meal_record[0]}\n📍 {meal_record[1]}\n📅 {today}\n\n🔢 驗證碼：{verification_code}\n\n📱 請出示下方QR碼給餐廳人員："
         )
+    ]
+    if qr_image_url:
+        messages.append(ImageMessage(
+            original_content_url=qr_image_url,
+            preview_image_url=qr_image_url
+        ))
+    else:
+        logger.warning("⚠️ 未設定 PUBLIC_BASE_URL，無法提供QR碼圖片網址")
+    return messages
 
-@handler.add(PostbackEvent)
-def handle_postback(event):
-    line_user_id = event.source.user_id
-    data = event.postback.data
+@postback_router.action('language_menu')
+def postback_language_menu(ctx: PostbackContext):
+    return create_language_menu(ctx.lang)
+
+@postback_router.action('change_language', lang=(str, 'zh'))
+def postback_change_language(ctx: PostbackContext, lang: str):
+    if lang not in CATALOG.languages:
+        return postback_unknown(ctx)
     
-    # 檢查使用者是否已綁定
-    employee = db.get_employee_by_line_id(line_user_id)
-    if not employee:
-        reply_message = TextMessage(text=get_message('bind_required'))
-        with ApiClient(configuration) as api_client:
-            line_bot_api = MessagingApi(api_client)
-            line_bot_api.reply_message_with_http_info(
-                ReplyMessageRequest(
-                    reply_token=event.reply_token,
-                    messages=[reply_message]
-                )
-            )
-        return
+    # 更新資料庫中的語言設定
+    storage.employees.set_language(ctx.employee_id, lang)
+    storage.employees.invalidate(ctx.line_user_id)
     
-    lang = employee.get('preferred_language', 'zh')
-    shift_type = employee.get('shift_type')
-    employee_id = employee.get('id')
+    return back_to_menu_reply(get_message('language_changed', lang, get_message('language_name', lang)), label="🏠 主選單")
+
+@postback_router.action('cancel_booking')
+def postback_cancel_booking(ctx: PostbackContext):
+    return create_cancel_menu(ctx.lang)
+
+@postback_router.action('cancel_confirm', type=str)
+def postback_cancel_confirm(ctx: PostbackContext, type: str):
+    cancel_type, lang = type, ctx.lang
+    try:
+        today = taipei_today()
+        cancelled = 0
+        if cancel_type == 'bus':
+            # 取消並釋出座位
+            cancelled = storage.reservations.cancel(ctx.employee_id, today)
+        elif cancel_type == 'meal':
+            cancelled = storage.orders.cancel(ctx.employee_id, today)
+    except Exception as e:
+        return TextMessage(text=get_message('cancel_failed', lang, str(e)))
     
-    # 解析postback data
-    params = {}
-    for param in data.split('&'):
-        if '=' in param:
-            key, value = param.split('=', 1)
-            params[key] = value
+    if cancelled <= 0:
+        return TextMessage(text=get_message('nothing_to_cancel', lang))
     
-    action = params.get('action')
+    type_name = get_message('cancel_type_bus' if cancel_type == 'bus' else 'cancel_type_meal', lang)
+    return back_to_menu_reply(get_message('cancel_success', lang) + f" ({type_name})")
+
+@postback_router.action('bus_booking')
+def postback_bus_booking(ctx: PostbackContext):
+    if not check_time_limit(ctx.shift_type, 'bus'):
+        return TextMessage(text=get_message('time_limit_exceeded', ctx.lang))
+    return create_bus_route_menu(ctx.lang)
+
+@postback_router.action('bus_route', route_id=int, route_code=(str, None))
+def postback_bus_route(ctx: PostbackContext, route_id: int, route_code: str):
+    return create_bus_schedule_menu(route_id, ctx.shift_type, ctx.lang)
+
+@postback_router.action('bus_confirm', schedule_id=int, time=(str, ''))
+def postback_bus_confirm(ctx: PostbackContext, schedule_id: int, time: str):
+    lang = ctx.lang
+    # 選單開啟後才過截止時間也要擋下
+    if not check_time_limit(ctx.shift_type, 'bus'):
+        return TextMessage(text=get_message('time_limit_exceeded', lang))
+    
+    # 儲存預約到資料庫 (覆蓋當天舊預約，額滿則不寫入)
+    today = taipei_today()
+    try:
+        result = storage.reservations.book(ctx.employee_id, schedule_id, today)
+    except Exception as e:
+        return TextMessage(text=get_message('booking_failed', lang, str(e)))
     
-    # 處理不同的action
-    if action == 'main_menu':
-        reply_message = create_main_menu(lang)
-        
-    elif action == 'generate_qr':
-        # 檢查今日是否有訂餐記錄
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        today = date.today()
-        cursor.execute('''
-            SELECT r.name_zh, r.floor, mo.ordered_at
-            FROM meal_orders mo
-            JOIN restaurants r ON mo.restaurant_id = r.id
-            WHERE mo.employee_id = ? AND mo.order_date = ? AND mo.status = 'active'
-        ''', (employee_id, today))
-        
-        meal_record = cursor.fetchone()
-        conn.close()
-        
-        if meal_record:
-            # 生成驗證碼
-            verification_code = generate_meal_verification_code(employee, {
-                'restaurant_name': meal_record[0],
-                'floor': meal_record[1],
-                'ordered_at': str(meal_record[2])
-            })
-            
-            # 生成QR Code圖片URL
-            qr_content = f"員工：{employee['name']}\n編號：{employee['employee_id']}\n餐廳：{meal_record[0]}\n樓層：{meal_record[1]}\n日期：{today}\n驗證碼：{verification_code}"
-            encoded_content = urllib.parse.quote(qr_content)
-            qr_image_url = f"https://api.qrserver.com/v1/create-qr-code/?size=400x400&data={encoded_content}"
-            
-            # 發送文字 + QR Code圖片
-            with ApiClient(configuration) as api_client:
-                line_bot_api = MessagingApi(api_client)
-                line_bot_api.reply_message_with_http_info(
-                    ReplyMessageRequest(
-                        reply_token=event.reply_token,
-                        messages=[
-                            TextMessage(
-                                text=f"{get_message('qr_code_title', lang)}\n\n{get_message('qr_code_desc', lang)}\n\n👤 {employee['name']}\n🍱 {meal_record[0]}\n📍 {meal_record[1]}\n📅 {today}\n\n🔢 驗證碼：{verification_code}\n\n📱 請出示下方QR碼給餐廳人員：",
-                                quick_reply=QuickReply(
-                                    items=[
-                                        QuickReplyItem(
-                                            action=PostbackAction(label="🏠 返回主選單", data="action=main_menu")
-                                        )
-                                    ]
-                                )
-                            ),
-                            ImageMessage(
-                                original_content_url=qr_image_url,
-                                preview_image_url=qr_image_url
-                            )
-                        ]
-                    )
-                )
-            return  # 提早返回，避免重複發送
-        else:
-            reply_message = TextMessage(text=get_message('qr_code_invalid', lang))
-            
-    elif action == 'language_menu':
-        reply_message = create_language_menu(lang)
-        
-    elif action == 'change_language':
-        new_lang = params.get('lang', 'zh')
-        
-        # 更新資料庫中的語言設定
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE employees 
-            SET preferred_language = ? 
-            WHERE id = ?
-        ''', (new_lang, employee_id))
-        conn.commit()
-        conn.close()
-        
-        lang_names = {'zh': '中文', 'en': 'English', 'vi': 'Tiếng Việt'}
-        reply_message = TextMessage(
-            text=get_message('language_changed', new_lang, lang_names[new_lang]),
+    if not result['success']:
+        return TextMessage(
+            text=get_message('bus_unavailable' if result['unavailable'] else 'bus_full', lang),
             quick_reply=QuickReply(
                 items=[
                     QuickReplyItem(
-                        action=PostbackAction(label="🏠 主選單", data="action=main_menu")
-                    )
-                ]
-            )
-        )
-        
-    elif action == 'cancel_booking':
-        reply_message = create_cancel_menu(lang)
-        
-    elif action == 'cancel_confirm':
-        cancel_type = params.get('type')
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            today = date.today()
-            if cancel_type == 'bus':
-                cursor.execute('''
-                    UPDATE bus_reservations 
-                    SET status = 'cancelled' 
-                    WHERE employee_id = ? AND reservation_date = ? AND status = 'active'
-                ''', (employee_id, today))
-            elif cancel_type == 'meal':
-                cursor.execute('''
-                    UPDATE meal_orders 
-                    SET status = 'cancelled' 
-                    WHERE employee_id = ? AND order_date = ? AND status = 'active'
-                ''', (employee_id, today))
-            
-            if cursor.rowcount > 0:
-                conn.commit()
-                type_name = '交通車' if cancel_type == 'bus' else '訂餐'
-                if lang == 'en':
-                    type_name = 'Bus' if cancel_type == 'bus' else 'Meal'
-                elif lang == 'vi':
-                    type_name = 'Xe' if cancel_type == 'bus' else 'Cơm'
-                    
-                reply_message = TextMessage(
-                    text=get_message('cancel_success', lang) + f" ({type_name})",
-                    quick_reply=QuickReply(
-                        items=[
-                            QuickReplyItem(
-                                action=PostbackAction(label="🏠 返回主選單", data="action=main_menu")
-                            )
-                        ]
-                    )
-                )
-            else:
-                reply_message = TextMessage(text=get_message('nothing_to_cancel', lang))
-                
-        except Exception as e:
-            conn.rollback()
-            reply_message = TextMessage(text=get_message('cancel_failed', lang, str(e)))
-        finally:
-            conn.close()
-    
-    elif action == 'bus_booking':
-        if not check_time_limit(shift_type, 'bus'):
-            reply_message = TextMessage(text=get_message('time_limit_exceeded', lang))
-        else:
-            reply_message = create_bus_route_menu(lang)
-        
-    elif action == 'bus_route':
-        route_id = int(params.get('route_id'))
-        reply_message = create_bus_schedule_menu(route_id, shift_type, lang)
-        
-    elif action == 'bus_confirm':
-        schedule_id = int(params.get('schedule_id'))
-        time_str = params.get('time')
-        
-        # 儲存預約到資料庫
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            # 先刪除今天的舊預約 (覆蓋機制)
-            today = datetime.now().date()
-            cursor.execute('''
-                UPDATE bus_reservations 
-                SET status = 'cancelled' 
-                WHERE employee_id = ? AND reservation_date = ? AND status = 'active'
-            ''', (employee_id, today))
-            
-            # 新增預約
-            cursor.execute('''
-                INSERT INTO bus_reservations (employee_id, schedule_id, reservation_date)
-                VALUES (?, ?, ?)
-            ''', (employee_id, schedule_id, today))
-            
-            conn.commit()
-            reply_message = TextMessage(
-                text=f"{get_message('booking_success', lang)}\n\n🚌 班次時間：{time_str}\n📅 日期：{today}",
-                quick_reply=QuickReply(
-                    items=[
-                        QuickReplyItem(
-                            action=PostbackAction(label="🏠 返回主選單", data="action=main_menu")
-                        ),
-                        QuickReplyItem(
-                            action=PostbackAction(label="🚌 再預約", data="action=bus_booking")
-                        )
-                    ]
-                )
-            )
-            
-        except Exception as e:
-            conn.rollback()
-            reply_message = TextMessage(text=get_message('booking_failed', lang, str(e)))
-        finally:
-            conn.close()
-        
-    elif action == 'meal_booking':
-        if not check_time_limit(shift_type, 'meal'):
-            reply_message = TextMessage(text=get_message('time_limit_exceeded', lang))
-        else:
-            reply_message = create_meal_location_menu(lang)
-        
-    elif action == 'meal_confirm':
-        restaurant_ids = params.get('restaurant_ids', '').split(',')
-        floor = params.get('floor')
-        
-        # 簡化處理：選擇第一個餐廳
-        if restaurant_ids and restaurant_ids[0]:
-            restaurant_id = int(restaurant_ids[0])
-            
-            conn = db.get_connection()
-            cursor = conn.cursor()
-            
-            try:
-                # 先刪除今天的舊訂餐 (覆蓋機制)
-                today = datetime.now().date()
-                cursor.execute('''
-                    UPDATE meal_orders 
-                    SET status = 'cancelled' 
-                    WHERE employee_id = ? AND order_date = ? AND status = 'active'
-                ''', (employee_id, today))
-                
-                # 新增訂餐
-                cursor.execute('''
-                    INSERT INTO meal_orders (employee_id, restaurant_id, order_date)
-                    VALUES (?, ?, ?)
-                ''', (employee_id, restaurant_id, today))
-                
-                conn.commit()
-                reply_message = TextMessage(
-                    text=f"{get_message('booking_success', lang)}\n\n🍱 取餐地點：{floor}\n📅 日期：{today}",
-                    quick_reply=QuickReply(
-                        items=[
-                            QuickReplyItem(
-                                action=PostbackAction(label="🏠 返回主選單", data="action=main_menu")
-                            ),
-                            QuickReplyItem(
-                                action=PostbackAction(label="🍱 再訂餐", data="action=meal_booking")
-                            )
-                        ]
-                    )
-                )
-                
-            except Exception as e:
-                conn.rollback()
-                reply_message = TextMessage(text=get_message('booking_failed', lang, str(e)))
-            finally:
-                conn.close()
-        
-    elif action == 'view_booking':
-        # 查看預約記錄
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        today = datetime.now().date()
-        cursor.execute('''
-            SELECT 'bus' as type, br.route_name_zh, bs.departure_time, bs.schedule_name_zh
-            FROM bus_reservations bresv
-            JOIN bus_schedules bs ON bresv.schedule_id = bs.id
-            JOIN bus_routes br ON bs.route_id = br.id
-            WHERE bresv.employee_id = ? AND bresv.reservation_date = ? AND bresv.status = 'active'
-            
-            UNION ALL
-            
-            SELECT 'meal' as type, r.name_zh, r.floor, ''
-            FROM meal_orders mo
-            JOIN restaurants r ON mo.restaurant_id = r.id
-            WHERE mo.employee_id = ? AND mo.order_date = ? AND mo.status = 'active'
-        ''', (employee_id, today, employee_id, today))
-        
-        bookings = cursor.fetchall()
-        conn.close()
-        
-        if bookings:
-            booking_text = f"📋 今日預約記錄 ({today}):\n\n"
-            for booking in bookings:
-                if booking[0] == 'bus':
-                    booking_text += f"🚌 交通車：{booking[1]} {booking[2]} ({booking[3]})\n"
-                else:
-                    booking_text += f"🍱 訂餐：{booking[2]} {booking[1]}\n"
-        else:
-            booking_text = get_message('no_bookings', lang)
-        
-        reply_message = TextMessage(
-            text=booking_text,
-            quick_reply=QuickReply(
-                items=[
+                        action=PostbackAction(label="🚌 選擇其他班次", data="action=bus_booking")
+                    ),
                     QuickReplyItem(
                         action=PostbackAction(label="🏠 返回主選單", data="action=main_menu")
                     )
                 ]
             )
         )
-        
+    
+    return back_to_menu_reply(
+        f"{get_message('booking_success', lang)}\n\n🚌 班次時間：{time}\n📅 日期：{today}\n{get_message('seats_remaining', lang, result['remaining'])}",
+        extra_items=[QuickReplyItem(action=PostbackAction(label="🚌 再預約", data="action=bus_booking"))]
+    )
+
+@postback_router.action('meal_booking')
+def postback_meal_booking(ctx: PostbackContext):
+    if not check_time_limit(ctx.shift_type, 'meal'):
+        return TextMessage(text=get_message('time_limit_exceeded', ctx.lang))
+    return create_meal_location_menu(ctx.lang)
+
+@postback_router.action('meal_confirm', restaurant_ids=str, floor=(str, ''))
+def postback_meal_confirm(ctx: PostbackContext, restaurant_ids: str, floor: str):
+    lang, employee_id = ctx.lang, ctx.employee_id
+    if not check_time_limit(ctx.shift_type, 'meal'):
+        return TextMessage(text=get_message('time_limit_exceeded', lang))
+    
+    # 簡化處理：選擇第一個餐廳
+    first_id = restaurant_ids.split(',')[0]
+    if not first_id.isdigit():
+        return postback_unknown(ctx)
+    restaurant_id = int(first_id)
+    
+    # 儲存訂餐 (覆蓋當天舊訂單)
+    today = taipei_today()
+    try:
+        storage.orders.book(employee_id, restaurant_id, today)
+    except Exception as e:
+        return TextMessage(text=get_message('booking_failed', lang, str(e)))
+    
+    return back_to_menu_reply(
+        f"{get_message('booking_success', lang)}\n\n🍱 取餐地點：{floor}\n📅 日期：{today}",
+        extra_items=[QuickReplyItem(action=PostbackAction(label="🍱 再訂餐", data="action=meal_booking"))]
+    )
+
+@postback_router.action('view_booking')
+def postback_view_booking(ctx: PostbackContext):
+    employee_id = ctx.employee_id
+    
+    # 查看預約記錄
+    today = taipei_today()
+    bus = storage.reservations.for_day(employee_id, today)
+    meal = storage.orders.for_day(employee_id, today)
+    
+    if bus or meal:
+        booking_text = f"📋 今日預約記錄 ({today}):\n\n"
+        if bus:
+            booking_text += f"🚌 交通車：{bus[0]} {bus[1]} ({bus[2]})\n"
+        if meal:
+            booking_text += f"🍱 訂餐：{meal[1]} {meal[0]}\n"
     else:
-        reply_message = TextMessage(text="系統錯誤，請重新開始")
-    
-    # 送出回覆
-    with ApiClient(configuration) as api_client:
-        line_bot_api = MessagingApi(api_client)
-        line_bot_api.reply_message_with_http_info(
-            ReplyMessageRequest(
-                reply_token=event.reply_token,
-                messages=[reply_message]
+        booking_text = get_message('no_bookings', ctx.lang)
+    
+    return back_to_menu_reply(booking_text)
+
+def postback_reply(event) -> list:
+    """postback 要回覆的訊息 (同步與 asyncio 路徑共用，送出由呼叫端負責)"""
+    line_user_id = event.source.user_id
+    
+    # 檢查使用者是否已綁定
+    employee = storage.employees.get(line_user_id)
+    if not employee:
+        return [TextMessage(text=get_message('bind_required'))]
+    return postback_router.dispatch(PostbackContext(event, employee), event.postback.data)
+
+@EVENT_SECONDS.labels('postback').time()
+def handle_postback(event):
+    send_reply(event, postback_reply(event))
+
+def event_kind(event) -> Optional[str]:
+    """會回覆的事件類型：'message'、'postback'，其他事件回傳 None"""
+    if isinstance(event, MessageEvent) and isinstance(event.message, TextMessageContent):
+        return 'message'
+    if isinstance(event, PostbackEvent):
+        return 'postback'
+    return None
+
+# 各事件類型產生回覆訊息的函式
+REPLY_BUILDERS = {'message': message_reply, 'postback': postback_reply}
+
+def dispatch_event(event):
+    """依事件類型呼叫對應的處理函式 (其他事件類型忽略)"""
+    kind = event_kind(event)
+    with log_context(event_id=getattr(event, 'webhook_event_id', None)):
+        if kind == 'message':
+            handle_message(event)
+        elif kind == 'postback':
+            handle_postback(event)
+
+# 非同步模式：WEBHOOK_ASYNC=1 時由背景 worker 處理事件 (於 startup() 建立)
+event_dispatcher = None
+# 背景預先載入 LINE SDK 的執行緒 (LINE_SDK_PRELOAD=0 時不載入)
+sdk_warm_up = None
+
+_startup_lock = threading.Lock()
+_started = False
+
+def prepare_database() -> List[int]:
+    """檢查並升級資料庫結構，建立或升級時匯入測試員工 (SEED_EMPLOYEES=1 可強制匯入)
+    
+    資料庫結構已是最新版本時不執行任何 DDL。多 worker 部署時由主程序在 fork 前先執行一次
+    (見 gunicorn.conf.py)，worker 啟動時就只剩版本檢查。
+    """
+    # SQLite 後端時 storage 與 db 是同一個資料庫；PostgreSQL 後端時建立或升級 PostgreSQL 的資料表
+    # (既有資料以 repository_pg.py --from-sqlite 搬入)，本機 SQLite 只留事件去重的 webhook_events
+    applied = storage.init_schema()
+    if storage.backend != 'sqlite':
+        event_dedup.init_table()
+    if applied or os.getenv('SEED_EMPLOYEES', '0') == '1':
+        auto_add_employees()
+    return applied
+
+def startup():
+    """啟動階段：設定日誌、檢查資料庫結構、匯入測試員工、啟動 worker，並在背景預先載入 LINE SDK
+    
+    每個程序只會執行一次；多 worker 部署時在各 worker 程序內執行 (wsgi.py)，
+    連線與背景執行緒不會跨 fork 共用。
+    """
+    global event_dispatcher, sdk_warm_up, _started
+    with _startup_lock:
+        if _started:
+            return
+        
+        # 日誌由背景執行緒輸出成 JSON (LOG_FORMAT、LOG_LEVEL，見 logs.py)；import app 時不啟動執行緒
+        configure_logging()
+        prepare_database()
+        
+        if os.getenv('WEBHOOK_ASYNC', '0') == '1':
+            event_dispatcher = EventDispatcher(
+                dispatch_event,
+                workers=int(os.getenv('WEBHOOK_WORKERS', '4')),
+                queue_size=int(os.getenv('WEBHOOK_QUEUE_SIZE', '1000')),
+                enqueue_timeout=float(os.getenv('WEBHOOK_ENQUEUE_TIMEOUT', '0')),
+                release_event=event_dedup.release_event
             )
-        )
+            event_dispatcher.start()
+        
+        if os.getenv('LINE_SDK_PRELOAD', '1') == '1':
+            sdk_warm_up = warm_up('linebot.v3', 'linebot.v3.webhooks', 'linebot.v3.messaging',
+                                  then=static_messages.prebuild)
+        _started = True
+
+def shutdown():
+    """worker 結束前：處理完佇列中的事件並關閉連線"""
+    if event_dispatcher is not None:
+        event_dispatcher.stop()
+    line_api.close()
+    storage.close()
+    db.pool.close_all()
+
+@app.before_request
+def ensure_started():
+    """未經 startup() 啟動時 (例如 flask run)，第一個請求前補做"""
+    if not _started:
+        startup()
 
+# 開發用的單一程序伺服器；正式環境請用 gunicorn -c gunicorn.conf.py wsgi:app (見 Procfile)
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
-    print("LINE Bot 伺服器啟動中...")
+    logger.info("LINE Bot 伺服器啟動中...")
+    startup()
     app.run(host="0.0.0.0", port=port, debug=False)
\ No newline at end of file
@@ -0,0 +1,264 @@
+"""歷史預約/訂餐封存
+
+覆蓋與取消會留下大量 cancelled 紀錄，主資料庫只保留最近 keep_months 個月 (含本月)，
+更早的月份搬到每月一個的封存檔 (archive/linebot_archive_YYYY-MM.db)，需要時才 ATTACH。
+
+- 逐日搬移，每天一個交易：先 INSERT OR REPLACE 到封存檔，再刪除主資料庫中「封存檔已有」的紀錄。
+  中途停止後重新執行會從剩下的日期繼續，重複執行也不會產生重複資料
+- 搬完的月份記錄在 archived_months，報表以 history() 附加涵蓋期間的封存檔，
+  透過 all_bus_reservations 等暫存檢視表把主資料庫與封存檔 UNION ALL 起來查詢
+- 只支援 SQLite 後端：DATABASE_URL 指向 PostgreSQL 時預約資料不在本機資料庫，命令列直接拒絕執行
+
+命令列：python archive.py run [--keep-months 3]
+      python archive.py report --from 2024-01-01 --to 2024-06-30
+"""
+import os
+import re
+import sqlite3
+import logging
+import argparse
+from contextlib import contextmanager
+from datetime import date
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from database import DatabaseManager
+from settings import taipei_today
+
+logger = logging.getLogger(__name__)
+
+KEEP_MONTHS = 3
+ARCHIVE_ALIAS = 'archive'
+
+# (資料表, 日期欄位)
+ARCHIVE_TABLES: List[Tuple[str, str]] = [
+    ('bus_reservations', 'reservation_date'),
+    ('meal_orders', 'order_date'),
+    ('bus_seat_counters', 'reservation_date'),
+    ('meal_counts', 'order_date'),
+    ('reminder_deliveries', 'reservation_date'),
+]
+
+
+def add_months(day: date, months: int) -> date:
+    """day 所在月份往後 (負數往前) months 個月的第一天"""
+    years, month = divmod(day.month - 1 + months, 12)
+    return date(day.year + years, month + 1, 1)
+
+
+def archive_cutoff(today: date, keep_months: int = KEEP_MONTHS) -> date:
+    """保留期間的第一天，早於此日的月份可以封存"""
+    return add_months(today, -(max(keep_months, 1) - 1))
+
+
+def archive_dir_for(db: DatabaseManager) -> str:
+    """封存檔目錄：ARCHIVE_DIR 或資料庫旁的 archive/"""
+    return os.getenv('ARCHIVE_DIR') or os.path.join(os.path.dirname(os.path.abspath(db.db_path)), 'archive')
+
+
+def archive_file_name(month: str) -> str:
+    return f'linebot_archive_{month}.db'
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    # ATTACH 會改變連線狀態，封存與報表都使用自己的連線，不向連線池借用
+    conn = sqlite3.connect(path, timeout=5)
+    conn.execute('PRAGMA busy_timeout=5000')
+    return conn
+
+
+def _columns(conn, schema: str, table: str) -> List[Tuple[str, str]]:
+    """(欄位名稱, 型別)"""
+    return [(row[1], row[2]) for row in conn.execute(f'PRAGMA {schema}.table_info({table})')]
+
+
+def _primary_key(conn, table: str) -> List[str]:
+    rows = conn.execute(f'PRAGMA main.table_info({table})').fetchall()
+    return [row[1] for row in sorted(rows, key=lambda r: r[5]) if row[5]]
+
+
+def _ensure_archive_tables(conn):
+    """在封存檔建立與主資料庫相同結構的資料表；主資料庫之後新增的欄位也補上"""
+    for table, column in ARCHIVE_TABLES:
+        sql = conn.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?",
+                           (table,)).fetchone()[0]
+        conn.execute(re.sub(r'^CREATE TABLE\s+(IF NOT EXISTS\s+)?"?\w+"?',
+                            f'CREATE TABLE IF NOT EXISTS {ARCHIVE_ALIAS}.{table}', sql.strip(), count=1))
+        archived = {name for name, _ in _columns(conn, ARCHIVE_ALIAS, table)}
+        for name, type_ in _columns(conn, 'main', table):
+            if name not in archived:
+                conn.execute(f'ALTER TABLE {ARCHIVE_ALIAS}.{table} ADD COLUMN {name} {type_}')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {ARCHIVE_ALIAS}.idx_{table}_archive_date ON {table} ({column})')
+    conn.commit()
+
+
+def _move_day(conn, table: str, column: str, day: str) -> int:
+    """搬移單一資料表某一天的紀錄 (一個交易)，回傳刪除筆數"""
+    columns = ', '.join(name for name, _ in _columns(conn, 'main', table))
+    keys = ', '.join(_primary_key(conn, table))
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute(f'''
+            INSERT OR REPLACE INTO {ARCHIVE_ALIAS}.{table} ({columns})
+            SELECT {columns} FROM main.{table} WHERE {column} = ?
+        ''', (day,))
+        # 只刪除確定已在封存檔中的紀錄
+        cursor.execute(f'''
+            DELETE FROM main.{table}
+            WHERE {column} = ? AND ({keys}) IN (SELECT {keys} FROM {ARCHIVE_ALIAS}.{table} WHERE {column} = ?)
+        ''', (day, day))
+        moved = cursor.rowcount
+        conn.commit()
+        return moved
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def archive_month(conn, month: str, archive_dir: str) -> int:
+    """把某個月 (YYYY-MM) 搬到封存檔，回傳搬移筆數"""
+    start = date.fromisoformat(f'{month}-01')
+    end = add_months(start, 1)
+    file_name = archive_file_name(month)
+    os.makedirs(archive_dir, exist_ok=True)
+
+    conn.execute(f'ATTACH DATABASE ? AS {ARCHIVE_ALIAS}', (os.path.join(archive_dir, file_name),))
+    try:
+        _ensure_archive_tables(conn)
+        moved = 0
+        for table, column in ARCHIVE_TABLES:
+            days = [row[0] for row in conn.execute(f'''
+                SELECT DISTINCT {column} FROM main.{table} WHERE {column} >= ? AND {column} < ? ORDER BY 1
+            ''', (start.isoformat(), end.isoformat()))]
+            for day in days:
+                moved += _move_day(conn, table, column, day)
+
+        conn.execute('''
+            INSERT INTO archived_months (month, archive_file, rows_moved) VALUES (?, ?, ?)
+            ON CONFLICT (month) DO UPDATE SET
+                archive_file = excluded.archive_file,
+                rows_moved = rows_moved + excluded.rows_moved,
+                archived_at = CURRENT_TIMESTAMP
+        ''', (month, file_name, moved))
+        conn.commit()
+        return moved
+    finally:
+        conn.execute(f'DETACH DATABASE {ARCHIVE_ALIAS}')
+
+
+def pending_months(conn, cutoff: date) -> List[str]:
+    """主資料庫中早於 cutoff、還有資料的月份 (由舊到新)"""
+    months = set()
+    for table, column in ARCHIVE_TABLES:
+        months.update(row[0] for row in conn.execute(f'''
+            SELECT DISTINCT substr({column}, 1, 7) FROM main.{table} WHERE {column} < ?
+        ''', (cutoff.isoformat(),)))
+    return sorted(months)
+
+
+def archive_closed_months(db: DatabaseManager, keep_months: int = KEEP_MONTHS, today: Optional[date] = None,
+                          archive_dir: Optional[str] = None) -> Dict[str, int]:
+    """封存保留期間以前的所有月份，回傳 {月份: 搬移筆數}"""
+    cutoff = archive_cutoff(today or taipei_today(), keep_months)
+    archive_dir = archive_dir or archive_dir_for(db)
+    conn = _connect(db.db_path)
+    try:
+        return {month: archive_month(conn, month, archive_dir) for month in pending_months(conn, cutoff)}
+    finally:
+        conn.close()
+
+
+@contextmanager
+def history(db: DatabaseManager, start: Optional[date] = None, end: Optional[date] = None,
+            archive_dir: Optional[str] = None) -> Iterator[sqlite3.Connection]:
+    """附加 start~end 期間的封存檔，提供 all_<資料表> 檢視表 (主資料庫 + 封存檔)"""
+    archive_dir = archive_dir or archive_dir_for(db)
+    conn = _connect(db.db_path)
+    try:
+        months = [(month, file_name) for month, file_name in conn.execute(
+            'SELECT month, archive_file FROM archived_months ORDER BY month')
+            if (start is None or month >= start.strftime('%Y-%m')) and (end is None or month <= end.strftime('%Y-%m'))]
+        limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+        if len(months) > limit:
+            raise ValueError(f'查詢期間涵蓋 {len(months)} 個封存檔，超過可同時附加的上限 {limit}，請縮短期間')
+
+        aliases = []
+        for month, file_name in months:
+            path = os.path.join(archive_dir, file_name)
+            if not os.path.exists(path):
+                logger.warning("⚠️ 找不到 %s 的封存檔: %s", month, path)
+                continue
+            alias = f'archive_{month.replace("-", "_")}'
+            conn.execute(f'ATTACH DATABASE ? AS {alias}', (path,))
+            aliases.append(alias)
+
+        for table, _ in ARCHIVE_TABLES:
+            columns = [name for name, _ in _columns(conn, 'main', table)]
+            selects = [f'SELECT {", ".join(columns)} FROM main.{table}']
+            for alias in aliases:
+                archived = {name for name, _ in _columns(conn, alias, table)}
+                if archived:
+                    selects.append(f'SELECT {", ".join(c if c in archived else f"NULL AS {c}" for c in columns)} '
+                                   f'FROM {alias}.{table}')
+            conn.execute(f'CREATE TEMP VIEW all_{table} AS ' + ' UNION ALL '.join(selects))
+        yield conn
+    finally:
+        conn.close()
+
+
+def daily_summary(conn, start: date, end: date) -> List[Dict]:
+    """每日交通車預約與訂餐數 (有效/取消)；conn 來自 history()"""
+    rows = conn.execute('''
+        SELECT day, SUM(bus_active), SUM(bus_cancelled), SUM(meal_active), SUM(meal_cancelled) FROM (
+            SELECT reservation_date AS day, status = 'active' AS bus_active, status = 'cancelled' AS bus_cancelled,
+                   0 AS meal_active, 0 AS meal_cancelled
+            FROM all_bus_reservations WHERE reservation_date BETWEEN ? AND ?
+            UNION ALL
+            SELECT order_date, 0, 0, status = 'active', status = 'cancelled'
+            FROM all_meal_orders WHERE order_date BETWEEN ? AND ?
+        )
+        GROUP BY day ORDER BY day
+    ''', (start.isoformat(), end.isoformat(), start.isoformat(), end.isoformat())).fetchall()
+    return [{
+        'date': row[0],
+        'bus_active': row[1],
+        'bus_cancelled': row[2],
+        'meal_active': row[3],
+        'meal_cancelled': row[4],
+    } for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='歷史預約/訂餐封存')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run = subparsers.add_parser('run', help='封存保留期間以前的月份')
+    run.add_argument('--keep-months', type=int, default=KEEP_MONTHS, help='主資料庫保留幾個月 (含本月)')
+    report = subparsers.add_parser('report', help='每日預約/訂餐數 (含封存資料)')
+    report.add_argument('--from', dest='start', type=date.fromisoformat, required=True)
+    report.add_argument('--to', dest='end', type=date.fromisoformat, required=True)
+    for sub in (run, report):
+        sub.add_argument('--archive-dir', help='封存檔目錄 (預設 ARCHIVE_DIR 或資料庫旁的 archive/)')
+    args = parser.parse_args()
+    if os.getenv('DATABASE_URL'):
+        parser.error('封存只支援 SQLite 後端，DATABASE_URL 指定其他資料庫時無法使用')
+
+    from logs import configure_logging
+    configure_logging(fmt='text')
+    db = DatabaseManager()
+    try:
+        if args.command == 'run':
+            moved = archive_closed_months(db, args.keep_months, archive_dir=args.archive_dir)
+            for month, rows in moved.items():
+                print(f"📦 {month}: 搬移 {rows} 筆")
+            print(f"✅ 封存完成 ({len(moved)} 個月)" if moved else "✅ 沒有需要封存的月份")
+        else:
+            with history(db, args.start, args.end, args.archive_dir) as conn:
+                print('date,bus_active,bus_cancelled,meal_active,meal_cancelled')
+                for row in daily_summary(conn, args.start, args.end):
+                    print(','.join(str(value) for value in row.values()))
+    finally:
+        db.pool.close_all()
+
+
+if __name__ == "__main__":
+    main()
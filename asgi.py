@@ -0,0 +1,241 @@
+"""ASGI 進入點：/callback 以 asyncio 處理，等待 LINE reply API 時不佔用執行緒
+
+    uvicorn asgi:app --host 0.0.0.0 --port $PORT
+    多程序：gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi:app
+
+- 簽章驗證與事件解析在事件迴圈中執行 (只有 CPU 運算)
+- 去重登記與產生回覆 (查詢、寫入資料庫) 交給有上限的執行緒池 (ASGI_DB_THREADS，預設與連線池同大小)，
+  與 Flask 版共用 message_reply / postback_reply，回覆內容完全相同
+- 回覆透過事件迴圈內共用的 AsyncMessagingApi 送出，同時處理中的事件上限為 ASGI_MAX_IN_FLIGHT
+- 其他路徑 (/stats、/metrics、/qr、/manifest ...) 轉給 Flask app，在同一個執行緒池中執行
+"""
+import io
+import os
+import sys
+import time
+import asyncio
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import app as bot
+from line_client import AsyncLineApiHolder
+from logs import WebhookBody, log_context, new_request_id, should_log_webhook
+from metrics import GaugeFunc
+
+
+def wsgi_environ(scope: Dict, body: bytes) -> Dict:
+    """由 ASGI HTTP scope 建立 WSGI environ"""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        name, value = name.decode('latin-1'), value.decode('latin-1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+async def read_body(receive: Callable) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def send_text(send: Callable, status: int, text: str):
+    body = text.encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'text/plain; charset=utf-8'),
+                            (b'content-length', str(len(body)).encode('ascii'))]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class WebhookApp:
+    """ASGI 應用程式：/callback 走 asyncio，其餘請求交給 Flask"""
+
+    def __init__(self, flask_app, db_threads: int = 8, max_in_flight: int = 500,
+                 line_api: Optional[AsyncLineApiHolder] = None):
+        self.flask_app = flask_app
+        self.executor = ThreadPoolExecutor(max_workers=db_threads, thread_name_prefix='asgi-db')
+        self.max_in_flight = max_in_flight
+        self.line_api = line_api or AsyncLineApiHolder()
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self.in_flight = 0
+
+    async def __call__(self, scope: Dict, receive: Callable, send: Callable):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            if not bot._started:
+                # 伺服器沒有送 lifespan 事件時，第一個請求前補做
+                await self.run_sync(bot.startup)
+            if scope['path'] == '/callback' and scope['method'] == 'POST':
+                await self._callback(scope, receive, send)
+            else:
+                await self._wsgi(scope, receive, send)
+
+    async def run_sync(self, fn: Callable, *args):
+        """在資料庫執行緒池中執行同步函式 (帶著目前的 log_context)"""
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        return await loop.run_in_executor(self.executor, functools.partial(ctx.run, fn, *args))
+
+    async def _lifespan(self, receive: Callable, send: Callable):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.run_sync(bot.startup)
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def close(self):
+        """關閉 aiohttp 連線池、Flask 端的資源與執行緒池"""
+        await self.line_api.close()
+        await self.run_sync(bot.shutdown)
+        self.executor.shutdown(wait=False)
+
+    async def _callback(self, scope: Dict, receive: Callable, send: Callable):
+        start = time.perf_counter()
+        try:
+            status, text = await self.handle_webhook(scope, await read_body(receive))
+        finally:
+            bot.WEBHOOK_SECONDS.observe(time.perf_counter() - start)
+        bot.WEBHOOK_REQUESTS.labels(status).inc()
+        await send_text(send, status, text)
+
+    async def handle_webhook(self, scope: Dict, body: bytes) -> Tuple[int, str]:
+        """處理一次 webhook 請求，回傳 (HTTP 狀態, 內容)；行為與 Flask 版 callback() 相同"""
+        headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope.get('headers', [])}
+        with log_context(request_id=headers.get('x-request-id', '')[:64] or new_request_id()):
+            try:
+                text = body.decode('utf-8')
+            except UnicodeDecodeError:
+                bot.logger.warning("Webhook body is not valid UTF-8.")
+                return 400, 'Bad Request'
+            return await self._handle_webhook(headers, text)
+
+    async def _handle_webhook(self, headers: Dict[str, str], body: str) -> Tuple[int, str]:
+        signature = headers.get('x-line-signature')
+        if signature is None:
+            return 400, 'Bad Request'
+        if should_log_webhook():
+            bot.logger.info("webhook received", extra={'webhook': WebhookBody(body)})
+
+        try:
+            events = bot.webhook_parser().parse(body, signature)
+        except bot.InvalidSignatureError.resolve():
+            bot.logger.warning("Invalid signature. Please check your channel access token/channel secret.")
+            return 400, 'Bad Request'
+
+        # LINE 重送的事件 (webhookEventId 相同) 已處理過就略過
+        events = await self.run_sync(lambda: [event for event in events if bot.event_dedup.claim_event(event)])
+
+        for index, event in enumerate(events):
+            try:
+                await self.handle_event(event)
+            except Exception:
+                bot.logger.exception("Failed to handle webhook event")
+                # 回應 500 讓 LINE 重送，尚未處理完的事件重送時要能再處理
+                pending = events[index:]
+                await self.run_sync(lambda: [bot.event_dedup.release_event(e) for e in pending])
+                return 500, 'Internal Server Error'
+        return 200, 'OK'
+
+    async def handle_event(self, event):
+        """在執行緒池中產生回覆，再以 AsyncMessagingApi 送出 (不處理的事件類型略過)"""
+        kind = bot.event_kind(event)
+        if kind is None:
+            return
+        async with self._slots:
+            self.in_flight += 1
+            try:
+                with bot.EVENT_SECONDS.labels(kind).time(), log_context(event_id=getattr(event, 'webhook_event_id', None)):
+                    messages = await self.run_sync(bot.REPLY_BUILDERS[kind], event)
+                    if messages:
+                        await self.line_api.reply(event.reply_token, messages)
+            finally:
+                self.in_flight -= 1
+
+    async def _wsgi(self, scope: Dict, receive: Callable, send: Callable):
+        """在執行緒池中執行 Flask app，回應內容逐段送出 (串流回應不會整份放進記憶體)"""
+        environ = wsgi_environ(scope, await read_body(receive))
+        loop = asyncio.get_running_loop()
+        chunks: asyncio.Queue = asyncio.Queue(maxsize=8)
+        response: Dict = {}
+
+        def start_response(status: str, headers: List[Tuple[str, str]], exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                   for name, value in headers]
+
+        def put(chunk):
+            asyncio.run_coroutine_threadsafe(chunks.put(chunk), loop).result()
+
+        def produce():
+            result = None
+            try:
+                result = self.flask_app(environ, start_response)
+                for chunk in result:
+                    if chunk:
+                        put(chunk)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+                put(None)
+
+        producer = loop.run_in_executor(self.executor, produce)
+        chunk = b''
+        try:
+            chunk = await chunks.get()
+            await send({'type': 'http.response.start', 'status': response.get('status', 500),
+                        'headers': response.get('headers', [])})
+            while chunk is not None:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await chunks.get()
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            # 用戶端中途斷線時仍要讓 produce() 跑完，才不會卡住執行緒
+            while chunk is not None:
+                chunk = await chunks.get()
+            await producer
+
+
+app = WebhookApp(
+    bot.app,
+    db_threads=int(os.getenv('ASGI_DB_THREADS') or os.getenv('DB_POOL_SIZE', '8')),
+    max_in_flight=int(os.getenv('ASGI_MAX_IN_FLIGHT', '500'))
+)
+
+GaugeFunc('linebot_asgi_events_in_flight', 'asyncio 路徑中正在處理的事件數', lambda: app.in_flight)
@@ -0,0 +1,81 @@
+"""比較「每次查詢都重新連線」與「連線池」的每秒事件處理量
+
+模擬一次 postback 事件的資料庫存取：查員工、查路線選單、寫入交通車預約。
+
+執行：python benchmarks/bench_db_pool.py [秒數]
+"""
+import sys
+import sqlite3
+from datetime import date
+
+from common import make_seeded_db, line_user_id, run_for
+
+EMPLOYEES = 1000
+
+EMPLOYEE_SQL = '''
+    SELECT e.id, e.employee_id, e.name, e.shift_type, e.preferred_language,
+           d.dept_name_zh, d.dept_name_en, d.dept_name_vi
+    FROM employees e
+    JOIN line_users lu ON e.id = lu.employee_id
+    LEFT JOIN departments d ON e.department_id = d.id
+    WHERE lu.line_user_id = ? AND lu.is_bound = TRUE
+'''
+ROUTES_SQL = 'SELECT id, route_code, route_name_zh, route_name_en, route_name_vi FROM bus_routes WHERE is_active = TRUE'
+CANCEL_SQL = '''
+    UPDATE bus_reservations SET status = 'cancelled'
+    WHERE employee_id = ? AND reservation_date = ? AND status = 'active'
+'''
+INSERT_SQL = 'INSERT INTO bus_reservations (employee_id, schedule_id, reservation_date) VALUES (?, ?, ?)'
+
+
+def event_with_fresh_connections(db_path: str, i: int):
+    """舊做法：每段查詢各自開關一次連線"""
+    conn = sqlite3.connect(db_path, detect_types=sqlite3.PARSE_DECLTYPES)
+    employee = conn.execute(EMPLOYEE_SQL, (line_user_id(i % EMPLOYEES),)).fetchone()
+    conn.close()
+    
+    conn = sqlite3.connect(db_path, detect_types=sqlite3.PARSE_DECLTYPES)
+    conn.execute(ROUTES_SQL).fetchall()
+    conn.close()
+    
+    conn = sqlite3.connect(db_path, detect_types=sqlite3.PARSE_DECLTYPES)
+    conn.execute(CANCEL_SQL, (employee[0], date.today()))
+    conn.execute(INSERT_SQL, (employee[0], 1, date.today()))
+    conn.commit()
+    conn.close()
+
+
+def event_with_pool(db, i: int):
+    """新做法：從連線池借出連線"""
+    with db.connection() as conn:
+        employee = conn.execute(EMPLOYEE_SQL, (line_user_id(i % EMPLOYEES),)).fetchone()
+    
+    with db.connection() as conn:
+        conn.execute(ROUTES_SQL).fetchall()
+    
+    with db.connection() as conn:
+        conn.execute(CANCEL_SQL, (employee[0], date.today()))
+        conn.execute(INSERT_SQL, (employee[0], 1, date.today()))
+        conn.commit()
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3.0
+    
+    before_db = make_seeded_db(EMPLOYEES)
+    # 舊做法使用預設的 rollback journal，與改版前相同
+    with before_db.connection() as conn:
+        conn.execute('PRAGMA journal_mode=DELETE')
+    before_db.pool.close_all()
+    before = run_for(lambda i: event_with_fresh_connections(before_db.db_path, i), seconds)
+    
+    after_db = make_seeded_db(EMPLOYEES)
+    after = run_for(lambda i: event_with_pool(after_db, i), seconds)
+    
+    print(f"每次重新連線: {before:8.1f} events/sec")
+    print(f"連線池      : {after:8.1f} events/sec")
+    print(f"提升倍數    : {after / before:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
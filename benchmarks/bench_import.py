@@ -0,0 +1,64 @@
+"""員工批次匯入的每秒筆數
+
+產生 N 筆 (預設 100,000) 的人資匯出 CSV，依序量測：
+首次匯入 (全部新增)、原檔重新匯入 (全部未變動)、約 10% 資料異動並以完整名冊停用缺席者。
+
+執行：python benchmarks/bench_import.py [筆數] [每批筆數]
+"""
+import os
+import sys
+import csv
+import time
+import tempfile
+
+from common import make_seeded_db
+from import_employees import CHUNK_SIZE, import_employees, read_rows
+from repository import SQLiteStorage
+
+DEPARTMENTS = ('IT', 'HR', 'PROD', 'QC', 'ADMIN')
+
+
+def write_roster(path: str, count: int, changed_every: int = 0, skip_every: int = 0):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['employee_id', 'name', 'dept_code', 'shift_type', 'preferred_language'])
+        for i in range(count):
+            if skip_every and i % skip_every == 0:
+                continue
+            shift = 'night' if i % 4 == 0 else 'day'
+            if changed_every and i % changed_every == 1:
+                shift = 'day' if shift == 'night' else 'night'
+            writer.writerow([f'IGA1-{i:05d}', f'員工{i}', DEPARTMENTS[i % len(DEPARTMENTS)], shift,
+                             ('zh', 'en', 'vi')[i % 3]])
+
+
+def run(storage, label: str, path: str, rows: int, chunk_size: int, **kwargs):
+    start = time.perf_counter()
+    result = import_employees(storage, read_rows(path), chunk_size=chunk_size, **kwargs)
+    elapsed = time.perf_counter() - start
+    print(f"{label}: {rows / elapsed:10.0f} rows/sec  ({elapsed:.2f}s)  "
+          f"新增 {result['inserted']} 更新 {result['updated']} 未變動 {result['unchanged']} "
+          f"停用 {result['deactivated']} 錯誤 {result['rejected']}")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else CHUNK_SIZE
+    count = min(count, 100_000)  # IGA1-xxxxx 最多 100,000 個編號
+    
+    workdir = tempfile.mkdtemp(prefix='linebot_import_')
+    db = make_seeded_db(0, os.path.join(workdir, 'bench.db'))
+    storage = SQLiteStorage(db)
+    
+    roster = os.path.join(workdir, 'roster.csv')
+    write_roster(roster, count)
+    run(storage, '首次匯入    ', roster, count, chunk_size)
+    run(storage, '重新匯入    ', roster, count, chunk_size)
+    
+    changed = os.path.join(workdir, 'changed.csv')
+    write_roster(changed, count, changed_every=10, skip_every=50)
+    run(storage, '異動+停用   ', changed, count, chunk_size, deactivate_missing=True)
+
+
+if __name__ == "__main__":
+    main()
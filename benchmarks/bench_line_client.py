@@ -0,0 +1,59 @@
+"""比較「每次回覆建立新 ApiClient」與「共用連線池」的回覆延遲
+
+對本機 LINE API 模擬伺服器送出回覆，統計平均與 p95 延遲。
+模擬伺服器走 HTTP，實際環境的 TLS 握手成本會讓差距更大。
+
+執行：python benchmarks/bench_line_client.py [次數] [模擬延遲毫秒]
+"""
+import sys
+import time
+import statistics
+
+import common  # noqa: F401  (設定 import 路徑)
+from linebot.v3.messaging import ApiClient, MessagingApi, ReplyMessageRequest, TextMessage
+
+from line_client import LineApiHolder, make_configuration
+from stub_line_server import StubLineServer
+
+
+def measure(send, count: int):
+    """送出 count 次回覆，回傳每次的延遲 (毫秒)"""
+    latencies = []
+    for i in range(count):
+        start = time.perf_counter()
+        send(f'token-{i}')
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def report(name: str, latencies):
+    p95 = statistics.quantiles(latencies, n=100)[94]
+    print(f"{name}: 平均 {statistics.mean(latencies):6.2f}ms  p95 {p95:6.2f}ms")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    latency_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 0
+    messages = [TextMessage(text='✅ 預約成功！')]
+    
+    with StubLineServer(latency_ms=latency_ms, keep_requests=False) as stub:
+        configuration = make_configuration('bench-token', host=stub.url)
+        
+        def per_event(token):
+            with ApiClient(configuration) as api_client:
+                MessagingApi(api_client).reply_message_with_http_info(
+                    ReplyMessageRequest(reply_token=token, messages=messages)
+                )
+        
+        report('每次建立 ApiClient', measure(per_event, count))
+        print(f"  TCP 連線數: {stub.connections}")
+        
+        stub.reset()
+        holder = LineApiHolder(configuration)
+        report('共用 LineApiHolder', measure(lambda token: holder.reply(token, messages), count))
+        print(f"  TCP 連線數: {stub.connections}")
+        holder.close()
+
+
+if __name__ == "__main__":
+    main()
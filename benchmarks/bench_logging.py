@@ -0,0 +1,158 @@
+"""日誌成本：每個 webhook 事件在請求執行緒上花多少時間記錄
+
+- 改版前：app.logger.info("Request body: " + body)，在請求執行緒格式化並寫出原文
+- 同步 JSON：相同的 JSON 格式與 webhook 摘要，但在請求執行緒寫出 (不經佇列)
+- 佇列 + 摘要：logs.py 的作法，請求執行緒只把紀錄放進佇列，摘要與 JSON 由背景執行緒產生
+- 取樣 0：LOG_WEBHOOK_SAMPLE=0，只剩判斷是否取樣
+- 慢速輸出：每次寫出要 1 ms (stderr 管線被塞住)，比較同步寫出與佇列 (佇列滿時丟棄)
+
+輸出到 /dev/null。佇列的成本分開量測：先在背景執行緒暫停時放滿一個佇列 (請求執行緒的成本)，
+再啟動背景執行緒寫完 (背景成本)，重複到指定秒數。慢速輸出的佇列項目則讓背景執行緒同時執行，
+請求持續送入，列出丟棄的紀錄數。
+執行：python benchmarks/bench_logging.py [秒數]
+"""
+import os
+import sys
+import json
+import time
+import queue
+import logging
+import functools
+
+from common import line_user_id, run_for
+
+from logs import (LOG_DROPPED, ContextFilter, JsonFormatter, LogListener, NonBlockingQueueHandler, WebhookBody,
+                  log_context, should_log_webhook)
+
+BODY = json.dumps({
+    'destination': 'U' + 'f' * 32,
+    'events': [{
+        'type': 'message', 'mode': 'active', 'timestamp': 1700000000000,
+        'webhookEventId': '01HBENCH00000000000000000', 'deliveryContext': {'isRedelivery': False},
+        'replyToken': 'b' * 32, 'source': {'type': 'user', 'userId': line_user_id(1)},
+        'message': {'type': 'text', 'id': '468789577898262530', 'quoteToken': 'q' * 80, 'text': 'IGA1-00001'},
+    }]
+})
+
+
+class SlowStream:
+    """每次寫出都要等待的輸出 (模擬讀取端跟不上的 stderr 管線)"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def write(self, text: str):
+        time.sleep(self.delay)
+
+    def flush(self):
+        pass
+
+
+def make_logger(name: str, handler: logging.Handler) -> logging.Logger:
+    logger = logging.getLogger(f'bench_logging.{name}')
+    logger.propagate = False
+    logger.handlers = [handler]
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+def sync_handler(stream, formatter: logging.Formatter) -> logging.Handler:
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(formatter)
+    handler.addFilter(ContextFilter())
+    return handler
+
+
+def legacy(logger: logging.Logger):
+    def log(i):
+        logger.info("Request body: " + BODY)
+    return log
+
+
+def summarized(logger: logging.Logger, rate: float = 1.0):
+    def log(i):
+        if should_log_webhook(rate):
+            logger.info("webhook received", extra={'webhook': WebhookBody(BODY)})
+    return log
+
+
+def json_output(stream) -> logging.Handler:
+    output = logging.StreamHandler(stream)
+    output.setFormatter(JsonFormatter())
+    return output
+
+
+def measure_sync(name: str, stream, formatter: logging.Formatter, make_log, seconds: float) -> str:
+    rate = run_for(make_log(make_logger(name, sync_handler(stream, formatter))), seconds)
+    return f"{1e6 / rate:>12.1f}{'-':>12}{'-':>8}"
+
+
+def measure_queued(name: str, stream, make_log, seconds: float, batch: int = 10000) -> str:
+    """每輪放滿 batch 筆再由背景執行緒寫完，分別計時"""
+    log_queue = queue.Queue(maxsize=batch)
+    log = make_log(make_logger(name, NonBlockingQueueHandler(log_queue)))
+    output = json_output(stream)
+    dropped = LOG_DROPPED.labels().value
+    caller = background = 0.0
+    events = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        for i in range(batch):
+            log(i)
+        caller += time.perf_counter() - start
+
+        start = time.perf_counter()
+        listener = LogListener(log_queue, output)
+        listener.start()
+        listener.stop()
+        background += time.perf_counter() - start
+        events += batch
+    return (f"{caller * 1e6 / events:>12.1f}{background * 1e6 / events:>12.1f}"
+            f"{LOG_DROPPED.labels().value - dropped:>8.0f}")
+
+
+def measure_saturated(name: str, stream, make_log, seconds: float) -> str:
+    """背景執行緒同時寫出，請求持續送入 (輸出跟不上時佇列滿載)"""
+    log_queue = queue.Queue(maxsize=int(os.getenv('LOG_QUEUE_SIZE', '10000')))
+    listener = LogListener(log_queue, json_output(stream))
+    listener.start()
+    dropped = LOG_DROPPED.labels().value
+    rate = run_for(make_log(make_logger(name, NonBlockingQueueHandler(log_queue))), seconds)
+    dropped = LOG_DROPPED.labels().value - dropped
+    # 清空佇列，不等慢速輸出寫完
+    while True:
+        try:
+            log_queue.get_nowait()
+        except queue.Empty:
+            break
+    listener.stop()
+    return f"{1e6 / rate:>12.1f}{'-':>12}{dropped:>8.0f}"
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+    devnull = open(os.devnull, 'w')
+    slow = SlowStream(0.001)
+    text = logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    print(f"webhook 內容 {len(BODY)} bytes，每項執行 {seconds:g} 秒，CPU {os.cpu_count()} 核")
+    print(f"{'方式':<18}{'請求執行緒 µs':>10}{'背景 µs':>8}{'丟棄':>6}   (每個事件)")
+    with log_context(request_id='0123456789abcdef'):
+        rows = [
+            ('改版前 (原文同步寫出)', lambda: measure_sync('legacy', devnull, text, legacy, seconds)),
+            ('同步 JSON + 摘要', lambda: measure_sync('sync_json', devnull, JsonFormatter(), summarized, seconds)),
+            ('佇列 + 摘要', lambda: measure_queued('queued', devnull, summarized, seconds)),
+        ]
+        for label, measure in rows:
+            print(f"{label:<18}{measure()}")
+
+        unsampled = functools.partial(summarized, rate=0.0)
+        print(f"{'取樣 0':<18}{measure_queued('sampled', devnull, unsampled, seconds)}")
+
+        print(f"{'慢速輸出：改版前':<18}{measure_sync('slow_legacy', slow, text, legacy, seconds)}")
+        print(f"{'慢速輸出：佇列':<18}{measure_saturated('slow_queued', slow, summarized, seconds)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""乘客名單匯出：一年份預約歷史下的查詢時間與記憶體
+
+灌入 365 天的交通車預約 (每天每位員工一筆)，比較有無名單索引時
+匯出當天名單的時間，並以 tracemalloc 量測串流時的記憶體高峰。
+
+執行：python benchmarks/bench_manifest.py [員工數] [天數]
+"""
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from common import make_seeded_db
+from manifest import stream_manifest
+from repository import SQLiteStorage
+
+
+def seed_history(db, employees: int, days: int):
+    today = date.today()
+    with db.connection() as conn:
+        schedules = [row[0] for row in conn.execute(
+            "SELECT id FROM bus_schedules WHERE shift_type = 'day' AND is_active = TRUE")]
+        conn.execute('UPDATE bus_schedules SET seat_limit = ?', (employees,))
+        for offset in range(days):
+            day = today - timedelta(days=offset)
+            conn.executemany('''
+                INSERT INTO bus_reservations (employee_id, schedule_id, reservation_date, status)
+                VALUES (?, ?, ?, ?)
+            ''', [(e, schedules[e % len(schedules)], day, 'cancelled' if e % 10 == 0 else 'active')
+                  for e in range(1, employees + 1)])
+        conn.execute('''
+            INSERT OR REPLACE INTO bus_seat_counters (schedule_id, reservation_date, booked)
+            SELECT schedule_id, reservation_date, COUNT(*)
+            FROM bus_reservations WHERE status = 'active'
+            GROUP BY schedule_id, reservation_date
+        ''')
+        conn.commit()
+
+
+def measure(db, label: str):
+    tracemalloc.start()
+    start = time.perf_counter()
+    first = None
+    size = 0
+    for chunk in stream_manifest(SQLiteStorage(db), date.today(), 'csv'):
+        if first is None:
+            first = time.perf_counter() - start
+        size += len(chunk)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label}: 首段 {first * 1000:7.1f}ms  全部 {elapsed * 1000:7.1f}ms  "
+          f"輸出 {size / 1024:7.1f}KB  記憶體高峰 {peak / 1024:7.1f}KB")
+
+
+def main():
+    employees = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 365
+
+    db = make_seeded_db(employees)
+    print(f"灌入 {employees} 人 × {days} 天的預約歷史...")
+    seed_history(db, employees, days)
+
+    measure(db, '名單索引    ')
+    with db.connection() as conn:
+        conn.execute('DROP INDEX idx_bus_reservations_manifest')
+    measure(db, '無名單索引  ')
+
+
+if __name__ == "__main__":
+    main()
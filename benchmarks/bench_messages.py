@@ -0,0 +1,68 @@
+"""回覆訊息建立成本：每次重建 vs 預先建立的固定訊息
+
+比較主選單、語言選單、取消選單每次回覆重新建立 LINE 訊息物件，與 StaticMessages 預先建立後重複使用的差異，
+以及字串查詢 (舊的巢狀 dict 查詢 vs 編譯後的 Catalog)。另外量測轉成送出用 JSON 的時間，作為整體比例參考。
+
+執行：python benchmarks/bench_messages.py [秒數]
+"""
+import os
+import sys
+
+from common import run_for
+
+os.environ.setdefault('CHANNEL_SECRET', 'bench-secret')
+os.environ.setdefault('CHANNEL_ACCESS_TOKEN', 'bench-token')
+
+import app as bot
+from i18n import CATALOG, MESSAGES
+from linebot.v3.messaging import ReplyMessageRequest
+
+LANGS = ('zh', 'en', 'vi')
+MENUS = (bot.create_main_menu, bot.create_language_menu, bot.create_cancel_menu)
+
+
+def legacy_get_message(key: str, lang: str = 'zh', *args) -> str:
+    """改版前的 get_message"""
+    message = MESSAGES.get(lang, MESSAGES['zh']).get(key, key)
+    if args:
+        return message.format(*args)
+    return message
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+
+    def rebuild(i):
+        MENUS[i % 3].__wrapped__(LANGS[i % 3])
+
+    def prebuilt(i):
+        MENUS[i % 3](LANGS[i % 3])
+
+    def rebuild_and_serialize(i):
+        ReplyMessageRequest(reply_token='t', messages=[MENUS[i % 3].__wrapped__(LANGS[i % 3])]).to_json()
+
+    def prebuilt_and_serialize(i):
+        ReplyMessageRequest(reply_token='t', messages=[MENUS[i % 3](LANGS[i % 3])]).to_json()
+
+    def legacy_strings(i):
+        legacy_get_message('seats_remaining', LANGS[i % 3], i)
+        legacy_get_message('booking_success', LANGS[i % 3])
+
+    def catalog_strings(i):
+        CATALOG.get('seats_remaining', LANGS[i % 3], i)
+        CATALOG.get('booking_success', LANGS[i % 3])
+
+    bot.static_messages.prebuild()
+    print(f"每項執行 {seconds:g} 秒 (每秒次數，越高越好)")
+    for label, fn in (('選單：每次重建        ', rebuild),
+                      ('選單：預先建立        ', prebuilt),
+                      ('選單 + JSON：每次重建 ', rebuild_and_serialize),
+                      ('選單 + JSON：預先建立 ', prebuilt_and_serialize),
+                      ('字串：巢狀 dict       ', legacy_strings),
+                      ('字串：Catalog         ', catalog_strings)):
+        rate = run_for(fn, seconds)
+        print(f"{label}: {rate:12,.0f}/s  ({1e6 / rate:7.2f}µs)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""發車提醒：5,000 位乘客的 multicast 發送時間
+
+建立 N 位已綁定、已預約同一班次的員工 (中/英/越三種語言)，對本機 LINE API 模擬伺服器
+發送提醒，比較不同並行批次數的總時間，限速與遇到 5xx 時重試的影響。
+每輪都重新建立發送紀錄 (已送出的乘客不會再送)。
+
+執行：python benchmarks/bench_reminders.py [乘客數] [LINE 延遲毫秒]
+"""
+import sys
+import time
+from datetime import datetime, timedelta
+
+from common import make_seeded_db
+from line_client import LineApiHolder, make_configuration
+from reminders import RateLimiter, run_due_reminders
+from repository import SQLiteStorage
+from settings import TAIPEI_TZ, taipei_today
+from stub_line_server import StubLineServer
+
+
+def seed_reservations(db, riders: int):
+    today = taipei_today()
+    with db.connection() as conn:
+        conn.execute('UPDATE bus_schedules SET seat_limit = ? WHERE id = 1', (riders,))
+        conn.execute('''
+            INSERT INTO bus_reservations (employee_id, schedule_id, reservation_date)
+            SELECT id, 1, ? FROM employees ORDER BY id LIMIT ?
+        ''', (today, riders))
+        conn.commit()
+        departure = conn.execute('SELECT departure_time FROM bus_schedules WHERE id = 1').fetchone()[0]
+    return datetime.combine(today, datetime.strptime(departure, '%H:%M').time(), TAIPEI_TZ)
+
+
+def measure(db, line_api, stub, now, label: str, failures=(), **options):
+    with db.connection() as conn:
+        conn.execute('DELETE FROM reminder_deliveries')
+        conn.commit()
+    stub.reset()
+    stub.fail_next(*failures)
+
+    start = time.perf_counter()
+    results = run_due_reminders(SQLiteStorage(db), line_api, now=now, **options)
+    elapsed = time.perf_counter() - start
+    sent = sum(r['sent'] for r in results)
+    failed = sum(r['failed'] for r in results)
+    retries = sum(r['retries'] for r in results)
+    requests = sum(stub.counts.values())
+    print(f"{label}: {elapsed * 1000:8.1f}ms  送出 {sent}  失敗 {failed}  "
+          f"請求 {requests}  重試 {retries}  連線 {stub.connections}")
+
+
+def main():
+    riders = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    db = make_seeded_db(riders)
+    departure = seed_reservations(db, riders)
+    now = departure - timedelta(minutes=10)
+    with StubLineServer(latency_ms=latency) as stub:
+        line_api = LineApiHolder(make_configuration('bench-token', host=stub.url))
+        print(f"{riders} 位乘客，LINE 延遲 {latency:g}ms")
+        for workers in (1, 4, 8):
+            measure(db, line_api, stub, now, f'並行 {workers} 批       ', workers=workers, rate=0)
+        measure(db, line_api, stub, now, '限速每秒 5 個請求 ', workers=4, limiter=RateLimiter(5))
+        measure(db, line_api, stub, now, '兩次 5xx 後重試   ', failures=(500, 503), workers=4, rate=0,
+                backoff=0.05)
+        line_api.close()
+
+
+if __name__ == "__main__":
+    main()
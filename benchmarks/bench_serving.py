@@ -0,0 +1,168 @@
+"""正式部署設定比較：gunicorn worker 程序數 × 執行緒數的吞吐量
+
+每組設定各自建立一份相同的暫存資料庫，以 gunicorn -c gunicorn.conf.py wsgi:app 啟動
+(dev 為 python app.py，asgi 為單一程序的 uvicorn asgi:app)，
+用 load_webhooks.py 的流程 (預約交通車、訂餐、查詢、QR code) 送出簽章正確的 webhook，
+統計吞吐量、延遲與錯誤率，並檢查多程序同時寫入後座位計數與有效預約是否一致。
+
+執行：python benchmarks/bench_serving.py [--configs dev,1x1,1x8,2x4,4x4,asgi] [--users 1000] [--concurrency 32]
+      (設定格式為 程序數x執行緒數)
+"""
+import os
+import sys
+import time
+import random
+import socket
+import sqlite3
+import argparse
+import tempfile
+import subprocess
+import http.client
+from typing import Dict, List, Optional, Tuple
+
+from common import make_seeded_db
+from load_webhooks import CHANNEL_SECRET, FlowPlanner, LoadRunner, parse_mix, summarize
+from catalog import CatalogData, load_catalog
+from stub_line_server import StubLineServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_configs(text: str) -> List[Tuple[str, Optional[int], Optional[int]]]:
+    """dev,1x8,2x4 → [(名稱, 程序數, 執行緒數)]；dev 為 Flask 開發伺服器，asgi 為 uvicorn"""
+    configs = []
+    for part in text.split(','):
+        part = part.strip()
+        if part in ('dev', 'asgi'):
+            configs.append((part, None, None))
+            continue
+        workers, _, threads = part.partition('x')
+        configs.append((part, int(workers), int(threads or 1)))
+    return configs
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'伺服器 {timeout:g} 秒內沒有啟動')
+
+
+def prepare_db(users: int) -> Tuple[str, List[Tuple[str, str]], CatalogData]:
+    db_path = os.path.join(tempfile.mkdtemp(prefix='linebot_serving_'), 'serving.db')
+    seeded = make_seeded_db(users, db_path)
+    with seeded.connection() as conn:
+        # 壓測不受預約截止時間影響
+        conn.execute("UPDATE system_settings SET setting_value = '23:59' WHERE setting_key LIKE '%_deadline'")
+        conn.commit()
+        rows = conn.execute('''
+            SELECT lu.line_user_id, e.shift_type
+            FROM line_users lu JOIN employees e ON e.id = lu.employee_id
+            WHERE lu.is_bound = TRUE ORDER BY e.id LIMIT ?
+        ''', (users,)).fetchall()
+        catalog = load_catalog(conn)
+    seeded.pool.close_all()
+    return db_path, rows, catalog
+
+
+def consistency(db_path: str) -> Dict:
+    """座位計數表與實際有效預約是否一致 (多程序同時寫入後檢查)"""
+    conn = sqlite3.connect(db_path)
+    try:
+        mismatched = conn.execute('''
+            SELECT COUNT(*) FROM bus_seat_counters c
+            WHERE c.booked != (SELECT COUNT(*) FROM bus_reservations r
+                               WHERE r.schedule_id = c.schedule_id AND r.reservation_date = c.reservation_date
+                                 AND r.status = 'active')
+        ''').fetchone()[0]
+        return {
+            'bus_reservations': conn.execute("SELECT COUNT(*) FROM bus_reservations WHERE status = 'active'").fetchone()[0],
+            'meal_orders': conn.execute("SELECT COUNT(*) FROM meal_orders WHERE status = 'active'").fetchone()[0],
+            'counter_mismatches': mismatched,
+        }
+    finally:
+        conn.close()
+
+
+def run_config(name: str, workers: Optional[int], threads: Optional[int], args, stub_url: str) -> Dict:
+    db_path, users, catalog = prepare_db(args.users)
+    port = free_port()
+    env = dict(os.environ,
+               PORT=str(port),
+               DATABASE_PATH=db_path,
+               CHANNEL_SECRET=CHANNEL_SECRET,
+               CHANNEL_ACCESS_TOKEN='load-test-token',
+               LINE_API_HOST=stub_url,
+               PUBLIC_BASE_URL='https://bot.example.com')
+    if name == 'asgi':
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(port), '--log-level', 'warning']
+    elif workers is None:
+        command = [sys.executable, 'app.py']
+    else:
+        env.update(WEB_CONCURRENCY=str(workers), GUNICORN_THREADS=str(threads))
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app']
+    server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(port)
+        rng = random.Random(args.seed)
+        planner = FlowPlanner(catalog, rng)
+        names, weights = zip(*args.mix.items())
+        plans = [(line_user_id, planner.steps(rng.choices(names, weights)[0], shift_type))
+                 for line_user_id, shift_type in users]
+
+        # 暖機：讓每個 worker 載入 LINE SDK、建立連線 (不計入結果)
+        warm = LoadRunner('127.0.0.1', port, args.concurrency)
+        warm.run([(line_user_id, [('view_booking', 'action=view_booking')]) for line_user_id, _ in users[:200]])
+
+        runner = LoadRunner('127.0.0.1', port, args.concurrency)
+        runner._seq = warm._seq  # webhookEventId 不可與暖機重複，否則會被當成重送而略過
+        elapsed = runner.run(plans)
+        result = summarize(runner.samples, elapsed)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    result['outcome'] = consistency(db_path)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='gunicorn worker/執行緒數吞吐量比較')
+    parser.add_argument('--configs', type=parse_configs, default=parse_configs('dev,1x1,1x8,2x4,4x4,asgi'),
+                        help='程序數x執行緒數，以逗號分隔；dev 為 python app.py，asgi 為 uvicorn asgi:app')
+    parser.add_argument('--users', type=int, default=1000, help='同時操作的已綁定員工數')
+    parser.add_argument('--concurrency', type=int, default=32, help='同時送出請求的連線數')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('bus=4,meal=3,view=2,qr=1'),
+                        help='流程比例，例如 bus=4,meal=3,view=2,qr=1')
+    parser.add_argument('--line-latency-ms', type=float, default=20, help='模擬 LINE reply API 延遲')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    stub = StubLineServer(latency_ms=args.line_latency_ms, keep_requests=False).start()
+    print(f"{args.users} 位員工，{args.concurrency} 條連線，LINE 延遲 {args.line_latency_ms:g}ms，CPU {os.cpu_count()} 核")
+    print(f"{'設定':<8}{'req/s':>10}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}{'錯誤率':>8}{'交通車':>8}{'訂餐':>7}{'計數不符':>8}")
+    try:
+        for name, workers, threads in args.configs:
+            result = run_config(name, workers, threads, args, stub.url)
+            total, outcome = result['total'], result['outcome']
+            print(f"{name:<10}{total['rps']:>10.1f}{total['p50_ms']:>9.2f}{total['p95_ms']:>9.2f}{total['p99_ms']:>9.2f}"
+                  f"{total['error_rate'] * 100:>9.2f}%{outcome['bus_reservations']:>9}{outcome['meal_orders']:>9}"
+                  f"{outcome['counter_mismatches']:>10}")
+    finally:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
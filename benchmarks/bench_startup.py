@@ -0,0 +1,91 @@
+"""冷啟動時間：import app、startup() 與前兩個 webhook 的延遲
+
+每次量測都啟動一個新的 Python 程序 (資料庫已是最新結構)，記錄：
+    import   import app 所需時間
+    startup  startup() 所需時間 (資料表檢查、背景預先載入 SDK)
+    first    第一個已簽章 /callback 請求 (含回覆到 LINE API 模擬伺服器)
+    second   第二個請求
+並比較 LINE_SDK_PRELOAD=1 (背景預先載入) 與 0 (第一個請求才載入)，各取中位數。
+--wait-ms 模擬程序啟動後到第一個請求進來的間隔。
+
+執行：python benchmarks/bench_startup.py [--runs 5] [--wait-ms 1500]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+from common import make_seeded_db, line_user_id
+from load_webhooks import CHANNEL_SECRET, postback_body, sign
+
+PHASES = ('import', 'startup', 'first', 'second')
+
+
+def child(wait: float):
+    """子程序：依序量測各階段，以 JSON 輸出毫秒數"""
+    from stub_line_server import StubLineServer
+    stub = StubLineServer(keep_requests=False).start()
+    os.environ['LINE_API_HOST'] = stub.url
+
+    timings = {}
+    start = time.perf_counter()
+    import app as bot
+    timings['import'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    bot.startup()
+    timings['startup'] = time.perf_counter() - start
+
+    time.sleep(wait)
+    client = bot.app.test_client()
+    for seq, phase in enumerate(('first', 'second')):
+        body = postback_body(line_user_id(0), 'action=view_booking', seq)
+        start = time.perf_counter()
+        response = client.post('/callback', data=body, headers={'X-Line-Signature': sign(body)})
+        timings[phase] = time.perf_counter() - start
+        assert response.status_code == 200, response.status_code
+
+    print(json.dumps({phase: seconds * 1000 for phase, seconds in timings.items()}))
+
+
+def measure(db_path: str, preload: bool, wait_ms: float) -> dict:
+    env = dict(
+        os.environ,
+        DATABASE_PATH=db_path,
+        CHANNEL_SECRET=CHANNEL_SECRET,
+        CHANNEL_ACCESS_TOKEN='bench-token',
+        PUBLIC_BASE_URL='https://bot.example.com',
+        LINE_SDK_PRELOAD='1' if preload else '0',
+    )
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', '--wait-ms', str(wait_ms)],
+                            env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='webhook 程序冷啟動時間')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--wait-ms', type=float, default=1500, help='startup() 後等多久才送第一個請求')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.wait_ms / 1000)
+        return
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='linebot_startup_'), 'startup.db')
+    make_seeded_db(10, db_path).pool.close_all()
+    print(f"{args.runs} 次冷啟動，第一個請求在 startup() 後 {args.wait_ms:g}ms 送出 (中位數，毫秒)")
+    print(f"{'':16}" + ''.join(f'{phase:>10}' for phase in PHASES))
+    for preload in (True, False):
+        runs = [measure(db_path, preload, args.wait_ms) for _ in range(args.runs)]
+        label = '背景預先載入' if preload else '第一次使用才載入'
+        print(f"{label:<16}" + ''.join(f'{statistics.median(r[phase] for r in runs):10.1f}' for phase in PHASES))
+
+
+if __name__ == "__main__":
+    main()
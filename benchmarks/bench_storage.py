@@ -0,0 +1,152 @@
+"""儲存後端比較：多個程序同時預約時，SQLite 與 PostgreSQL 的每秒寫入交易數
+
+每個程序各自建立 repository (如同 gunicorn 的每個 worker)，輪流替不同員工預約交通車、訂餐並查詢當天紀錄。
+SQLite 同一時間只有一個寫入者，PostgreSQL 只有同一列 (同一班次的座位計數) 才需要排隊。
+結束後檢查座位計數與有效預約是否一致。
+
+執行：python benchmarks/bench_storage.py [--postgres-url postgresql://...] [--processes 1,2,4] [--seconds 5]
+      (未指定 --postgres-url 時讀取 TEST_POSTGRES_URL，兩者皆無則只測 SQLite)
+"""
+import os
+import time
+import uuid
+import sqlite3
+import argparse
+import contextlib
+import multiprocessing
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+from common import make_seeded_db
+from repository import SQLiteStorage
+from database import DatabaseManager
+
+EMPLOYEES = 2000
+SCHEDULES = 12
+RESTAURANTS = 5
+
+
+def open_backend(backend: str, target: str):
+    if backend == 'sqlite':
+        return SQLiteStorage(DatabaseManager(target, pool_size=2, init=False))
+    from repository_pg import PostgresStorage
+    return PostgresStorage(target, pool_size=2)
+
+
+def worker(backend: str, target: str, index: int, processes: int, seconds: float, results):
+    storage = open_backend(backend, target)
+    day = date(2026, 1, 5)
+    ops = 0
+    deadline = time.perf_counter() + seconds
+    employee_id = index + 1
+    while time.perf_counter() < deadline:
+        # 各程序輪流負責不同員工，所有員工都預約過一輪後換到下一天
+        storage.reservations.book(employee_id, ops % SCHEDULES + 1, day + timedelta(days=ops // EMPLOYEES))
+        storage.orders.book(employee_id, ops % RESTAURANTS + 1, day)
+        storage.reservations.for_day(employee_id, day)
+        ops += 1
+        employee_id = (employee_id - 1 + processes) % EMPLOYEES + 1
+    storage.close()
+    results.put(ops)
+
+
+def consistency(storage) -> int:
+    """座位計數與實際有效預約不一致的 (班次, 日期) 數"""
+    sql = '''
+        SELECT COUNT(*) FROM bus_seat_counters c
+        WHERE c.booked != (SELECT COUNT(*) FROM bus_reservations r
+                           WHERE r.schedule_id = c.schedule_id AND r.reservation_date = c.reservation_date
+                             AND r.status = 'active')
+    '''
+    if storage.backend == 'sqlite':
+        with storage.db.connection() as conn:
+            return conn.execute(sql).fetchone()[0]
+    return storage.query_one(sql)[0]
+
+
+def run(backend: str, target: str, processes: int, seconds: float) -> Dict:
+    ctx = multiprocessing.get_context('fork')
+    results = ctx.Queue()
+    workers = [ctx.Process(target=worker, args=(backend, target, i, processes, seconds, results))
+               for i in range(processes)]
+    start = time.perf_counter()
+    for p in workers:
+        p.start()
+    ops = sum(results.get() for _ in workers)
+    for p in workers:
+        p.join()
+    elapsed = time.perf_counter() - start
+    storage = open_backend(backend, target)
+    try:
+        mismatches = consistency(storage)
+    finally:
+        storage.close()
+    # 每次操作 = 2 個寫入交易 + 1 次查詢
+    return {'tx_per_sec': ops * 2 / elapsed, 'ops': ops, 'mismatches': mismatches}
+
+
+def prepare(backend: str, seed_path: str, postgres_url: Optional[str]) -> str:
+    """建立一份新的資料庫，回傳 SQLite 路徑或 PostgreSQL 連線字串"""
+    if backend == 'sqlite':
+        path = os.path.join(os.path.dirname(seed_path), f'{uuid.uuid4().hex[:8]}.db')
+        source, target = sqlite3.connect(seed_path), sqlite3.connect(path)
+        source.backup(target)
+        source.close()
+        target.close()
+        return path
+
+    import psycopg2
+    from urllib.parse import urlsplit
+    from repository_pg import PostgresStorage
+    name = f'linebot_bench_{uuid.uuid4().hex[:8]}'
+    admin = psycopg2.connect(postgres_url)
+    admin.autocommit = True
+    admin.cursor().execute(f'CREATE DATABASE {name}')
+    admin.close()
+    url = urlsplit(postgres_url)._replace(path=f'/{name}').geturl()
+    storage = PostgresStorage(url)
+    storage.init_schema()
+    storage.copy_from_sqlite(seed_path)
+    storage.close()
+    return url
+
+
+def drop(backend: str, target: str, postgres_url: Optional[str]):
+    if backend == 'sqlite':
+        for suffix in ('', '-wal', '-shm'):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(target + suffix)
+        return
+    import psycopg2
+    admin = psycopg2.connect(postgres_url)
+    admin.autocommit = True
+    admin.cursor().execute(f"DROP DATABASE {target.rsplit('/', 1)[1]}")
+    admin.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SQLite 與 PostgreSQL 多程序寫入比較')
+    parser.add_argument('--postgres-url', default=os.getenv('TEST_POSTGRES_URL'),
+                        help='可建立資料庫的 PostgreSQL 連線字串')
+    parser.add_argument('--processes', default='1,2,4', help='同時寫入的程序數，以逗號分隔')
+    parser.add_argument('--seconds', type=float, default=5.0)
+    args = parser.parse_args()
+
+    seed = make_seeded_db(EMPLOYEES)
+    seed.pool.close_all()
+    backends: List[str] = ['sqlite'] + (['postgresql'] if args.postgres_url else [])
+
+    print(f"{EMPLOYEES} 位員工，每組 {args.seconds:g} 秒，CPU {os.cpu_count()} 核")
+    print(f"{'後端':<12}{'程序數':>6}{'交易/秒':>10}{'操作數':>8}{'計數不符':>8}")
+    for backend in backends:
+        for processes in (int(p) for p in args.processes.split(',')):
+            target = prepare(backend, seed.db_path, args.postgres_url)
+            try:
+                result = run(backend, target, processes, args.seconds)
+            finally:
+                drop(backend, target, args.postgres_url)
+            print(f"{backend:<12}{processes:>8}{result['tx_per_sec']:>12.1f}{result['ops']:>10}{result['mismatches']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""效能測試共用工具：建立暫存資料庫並灌入測試資料"""
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DatabaseManager
+
+
+def make_seeded_db(employees: int = 1000, db_path: str = None) -> DatabaseManager:
+    """建立含初始資料、員工與 LINE 綁定的暫存資料庫"""
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='linebot_bench_'), 'bench.db')
+    db = DatabaseManager(db_path)
+    db.insert_initial_data()
+    
+    with db.connection() as conn:
+        conn.executemany('''
+            INSERT OR IGNORE INTO employees (employee_id, name, department_id, shift_type, preferred_language)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(employee_code(i), f'壓測員工{i}', 1, 'day' if i % 4 else 'night', ('zh', 'en', 'vi')[i % 3])
+              for i in range(employees)])
+        conn.executemany('''
+            INSERT OR IGNORE INTO line_users (line_user_id, employee_id, is_bound, bound_at)
+            SELECT ?, id, TRUE, CURRENT_TIMESTAMP FROM employees WHERE employee_id = ?
+        ''', [(line_user_id(i), employee_code(i)) for i in range(employees)])
+        conn.commit()
+    return db
+
+
+def employee_code(i: int) -> str:
+    """第 i 位測試員工的員工編號"""
+    return f'IGA1-{i:05d}'
+
+
+def line_user_id(i: int) -> str:
+    """第 i 位測試員工的 LINE user ID"""
+    return f'U{i:032x}'
+
+
+def run_for(fn, seconds: float = 3.0) -> float:
+    """在指定秒數內重複執行 fn，回傳每秒次數"""
+    count = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        fn(count)
+        count += 1
+    return count / (time.perf_counter() - start)
@@ -0,0 +1,309 @@
+"""截止時間前的尖峰壓力測試：模擬大量員工同時透過 LINE 預約
+
+建立含 N 位已綁定員工的暫存資料庫，在本機啟動 app 與 LINE API 模擬伺服器，
+以正確的 X-Line-Signature 對 /callback 送出合成的 webhook。
+所有員工在同一時間開始各自的操作流程 (模擬 14:30 交通車、09:00 訂餐截止前的尖峰)：
+
+    bus   bus_booking → bus_route → bus_confirm
+    meal  meal_booking → meal_confirm
+    view  view_booking
+    qr    generate_qr
+
+統計整體與各 action 的吞吐量、p50/p95/p99 延遲與錯誤率。
+流程分配由 --seed 決定，相同參數可重複執行比較。
+
+執行：python benchmarks/load_webhooks.py [--users 2000] [--concurrency 32]
+      [--mix bus=4,meal=3,view=2,qr=1] [--line-latency-ms 20] [--seed 1] [--json result.json]
+"""
+import os
+import json
+import hmac
+import time
+import base64
+import random
+import hashlib
+import argparse
+import tempfile
+import threading
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from common import make_seeded_db
+from stub_line_server import StubLineServer
+
+CHANNEL_SECRET = 'load-test-secret'
+FLOWS = ('bus', 'meal', 'view', 'qr')
+
+
+def parse_mix(text: str) -> Dict[str, int]:
+    """解析 bus=4,meal=3 形式的流程比例"""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in FLOWS:
+            raise argparse.ArgumentTypeError(f'未知的流程: {name} (可用: {", ".join(FLOWS)})')
+        mix[name] = int(weight or 1)
+    return mix
+
+
+def sign(body: bytes, secret: str = CHANNEL_SECRET) -> str:
+    """計算 LINE webhook 簽章"""
+    return base64.b64encode(hmac.new(secret.encode('utf-8'), body, hashlib.sha256).digest()).decode('ascii')
+
+
+def postback_body(line_user_id: str, data: str, seq: int) -> bytes:
+    """產生單一 postback 事件的 webhook 內容"""
+    event = {
+        'type': 'postback',
+        'mode': 'active',
+        'timestamp': int(time.time() * 1000),
+        'webhookEventId': f'LOAD{seq:022d}',
+        'deliveryContext': {'isRedelivery': False},
+        'replyToken': f'load-{seq}',
+        'source': {'type': 'user', 'userId': line_user_id},
+        'postback': {'data': data},
+    }
+    return json.dumps({'destination': 'Uload', 'events': [event]}).encode('utf-8')
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """最近排名法百分位數"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class FlowPlanner:
+    """依目錄資料與員工班別產生各流程要送出的 postback"""
+
+    def __init__(self, catalog, rng: random.Random):
+        self.catalog = catalog
+        self.rng = rng
+        self.floors = {}
+        for restaurant in catalog.restaurants:
+            self.floors.setdefault(restaurant[1], []).append(str(restaurant[0]))
+
+    def steps(self, flow: str, shift_type: str) -> List[Tuple[str, str]]:
+        """回傳 (action, postback data) 清單"""
+        if flow == 'bus':
+            routes = [r for r in self.catalog.routes if self.catalog.schedules_for(r[0], shift_type)]
+            route = self.rng.choice(routes)
+            schedule = self.rng.choice(self.catalog.schedules_for(route[0], shift_type))
+            return [
+                ('bus_booking', 'action=bus_booking'),
+                ('bus_route', f'action=bus_route&route_id={route[0]}&route_code={route[1]}'),
+                ('bus_confirm', f'action=bus_confirm&schedule_id={schedule[0]}&time={schedule[3]}'),
+            ]
+        if flow == 'meal':
+            floor = self.rng.choice(sorted(self.floors))
+            return [
+                ('meal_booking', 'action=meal_booking'),
+                ('meal_confirm', f'action=meal_confirm&restaurant_ids={",".join(self.floors[floor])}&floor={floor}'),
+            ]
+        if flow == 'view':
+            return [('view_booking', 'action=view_booking')]
+        return [('generate_qr', 'action=generate_qr')]
+
+
+class LoadRunner:
+    """以固定數量的執行緒對 /callback 送出各員工的流程"""
+
+    def __init__(self, host: str, port: int, concurrency: int, think_ms: float = 0):
+        self.host = host
+        self.port = port
+        self.concurrency = concurrency
+        self.think = think_ms / 1000
+        self.samples: List[Tuple[str, float, int]] = []  # (action, 秒, HTTP 狀態；0 表示連線錯誤)
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _next_seq(self) -> int:
+        with self._lock:
+            self._seq += 1
+            return self._seq
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        return conn
+
+    def _post(self, body: bytes) -> int:
+        conn = self._connection()
+        try:
+            conn.request('POST', '/callback', body=body, headers={
+                'Content-Type': 'application/json',
+                'X-Line-Signature': sign(body),
+            })
+            response = conn.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self._local.conn = None
+            return 0
+
+    def run_flow(self, line_user_id: str, steps: List[Tuple[str, str]]):
+        for action, data in steps:
+            body = postback_body(line_user_id, data, self._next_seq())
+            start = time.perf_counter()
+            status = self._post(body)
+            self.samples.append((action, time.perf_counter() - start, status))
+            if status != 200:
+                break
+            if self.think:
+                time.sleep(self.think)
+
+    def run(self, plans: List[Tuple[str, List[Tuple[str, str]]]]) -> float:
+        """同時開始所有流程，回傳總耗時 (秒)"""
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='load') as pool:
+            for line_user_id, steps in plans:
+                pool.submit(self.run_flow, line_user_id, steps)
+        return time.perf_counter() - start
+
+
+def summarize(samples: List[Tuple[str, float, int]], elapsed: float) -> Dict:
+    """整理成整體與各 action 的統計"""
+    groups: Dict[str, List[Tuple[float, int]]] = {}
+    for action, seconds, status in samples:
+        groups.setdefault(action, []).append((seconds, status))
+
+    def stats(rows: List[Tuple[float, int]]) -> Dict:
+        latencies = sorted(seconds * 1000 for seconds, _ in rows)
+        errors = sum(1 for _, status in rows if status != 200)
+        return {
+            'requests': len(rows),
+            'errors': errors,
+            'error_rate': errors / len(rows) if rows else 0.0,
+            'rps': len(rows) / elapsed if elapsed else 0.0,
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+            'max_ms': latencies[-1] if latencies else 0.0,
+        }
+
+    statuses: Dict[str, int] = {}
+    for _, _, status in samples:
+        key = str(status) if status else 'connection_error'
+        statuses[key] = statuses.get(key, 0) + 1
+
+    return {
+        'elapsed_seconds': elapsed,
+        'total': stats([(seconds, status) for _, seconds, status in samples]),
+        'actions': {action: stats(rows) for action, rows in sorted(groups.items())},
+        'statuses': statuses,
+    }
+
+
+def print_report(result: Dict):
+    def line(name: str, s: Dict):
+        print(f"{name:<14}{s['requests']:>8}{s['rps']:>10.1f}{s['p50_ms']:>9.2f}{s['p95_ms']:>9.2f}"
+              f"{s['p99_ms']:>9.2f}{s['max_ms']:>9.2f}{s['error_rate'] * 100:>8.2f}%")
+
+    print(f"\n耗時 {result['elapsed_seconds']:.2f}s  HTTP 狀態: {result['statuses']}")
+    print(f"{'action':<14}{'請求':>6}{'req/s':>10}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}{'max ms':>9}{'錯誤率':>6}")
+    for action, s in result['actions'].items():
+        line(action, s)
+    line('總計', result['total'])
+
+    outcome = result['outcome']
+    print(f"\nLINE 回覆: {outcome['line_requests']}")
+    print(f"有效交通車預約 {outcome['bus_reservations']} 筆，有效訂餐 {outcome['meal_orders']} 筆")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='webhook 尖峰壓力測試')
+    parser.add_argument('--users', type=int, default=2000, help='同時操作的已綁定員工數')
+    parser.add_argument('--concurrency', type=int, default=32, help='同時送出請求的連線數')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('bus=4,meal=3,view=2,qr=1'),
+                        help='流程比例，例如 bus=4,meal=3,view=2,qr=1')
+    parser.add_argument('--line-latency-ms', type=float, default=20, help='模擬 LINE reply API 延遲')
+    parser.add_argument('--think-ms', type=float, default=0, help='同一位員工兩次點擊的間隔')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--db', help='資料庫路徑 (預設建立暫存資料庫)')
+    parser.add_argument('--json', help='將結果另存為 JSON')
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='linebot_load_'), 'load.db')
+    print(f"準備 {args.users} 位已綁定員工: {db_path}")
+    seeded = make_seeded_db(args.users, db_path)
+    with seeded.connection() as conn:
+        # 壓測不受預約截止時間影響
+        conn.execute("UPDATE system_settings SET setting_value = '23:59' WHERE setting_key LIKE '%_deadline'")
+        conn.commit()
+        users = conn.execute('''
+            SELECT lu.line_user_id, e.shift_type
+            FROM line_users lu JOIN employees e ON e.id = lu.employee_id
+            WHERE lu.is_bound = TRUE ORDER BY e.id LIMIT ?
+        ''', (args.users,)).fetchall()
+    seeded.pool.close_all()
+
+    stub = StubLineServer(latency_ms=args.line_latency_ms, keep_requests=False).start()
+    os.environ.update(
+        DATABASE_PATH=db_path,
+        CHANNEL_SECRET=CHANNEL_SECRET,
+        CHANNEL_ACCESS_TOKEN='load-test-token',
+        LINE_API_HOST=stub.url,
+        PUBLIC_BASE_URL='https://bot.example.com',
+    )
+
+    # 必須在設定環境變數之後才載入 app
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    import app as bot
+    bot.startup()
+    if bot.sdk_warm_up is not None:
+        bot.sdk_warm_up.join()
+    from catalog import load_catalog
+
+    class QuietHandler(WSGIRequestHandler):
+        protocol_version = 'HTTP/1.1'  # 讓每條壓測連線可以重複使用
+
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, bot.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, name='load-target', daemon=True).start()
+
+    rng = random.Random(args.seed)
+    with bot.db.connection() as conn:
+        planner = FlowPlanner(load_catalog(conn), rng)
+    names, weights = zip(*args.mix.items())
+    plans = [(line_user_id, planner.steps(rng.choices(names, weights)[0], shift_type))
+             for line_user_id, shift_type in users]
+    print(f"{len(plans)} 個流程、{sum(len(steps) for _, steps in plans)} 個 webhook，"
+          f"{args.concurrency} 條連線，LINE 延遲 {args.line_latency_ms:g}ms")
+
+    runner = LoadRunner('127.0.0.1', server.server_port, args.concurrency, args.think_ms)
+    elapsed = runner.run(plans)
+    if bot.event_dispatcher is not None:
+        # 非同步模式：等背景 worker 把佇列清空再統計結果
+        while bot.event_dispatcher.depth():
+            time.sleep(0.05)
+
+    result = summarize(runner.samples, elapsed)
+    with bot.db.connection() as conn:
+        result['outcome'] = {
+            'line_requests': dict(stub.counts),
+            'bus_reservations': conn.execute(
+                "SELECT COUNT(*) FROM bus_reservations WHERE status = 'active'").fetchone()[0],
+            'meal_orders': conn.execute(
+                "SELECT COUNT(*) FROM meal_orders WHERE status = 'active'").fetchone()[0],
+        }
+    result['params'] = {k: v for k, v in vars(args).items() if k != 'json'}
+    print_report(result)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    server.shutdown()
+    stub.stop()
+
+
+if __name__ == "__main__":
+    main()
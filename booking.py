@@ -0,0 +1,197 @@
+"""預約寫入流程
+
+每位員工每天最多一筆有效 (status='active') 的交通車預約與訂餐，由部分唯一索引保證；
+預約一律以 INSERT ... ON CONFLICT DO UPDATE 一次寫入，改訂時原紀錄就地更新，
+舊內容由觸發器另存為 cancelled 紀錄保留歷史。
+
+交通車預約以 bus_seat_counters 計數表控管座位：在 BEGIN IMMEDIATE 交易中
+先以條件式 UPDATE 佔位 (booked < seat_limit 才會成功)，再寫入預約紀錄，
+多人同時搶位也不會超賣；不存在或已停用的班次回傳 unavailable，不會誤報額滿。
+訂餐則在同一交易中更新 meal_counts 各餐廳訂單數。
+"""
+import sqlite3
+from datetime import date
+from typing import Dict, Optional
+
+
+def _active_schedule(cursor: sqlite3.Cursor, employee_id: int, day: date) -> Optional[int]:
+    """員工當天有效預約的班次"""
+    cursor.execute('''
+        SELECT schedule_id FROM bus_reservations
+        WHERE employee_id = ? AND reservation_date = ? AND status = 'active'
+    ''', (employee_id, day))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _free_seat(cursor: sqlite3.Cursor, schedule_id: int, day: date):
+    """釋出班次當天的一個座位"""
+    cursor.execute('''
+        UPDATE bus_seat_counters SET booked = booked - 1
+        WHERE schedule_id = ? AND reservation_date = ? AND booked > 0
+    ''', (schedule_id, day))
+
+
+def remaining_seats(cursor: sqlite3.Cursor, schedule_id: int, day: date) -> int:
+    """班次當天剩餘座位"""
+    cursor.execute('''
+        SELECT bs.seat_limit - COALESCE(c.booked, 0)
+        FROM bus_schedules bs
+        LEFT JOIN bus_seat_counters c ON c.schedule_id = bs.id AND c.reservation_date = ?
+        WHERE bs.id = ?
+    ''', (day, schedule_id))
+    row = cursor.fetchone()
+    return max(row[0], 0) if row else 0
+
+
+def book_bus(conn: sqlite3.Connection, employee_id: int, schedule_id: int, day: date) -> Dict:
+    """預約交通車 (覆蓋當天舊預約)，額滿或班次停用時不寫入
+    
+    回傳 {'success': bool, 'full': bool, 'unavailable': bool, 'remaining': 剩餘座位}
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        
+        cursor.execute('SELECT 1 FROM bus_schedules WHERE id = ? AND is_active = TRUE', (schedule_id,))
+        if cursor.fetchone() is None:
+            conn.rollback()
+            return {'success': False, 'full': False, 'unavailable': True, 'remaining': 0}
+        
+        current = _active_schedule(cursor, employee_id, day)
+        if current == schedule_id:
+            # 已經訂同一班，不需要重新佔位
+            remaining = remaining_seats(cursor, schedule_id, day)
+            conn.commit()
+            return {'success': True, 'full': False, 'unavailable': False, 'remaining': remaining}
+        
+        # 佔位：只有 booked < seat_limit 時才會更新成功
+        cursor.execute('''
+            INSERT OR IGNORE INTO bus_seat_counters (schedule_id, reservation_date, booked)
+            VALUES (?, ?, 0)
+        ''', (schedule_id, day))
+        cursor.execute('''
+            UPDATE bus_seat_counters SET booked = booked + 1
+            WHERE schedule_id = ? AND reservation_date = ?
+              AND booked < (SELECT seat_limit FROM bus_schedules WHERE id = ? AND is_active = TRUE)
+        ''', (schedule_id, day, schedule_id))
+        if cursor.rowcount == 0:
+            conn.rollback()
+            return {'success': False, 'full': True, 'unavailable': False, 'remaining': 0}
+        
+        # 覆蓋機制：釋出原本班次的座位，預約紀錄就地改成新班次
+        if current is not None:
+            _free_seat(cursor, current, day)
+        cursor.execute('''
+            INSERT INTO bus_reservations (employee_id, schedule_id, reservation_date)
+            VALUES (?, ?, ?)
+            ON CONFLICT (employee_id, reservation_date) WHERE status = 'active'
+            DO UPDATE SET schedule_id = excluded.schedule_id, notes = NULL,
+                          reserved_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+        ''', (employee_id, schedule_id, day))
+        
+        remaining = remaining_seats(cursor, schedule_id, day)
+        conn.commit()
+        return {'success': True, 'full': False, 'unavailable': False, 'remaining': remaining}
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def cancel_bus(conn: sqlite3.Connection, employee_id: int, day: date) -> int:
+    """取消員工當天的交通車預約並釋出座位，回傳取消筆數"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        current = _active_schedule(cursor, employee_id, day)
+        if current is None:
+            conn.rollback()
+            return 0
+        cursor.execute('''
+            UPDATE bus_reservations
+            SET status = 'cancelled', updated_at = CURRENT_TIMESTAMP
+            WHERE employee_id = ? AND reservation_date = ? AND status = 'active'
+        ''', (employee_id, day))
+        _free_seat(cursor, current, day)
+        conn.commit()
+        return 1
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def _active_restaurant(cursor: sqlite3.Cursor, employee_id: int, day: date) -> Optional[int]:
+    """員工當天有效訂單的餐廳"""
+    cursor.execute('''
+        SELECT restaurant_id FROM meal_orders
+        WHERE employee_id = ? AND order_date = ? AND status = 'active'
+    ''', (employee_id, day))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _count_meal(cursor: sqlite3.Cursor, restaurant_id: int, day: date, delta: int):
+    """調整餐廳當天的訂單數"""
+    if delta > 0:
+        cursor.execute('''
+            INSERT INTO meal_counts (order_date, restaurant_id, ordered) VALUES (?, ?, ?)
+            ON CONFLICT (order_date, restaurant_id) DO UPDATE SET ordered = ordered + excluded.ordered
+        ''', (day, restaurant_id, delta))
+    else:
+        cursor.execute('''
+            UPDATE meal_counts SET ordered = MAX(ordered + ?, 0)
+            WHERE order_date = ? AND restaurant_id = ?
+        ''', (delta, day, restaurant_id))
+
+
+def book_meal(conn: sqlite3.Connection, employee_id: int, restaurant_id: int, day: date) -> bool:
+    """訂餐 (覆蓋當天舊訂單)，回傳是否有寫入 (已訂同一家餐廳時為 False)"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        
+        current = _active_restaurant(cursor, employee_id, day)
+        if current == restaurant_id:
+            conn.commit()
+            return False
+        
+        cursor.execute('''
+            INSERT INTO meal_orders (employee_id, restaurant_id, order_date)
+            VALUES (?, ?, ?)
+            ON CONFLICT (employee_id, order_date) WHERE status = 'active'
+            DO UPDATE SET restaurant_id = excluded.restaurant_id, menu_id = NULL,
+                          special_request = NULL, price = NULL,
+                          ordered_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+        ''', (employee_id, restaurant_id, day))
+        
+        # 廚房訂單數：新餐廳 +1，原本的餐廳 -1
+        _count_meal(cursor, restaurant_id, day, 1)
+        if current is not None:
+            _count_meal(cursor, current, day, -1)
+        conn.commit()
+        return True
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def cancel_meal(conn: sqlite3.Connection, employee_id: int, day: date) -> int:
+    """取消員工當天的訂餐，回傳取消筆數"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        current = _active_restaurant(cursor, employee_id, day)
+        if current is None:
+            conn.rollback()
+            return 0
+        cursor.execute('''
+            UPDATE meal_orders
+            SET status = 'cancelled', updated_at = CURRENT_TIMESTAMP
+            WHERE employee_id = ? AND order_date = ? AND status = 'active'
+        ''', (employee_id, day))
+        _count_meal(cursor, current, day, -1)
+        conn.commit()
+        return 1
+    except Exception:
+        conn.rollback()
+        raise
@@ -0,0 +1,137 @@
+"""路線、班次、餐廳選單快取
+
+目錄資料一個月才改一次，載入一次後就在記憶體中產生選單訊息。
+資料表異動時觸發器會更新 catalog_version 版本號，快取每隔 check_interval 秒
+檢查一次版本號，變動時才重新載入，其餘的選單點擊完全不碰資料庫。
+版本號與目錄資料由 CatalogRepository (repository.py) 提供，與資料庫種類無關。
+
+目錄資料與版本號在同一個交易中讀取，快取記下的是資料實際對應的版本。
+每次重新載入或 invalidate() 都換一個世代 (generation)，產生選單期間世代已變時不寫回快取，
+避免讀到舊資料的請求把過期的選單放回去。
+"""
+import time
+import threading
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+
+class CatalogData:
+    """某一版本的目錄資料 (只含啟用中的項目)"""
+    
+    def __init__(self, routes: List[Tuple], schedules: List[Tuple], restaurants: List[Tuple],
+                 version: Optional[int] = None):
+        # 與資料同一交易讀到的 catalog_version
+        self.version = version
+        # (id, route_code, route_name_zh, route_name_en, route_name_vi)
+        self.routes = routes
+        # (id, route_id, shift_type, departure_time, schedule_name_zh, schedule_name_en, schedule_name_vi,
+        #  route_name_zh, route_name_en, route_name_vi)
+        self.schedules = schedules
+        # (id, floor, name_zh, name_en, name_vi)
+        self.restaurants = restaurants
+    
+    def schedules_for(self, route_id: int, shift_type: str) -> List[Tuple]:
+        """指定路線與班別的班次"""
+        return [s for s in self.schedules if s[1] == route_id and s[2] == shift_type]
+
+
+def load_catalog(conn) -> CatalogData:
+    """從資料庫載入目錄資料 (需要一致的版本號時由呼叫端包在同一個交易中)"""
+    cursor = conn.cursor()
+    cursor.execute('SELECT version FROM catalog_version WHERE id = 1')
+    version = cursor.fetchone()[0]
+    
+    cursor.execute('''
+        SELECT id, route_code, route_name_zh, route_name_en, route_name_vi
+        FROM bus_routes WHERE is_active = TRUE ORDER BY id
+    ''')
+    routes = cursor.fetchall()
+    
+    cursor.execute('''
+        SELECT bs.id, bs.route_id, bs.shift_type, bs.departure_time,
+               bs.schedule_name_zh, bs.schedule_name_en, bs.schedule_name_vi,
+               br.route_name_zh, br.route_name_en, br.route_name_vi
+        FROM bus_schedules bs
+        JOIN bus_routes br ON bs.route_id = br.id
+        WHERE bs.is_active = TRUE
+        ORDER BY bs.route_id, bs.shift_type, bs.id
+    ''')
+    schedules = cursor.fetchall()
+    
+    cursor.execute('SELECT id, floor, name_zh, name_en, name_vi FROM restaurants WHERE is_active = TRUE ORDER BY floor, id')
+    restaurants = cursor.fetchall()
+    return CatalogData(routes, schedules, restaurants, version)
+
+
+class CatalogCache:
+    """以版本號失效的選單訊息快取"""
+    
+    def __init__(self, source, check_interval: float = 30.0):
+        self.source = source
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+        self._generation = 0
+        # (世代, 目錄資料, 已產生的選單)，整組替換，讀取端拿到的三者一定互相對應
+        self._state: Optional[Tuple[int, CatalogData, Dict[Hashable, object]]] = None
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+    
+    def _fresh_state(self):
+        state = self._state
+        if state is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return state
+        return None
+    
+    def _refresh(self) -> Tuple[int, CatalogData, Dict[Hashable, object]]:
+        """超過檢查間隔時比對版本號，有變動才重新載入，回傳目前的 (世代, 目錄資料, 選單)"""
+        state = self._fresh_state()
+        if state is not None:
+            return state
+        with self._lock:
+            state = self._fresh_state()
+            if state is not None:
+                return state
+            version = self.source.version()
+            state = self._state
+            if state is None or version != self._version:
+                data = self.source.load()
+                self._generation += 1
+                state = self._state = (self._generation, data, {})
+                self._version = version if data.version is None else data.version
+                self.reloads += 1
+            self._checked_at = time.monotonic()
+            return state
+    
+    def get(self, key: Hashable, render: Callable[[CatalogData], object]):
+        """取得預先產生的選單，尚未產生時以 render(目錄資料) 建立"""
+        generation, data, rendered = self._refresh()
+        message = rendered.get(key)
+        if message is None:
+            self.misses += 1
+            message = render(data)
+            # 產生期間目錄已失效或重新載入：照樣回傳這次的結果，但不寫回快取
+            state = self._state
+            if state is not None and state[0] == generation:
+                rendered[key] = message
+        else:
+            self.hits += 1
+        return message
+    
+    def invalidate(self):
+        """本程序修改目錄後呼叫，下次使用時立即重新載入"""
+        with self._lock:
+            self._generation += 1
+            self._state = None
+    
+    def stats(self) -> Dict:
+        state = self._state
+        return {
+            'version': self._version,
+            'generation': self._generation,
+            'entries': len(state[2]) if state is not None else 0,
+            'hits': self.hits,
+            'misses': self.misses,
+            'reloads': self.reloads
+        }
@@ -0,0 +1,27 @@
+import pytest
+
+
+@pytest.fixture(scope='session')
+def bot(tmp_path_factory):
+    """以暫存資料庫載入 app (整個測試過程只載入一次)，含一位測試員工 IGA1-00001"""
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv('DATABASE_PATH', str(tmp_path_factory.mktemp('app') / 'test.db'))
+        mp.setenv('CHANNEL_SECRET', 'test-channel-secret')
+        mp.setenv('CHANNEL_ACCESS_TOKEN', 'test-channel-token')
+        mp.setenv('PUBLIC_BASE_URL', 'https://bot.example.com')
+        mp.setenv('LINE_SDK_PRELOAD', '0')
+        # 測試會檢查 webhook 日誌，全部記錄
+        mp.setenv('LOG_WEBHOOK_SAMPLE', '1')
+        import app as bot
+
+        bot.db.init_database()
+        bot.db.insert_initial_data()
+        with bot.db.connection() as conn:
+            conn.execute('''INSERT INTO employees (employee_id, name, department_id, shift_type)
+                            VALUES ('IGA1-00001', '測試員工', 1, 'day')''')
+            conn.execute("UPDATE system_settings SET setting_value = '23:59' WHERE setting_key LIKE '%_deadline'")
+            conn.commit()
+        bot.system_settings.invalidate()
+        bot.startup()
+        yield bot
+        bot.shutdown()
@@ -1,19 +1,234 @@
+import os
+import time
+import queue
+import random
+import logging
 import sqlite3
 import datetime
-from typing import Optional, List, Dict
+import threading
+from contextlib import contextmanager
+from typing import Callable, Optional, List, Dict, TypeVar
 
-class DatabaseManager:
-    def __init__(self, db_path='linebot_booking.db'):
+from cache import TTLCache
+from metrics import Counter, Histogram
+from migrations import LATEST_VERSION, apply_migrations, current_version
+
+logger = logging.getLogger(__name__)
+_NOT_CACHED = object()
+T = TypeVar('T')
+
+SQL_SECONDS = Histogram('linebot_sql_seconds', 'SQL 執行時間 (依敘述類型與資料表分類)', ['family'])
+SQL_BUSY_RETRIES = Counter('linebot_sql_busy_retries_total', '資料庫被其他連線鎖住而重做的寫入交易數')
+
+def is_busy_error(error: Exception) -> bool:
+    """SQLITE_BUSY / SQLITE_LOCKED：其他連線 (或其他 worker 程序) 持有寫入鎖超過 busy_timeout"""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    code = getattr(error, 'sqlite_errorcode', None)
+    if code is not None:
+        return code & 0xff in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    message = str(error)
+    return 'database is locked' in message or 'database table is locked' in message
+
+_SQL_FAMILIES: Dict[str, str] = {}
+_TABLE_KEYWORD = {'select': 'from', 'delete': 'from', 'insert': 'into', 'replace': 'into'}
+
+def sql_family(sql: str) -> str:
+    """SQL 敘述類型，例如 select_employees、update_bus_reservations"""
+    family = _SQL_FAMILIES.get(sql)
+    if family is not None:
+        return family
+    
+    words = sql.lower().replace('(', ' ').split()
+    verb = words[0] if words else 'empty'
+    table = ''
+    if verb == 'update' and len(words) > 1:
+        table = words[1]
+    elif verb in _TABLE_KEYWORD and _TABLE_KEYWORD[verb] in words:
+        index = words.index(_TABLE_KEYWORD[verb]) + 1
+        table = words[index] if index < len(words) else ''
+    family = f'{verb}_{table}' if table else verb
+    
+    if len(_SQL_FAMILIES) < 2048:
+        _SQL_FAMILIES[sql] = family
+    return family
+
+class TimedCursor(sqlite3.Cursor):
+    """記錄執行時間的游標"""
+    
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            SQL_SECONDS.labels(sql_family(sql)).observe(time.perf_counter() - start)
+    
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            SQL_SECONDS.labels(sql_family(sql)).observe(time.perf_counter() - start)
+
+class TimedConnection(sqlite3.Connection):
+    """預設使用 TimedCursor 的連線"""
+    
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+    
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+class ConnectionPool:
+    """SQLite 連線池：連線只建立一次並重複使用，避免每次查詢都重新連線"""
+    
+    def __init__(self, db_path: str, max_size: int = 8, checkout_timeout: float = 10.0,
+                 busy_timeout_ms: int = 5000, cached_statements: int = 256):
         self.db_path = db_path
-        self.init_database()
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cached_statements = cached_statements
+        self._idle = queue.LifoQueue(maxsize=max_size)
+        self._lock = threading.Lock()
+        self._created = 0
+    
+    def _connect(self) -> sqlite3.Connection:
+        """建立新連線並套用效能設定"""
+        conn = sqlite3.connect(
+            self.db_path,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,  # 連線會在不同執行緒間借還
+            factory=TimedConnection,
+            cached_statements=self.cached_statements  # 快取已編譯的 SQL 敘述
+        )
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+        return conn
+    
+    def checkout(self) -> sqlite3.Connection:
+        """借出連線，池中沒有閒置連線且已達上限時等待歸還"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        
+        with self._lock:
+            can_create = self._created < self.max_size
+            if can_create:
+                self._created += 1
+        
+        if can_create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        
+        try:
+            return self._idle.get(timeout=self.checkout_timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(f'連線池已滿，等待 {self.checkout_timeout} 秒仍無可用連線')
+    
+    def checkin(self, conn: sqlite3.Connection):
+        """歸還連線，未提交的交易一律回滾"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # 連線已損壞就丟棄，讓下次借出時重新建立
+            conn.close()
+            with self._lock:
+                self._created -= 1
+            return
+        self._idle.put_nowait(conn)
+    
+    def close_all(self):
+        """關閉所有閒置連線"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+    
+    def stats(self) -> Dict:
+        """連線池使用狀況"""
+        idle = self._idle.qsize()
+        return {'size': self._created, 'idle': idle, 'in_use': self._created - idle}
+
+class DatabaseManager:
+    def __init__(self, db_path: Optional[str] = None, pool_size: Optional[int] = None, init: bool = True):
+        self.db_path = db_path or os.getenv('DATABASE_PATH', 'linebot_booking.db')
+        self.pool = ConnectionPool(
+            self.db_path,
+            max_size=pool_size or int(os.getenv('DB_POOL_SIZE', '8')),
+            busy_timeout_ms=int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+        )
+        # busy_timeout 用完仍拿不到寫入鎖時，整個交易最多再重做幾次
+        self.busy_retries = int(os.getenv('SQLITE_BUSY_RETRIES', '3'))
+        # LINE 使用者 -> 員工資料快取，綁定或改語言時需呼叫 invalidate_employee
+        self.employee_cache = TTLCache(
+            maxsize=int(os.getenv('EMPLOYEE_CACHE_SIZE', '5000')),
+            ttl=float(os.getenv('EMPLOYEE_CACHE_TTL', '60'))
+        )
+        # 每隔幾秒比對 employee_cache_version，其他程序改過員工或綁定資料時清空快取
+        self.employee_check_interval = float(os.getenv('EMPLOYEE_CACHE_CHECK_INTERVAL', '1'))
+        self._employee_version: Optional[int] = None
+        self._employee_checked_at = 0.0
+        # init=False 時由呼叫端在啟動階段自行呼叫 init_database()
+        if init:
+            self.init_database()
     
     def get_connection(self):
-        """取得資料庫連線"""
+        """取得資料庫連線（獨立連線，給一次性腳本使用）"""
         return sqlite3.connect(self.db_path, detect_types=sqlite3.PARSE_DECLTYPES)
     
-    def init_database(self):
-        """初始化資料庫，建立所有資料表"""
-        conn = self.get_connection()
+    @contextmanager
+    def connection(self):
+        """從連線池借出連線，離開 with 區塊時自動歸還"""
+        conn = self.pool.checkout()
+        try:
+            yield conn
+        finally:
+            self.pool.checkin(conn)
+    
+    def run_write(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """以連線池的連線執行寫入交易 fn(conn, *args, **kwargs)
+        
+        多個程序同時寫入時，等待超過 busy_timeout 仍拿不到寫入鎖會得到 SQLITE_BUSY；
+        fn 失敗時必須已回滾，這裡稍候 (指數退避加隨機) 後從頭重做整個交易，最多 busy_retries 次。
+        """
+        attempt = 0
+        while True:
+            try:
+                with self.connection() as conn:
+                    return fn(conn, *args, **kwargs)
+            except sqlite3.OperationalError as e:
+                if not is_busy_error(e) or attempt >= self.busy_retries:
+                    raise
+                attempt += 1
+                SQL_BUSY_RETRIES.inc()
+                time.sleep(random.uniform(0.5, 1.0) * 0.05 * 2 ** attempt)
+    
+    def init_database(self) -> List[int]:
+        """初始化資料庫，建立所有資料表；結構已是最新版本時直接略過，回傳本次套用的版本"""
+        with self.connection() as conn:
+            if current_version(conn) >= LATEST_VERSION:
+                return []
+            self._create_tables(conn)
+            return apply_migrations(conn)
+    
+    def _create_tables(self, conn: sqlite3.Connection):
+        """建立所有資料表"""
         cursor = conn.cursor()
         
         try:
@@ -166,13 +381,11 @@ class DatabaseManager:
             ''')
             
             conn.commit()
-            print("✅ 資料庫初始化完成")
+            logger.info("✅ 資料庫初始化完成")
             
-        except Exception as e:
-            print(f"❌ 資料庫初始化錯誤: {e}")
+        except Exception:
+            logger.exception("❌ 資料庫初始化錯誤")
             conn.rollback()
-        finally:
-            conn.close()
     
     def insert_initial_data(self):
         """插入初始資料"""
@@ -195,7 +408,7 @@ class DatabaseManager:
                     INSERT INTO departments (dept_code, dept_name_zh, dept_name_en, dept_name_vi)
                     VALUES (?, ?, ?, ?)
                 ''', departments)
-                print("✅ 部門資料插入完成")
+                logger.info("✅ 部門資料插入完成")
             
             # 插入交通車路線
             routes = [
@@ -210,7 +423,7 @@ class DatabaseManager:
                     INSERT INTO bus_routes (route_code, route_name_zh, route_name_en, route_name_vi, description_zh, description_en, description_vi)
                     VALUES (?, ?, ?, ?, ?, ?, ?)
                 ''', routes)
-                print("✅ 交通車路線資料插入完成")
+                logger.info("✅ 交通車路線資料插入完成")
             
             # 插入班次資料
             schedules = [
@@ -236,7 +449,7 @@ class DatabaseManager:
                     INSERT INTO bus_schedules (route_id, shift_type, departure_time, schedule_name_zh, schedule_name_en, schedule_name_vi)
                     VALUES (?, ?, ?, ?, ?, ?)
                 ''', schedules)
-                print("✅ 班次資料插入完成")
+                logger.info("✅ 班次資料插入完成")
             
             # 插入餐廳資料
             restaurants = [
@@ -253,7 +466,7 @@ class DatabaseManager:
                     INSERT INTO restaurants (floor, name_zh, name_en, name_vi, type, has_daily_menu)
                     VALUES (?, ?, ?, ?, ?, ?)
                 ''', restaurants)
-                print("✅ 餐廳資料插入完成")
+                logger.info("✅ 餐廳資料插入完成")
             
             # 插入系統設定
             settings = [
@@ -269,25 +482,32 @@ class DatabaseManager:
                     INSERT INTO system_settings (setting_key, setting_value, description)
                     VALUES (?, ?, ?)
                 ''', settings)
-                print("✅ 系統設定插入完成")
+                logger.info("✅ 系統設定插入完成")
             
             conn.commit()
-            print("🎉 所有初始資料插入完成！")
+            logger.info("🎉 所有初始資料插入完成！")
             
-        except Exception as e:
-            print(f"❌ 初始資料插入錯誤: {e}")
+        except Exception:
+            logger.exception("❌ 初始資料插入錯誤")
             conn.rollback()
         finally:
             conn.close()
     
     def bind_line_user(self, line_user_id: str, employee_id: str) -> Dict:
         """綁定LINE使用者與員工"""
-        conn = self.get_connection()
+        try:
+            result = self.run_write(self._bind_line_user, line_user_id, employee_id)
+        except Exception as e:
+            return {'success': False, 'message': f'綁定失敗：{str(e)}'}
+        if result['success']:
+            self.invalidate_employee(line_user_id)
+        return result
+    
+    def _bind_line_user(self, conn: sqlite3.Connection, line_user_id: str, employee_id: str) -> Dict:
         cursor = conn.cursor()
-        
         try:
             # 檢查員工是否存在
-            cursor.execute('SELECT id, name FROM employees WHERE employee_id = ?', (employee_id,))
+            cursor.execute("SELECT id, name FROM employees WHERE employee_id = ? AND status = 'active'", (employee_id,))
             employee = cursor.fetchone()
             
             if not employee:
@@ -314,15 +534,34 @@ class DatabaseManager:
             conn.commit()
             return {'success': True, 'message': f'成功綁定員工：{employee[1]}'}
             
-        except Exception as e:
+        except Exception:
             conn.rollback()
-            return {'success': False, 'message': f'綁定失敗：{str(e)}'}
-        finally:
-            conn.close()
+            raise
+    
+    def _check_employee_version(self):
+        """超過檢查間隔時比對 employee_cache_version，其他程序改過員工或綁定資料就清空快取"""
+        now = time.monotonic()
+        if now - self._employee_checked_at < self.employee_check_interval:
+            return
+        self._employee_checked_at = now
+        try:
+            with self.connection() as conn:
+                row = conn.execute('SELECT version FROM employee_cache_version WHERE id = 1').fetchone()
+        except sqlite3.Error:
+            return
+        version = row[0] if row else None
+        if version != self._employee_version:
+            self.employee_cache.clear()
+            self._employee_version = version
     
     def get_employee_by_line_id(self, line_user_id: str) -> Optional[Dict]:
-        """透過LINE ID取得員工資料"""
-        conn = self.get_connection()
+        """透過LINE ID取得員工資料（先查快取）"""
+        self._check_employee_version()
+        cached = self.employee_cache.get(line_user_id, _NOT_CACHED)
+        if cached is not _NOT_CACHED:
+            return cached
+        
+        conn = self.pool.checkout()
         cursor = conn.cursor()
         
         try:
@@ -332,12 +571,13 @@ class DatabaseManager:
                 FROM employees e
                 JOIN line_users lu ON e.id = lu.employee_id
                 LEFT JOIN departments d ON e.department_id = d.id
-                WHERE lu.line_user_id = ? AND lu.is_bound = TRUE
+                WHERE lu.line_user_id = ? AND lu.is_bound = TRUE AND e.status = 'active'
             ''', (line_user_id,))
             
             result = cursor.fetchone()
+            employee = None
             if result:
-                return {
+                employee = {
                     'id': result[0],
                     'employee_id': result[1],
                     'name': result[2],
@@ -349,17 +589,25 @@ class DatabaseManager:
                         'vi': result[7]
                     }
                 }
-            return None
+            # 未綁定的結果也快取，綁定時會主動清除
+            self.employee_cache.set(line_user_id, employee)
+            return employee
             
-        except Exception as e:
-            print(f"查詢員工錯誤: {e}")
+        except Exception:
+            logger.exception("查詢員工錯誤")
             return None
         finally:
-            conn.close()
+            self.pool.checkin(conn)
+    
+    def invalidate_employee(self, line_user_id: str):
+        """員工資料異動後清除快取"""
+        self.employee_cache.invalidate(line_user_id)
 
 # 初始化資料庫
 if __name__ == "__main__":
-    print("🚀 開始初始化資料庫...")
+    from logs import configure_logging
+    configure_logging(fmt='text')
+    logger.info("🚀 開始初始化資料庫...")
     db = DatabaseManager()
     db.insert_initial_data()
-    print("✅ 資料庫設置完成！")
\ No newline at end of file
+    logger.info("✅ 資料庫設置完成！")
\ No newline at end of file
@@ -0,0 +1,123 @@
+"""Webhook 事件去重
+
+伺服器回應太慢時 LINE 會重送同一個事件 (webhookEventId 相同、deliveryContext.isRedelivery 為 true)。
+處理前先以 claim() 登記事件 ID，已登記過的事件直接略過，不會重複預約或重複回覆。
+
+- 記憶體：有上限的 TTLCache，同一程序內的重送不必查資料庫
+- 資料表：webhook_events 讓多個程序 (多個 worker) 共用，一次 upsert 就能判斷是否第一次收到
+- 超過保存期限 (ttl 秒) 的紀錄每隔 purge_interval 秒清除一次
+"""
+import time
+import threading
+from typing import Dict, Optional
+
+from cache import TTLCache
+from metrics import Counter
+from migrations import WEBHOOK_EVENTS_DDL
+
+WEBHOOK_EVENTS_TOTAL = Counter('linebot_webhook_events_total', 'Webhook 事件數 (duplicate 為重送而略過)',
+                               ['result'])
+
+# 新事件或已過期的紀錄才會寫入，rowcount 為 0 表示重複
+CLAIM_SQL = '''
+    INSERT INTO webhook_events (event_id, received_at) VALUES (?, ?)
+    ON CONFLICT (event_id) DO UPDATE SET received_at = excluded.received_at
+    WHERE webhook_events.received_at < ?
+'''
+
+
+class EventDeduplicator:
+    """以 webhookEventId 判斷事件是否已處理過"""
+
+    def __init__(self, db, ttl: float = 86400.0, maxsize: int = 10000, purge_interval: float = 300.0):
+        self.db = db
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self._seen = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._purged_at = 0.0
+        self.processed = 0
+        self.duplicates = 0
+        self.redeliveries = 0
+
+    def init_table(self):
+        """只建立 webhook_events (完整結構由 DatabaseManager.init_database 建立)"""
+        with self.db.connection() as conn:
+            for sql in WEBHOOK_EVENTS_DDL:
+                conn.execute(sql)
+            conn.commit()
+
+    def claim(self, event_id: Optional[str], redelivery: bool = False, now: Optional[float] = None) -> bool:
+        """第一次收到的事件回傳 True；沒有事件 ID 時無法判斷，一律視為新事件"""
+        if redelivery:
+            with self._lock:
+                self.redeliveries += 1
+        if not event_id:
+            return self._count(True)
+        if self._seen.get(event_id):
+            return self._count(False)
+
+        now = time.time() if now is None else now
+        purge = now - self._purged_at >= self.purge_interval
+        # 多個 worker 同時寫入時，被鎖住的交易由 run_write 重做
+        claimed = self.db.run_write(self._claim_row, event_id, now, purge)
+        if purge:
+            self._purged_at = now
+        self._seen.set(event_id, True)
+        return self._count(claimed)
+
+    def _claim_row(self, conn, event_id: str, now: float, purge: bool) -> bool:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(CLAIM_SQL, (event_id, now, now - self.ttl))
+            claimed = cursor.rowcount == 1
+            if purge:
+                cursor.execute('DELETE FROM webhook_events WHERE received_at < ?', (now - self.ttl,))
+            conn.commit()
+            return claimed
+        except Exception:
+            conn.rollback()
+            raise
+
+    def claim_event(self, event) -> bool:
+        """以 LINE webhook 事件的 webhookEventId 登記"""
+        delivery_context = getattr(event, 'delivery_context', None)
+        return self.claim(getattr(event, 'webhook_event_id', None),
+                          redelivery=bool(getattr(delivery_context, 'is_redelivery', False)))
+
+    def release_event(self, event):
+        self.release(getattr(event, 'webhook_event_id', None))
+
+    def release(self, event_id: Optional[str]):
+        """事件沒有處理成功 (例如回應 5xx 讓 LINE 重送) 時取消登記，重送時才會再處理"""
+        if not event_id:
+            return
+        self._seen.invalidate(event_id)
+        self.db.run_write(self._delete_row, event_id)
+
+    def _delete_row(self, conn, event_id: str):
+        try:
+            conn.execute('DELETE FROM webhook_events WHERE event_id = ?', (event_id,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def _count(self, claimed: bool) -> bool:
+        with self._lock:
+            if claimed:
+                self.processed += 1
+            else:
+                self.duplicates += 1
+        WEBHOOK_EVENTS_TOTAL.labels('processed' if claimed else 'duplicate').inc()
+        return claimed
+
+    def stats(self) -> Dict:
+        total = self.processed + self.duplicates
+        return {
+            'processed': self.processed,
+            'duplicates': self.duplicates,
+            'redeliveries': self.redeliveries,
+            'duplicate_rate': round(self.duplicates / total, 4) if total else 0.0,
+            'memory_entries': len(self._seen)
+        }
@@ -0,0 +1,46 @@
+"""gunicorn 設定 (正式環境)：多個 worker 程序，每個程序多執行緒
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+環境變數：
+    PORT               監聽埠 (預設 5000)
+    WEB_CONCURRENCY    worker 程序數 (預設 2)
+    GUNICORN_THREADS   每個 worker 的執行緒數 (預設 8)，同時也是每個 worker 的資料庫連線池大小
+    GUNICORN_TIMEOUT   單一請求逾時秒數 (預設 30)
+
+SQLite 多程序寫入：連線一律使用 WAL 與 busy_timeout (SQLITE_BUSY_TIMEOUT_MS)，
+預約等寫入交易遇到 SQLITE_BUSY 時整個重做 (SQLITE_BUSY_RETRIES)，見 DatabaseManager.run_write。
+資料庫結構升級在主程序 fork 前執行一次，worker 不會同時搶著升級。
+
+/metrics 的數值屬於各別 worker 程序，並帶有 pid 標籤 (見 metrics.py)。
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+worker_class = 'gthread'
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = 15
+keepalive = 5
+accesslog = None
+errorlog = '-'
+
+# 每個執行緒都能拿到一條連線，不必等其他請求歸還
+os.environ.setdefault('DB_POOL_SIZE', str(threads))
+
+
+def on_starting(server):
+    """主程序：fork 前先完成資料庫升級與測試員工匯入，並關閉用過的連線"""
+    import app as bot
+    # worker fork 後會重新建立日誌執行緒 (logs.py)，各自的 startup() 再依環境變數設定一次
+    bot.configure_logging()
+    bot.prepare_database()
+    bot.storage.close()
+    bot.db.pool.close_all()
+
+
+def worker_exit(server, worker):
+    """worker 結束前處理完非同步佇列中的事件"""
+    import app as bot
+    bot.shutdown()
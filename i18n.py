@@ -0,0 +1,262 @@
+"""多語言訊息目錄
+
+所有使用者看得到的字串都放在 MESSAGES，載入時編譯成 Catalog：
+- 檢查每個 key 在 zh/en/vi 都有，且各語言的 {} 參數一致，缺漏時直接丟出 CatalogError (程序無法啟動)
+- 每種語言一張扁平的字串表，沒有參數的訊息直接回傳，有參數的才 format
+
+主選單、語言選單、取消選單等固定訊息以 StaticMessages 註冊，每種語言只建立一次，之後重複使用同一個物件。
+"""
+import string
+import functools
+import threading
+from typing import Callable, Dict, List, Tuple
+
+LANGUAGES = ('zh', 'en', 'vi')
+DEFAULT_LANGUAGE = 'zh'
+
+MESSAGES = {
+    'zh': {
+        'welcome': '歡迎使用交通車預約訂餐系統！',
+        'bind_required': '請先輸入您的員工編號進行綁定\n格式：IGA1-02849',
+        'bind_success': '✅ 綁定成功！歡迎 {}！',
+        'bind_failed': '❌ 綁定失敗：{}',
+        'main_menu_title': '交通車預約訂餐系統',
+        'main_menu_text': '請選擇您要使用的功能：',
+        'bus_booking': '🚌 預約交通車',
+        'meal_booking': '🍱 訂餐服務',
+        'view_booking': '📋 查看我的預約',
+        'cancel_booking': '❌ 取消預約',
+        'route_selection': '選擇交通車路線',
+        'route_selection_text': '請選擇您要預約的路線：',
+        'schedule_selection_text': '請選擇班次時間：',
+        'meal_location': '選擇取餐地點',
+        'meal_location_text': '請選擇您要訂餐的地點：',
+        'back_to_menu': '🔙 返回主選單',
+        'booking_success': '✅ 預約成功！',
+        'booking_failed': '❌ 預約失敗：{}',
+        'time_limit_exceeded': '❌ 超過預約時間限制',
+        'no_bookings': '您目前沒有預約記錄',
+        'qr_code_title': '🍱 領餐認證QR碼',
+        'qr_code_desc': '請向餐廳人員出示此QR碼領取餐點',
+        'qr_code_invalid': '❌ 您今日沒有訂餐記錄，無法生成QR碼',
+        'language_changed': '✅ 語言已切換為：{}',
+        'cancel_success': '✅ 取消成功！',
+        'cancel_failed': '❌ 取消失敗：{}',
+        'nothing_to_cancel': '❌ 沒有可取消的預約',
+        'bus_full': '❌ 此班次已額滿，請選擇其他班次',
+        'bus_unavailable': '❌ 此班次已停駛或不存在，請選擇其他班次',
+        'seats_remaining': '💺 剩餘座位：{}',
+        'cancel_menu_title': '取消預約',
+        'cancel_menu_text': '請選擇要取消的項目:',
+        'cancel_bus': '🚌 取消交通車',
+        'cancel_meal': '🍱 取消訂餐',
+        'cancel_type_bus': '交通車',
+        'cancel_type_meal': '訂餐',
+        'language_name': '中文',
+        'language_label': '中文 🇹🇼',
+        'language_menu_title': '語言設定 Language',
+        'language_menu_text': '選擇語言 Choose Language:',
+        'language_menu_alt': 'Language Settings',
+        'bus_reminder': '🚌 發車提醒\n{route} {schedule} 將於 {time} 發車 (約 {minutes} 分鐘後)，請準時上車。'
+    },
+    'en': {
+        'welcome': 'Welcome to Bus & Meal Booking System!',
+        'bind_required': 'Please enter your employee ID for binding\nFormat: IGA1-02849',
+        'bind_success': '✅ Binding successful! Welcome {}!',
+        'bind_failed': '❌ Binding failed: {}',
+        'main_menu_title': 'Bus & Meal Booking System',
+        'main_menu_text': 'Please select the function you want to use:',
+        'bus_booking': '🚌 Book Bus',
+        'meal_booking': '🍱 Order Meal',
+        'view_booking': '📋 View My Bookings',
+        'cancel_booking': '❌ Cancel Booking',
+        'route_selection': 'Select Bus Route',
+        'route_selection_text': 'Please select the route you want to book:',
+        'schedule_selection_text': 'Please select departure time:',
+        'meal_location': 'Select Meal Location',
+        'meal_location_text': 'Please select where you want to order:',
+        'back_to_menu': '🔙 Back to Main Menu',
+        'booking_success': '✅ Booking successful!',
+        'booking_failed': '❌ Booking failed: {}',
+        'time_limit_exceeded': '❌ Booking time limit exceeded',
+        'no_bookings': 'You have no current bookings',
+        'qr_code_title': '🍱 Meal Pickup QR Code',
+        'qr_code_desc': 'Please show this QR code to restaurant staff',
+        'qr_code_invalid': '❌ No meal order today, cannot generate QR code',
+        'language_changed': '✅ Language changed to: {}',
+        'cancel_success': '✅ Cancelled successfully!',
+        'cancel_failed': '❌ Cancel failed: {}',
+        'nothing_to_cancel': '❌ Nothing to cancel',
+        'bus_full': '❌ This bus is full, please choose another departure',
+        'bus_unavailable': '❌ This departure is no longer available, please choose another one',
+        'seats_remaining': '💺 Seats left: {}',
+        'cancel_menu_title': 'Cancel Booking',
+        'cancel_menu_text': 'Select item to cancel:',
+        'cancel_bus': '🚌 Cancel Bus',
+        'cancel_meal': '🍱 Cancel Meal',
+        'cancel_type_bus': 'Bus',
+        'cancel_type_meal': 'Meal',
+        'language_name': 'English',
+        'language_label': 'English 🇺🇸',
+        'language_menu_title': '語言設定 Language',
+        'language_menu_text': '選擇語言 Choose Language:',
+        'language_menu_alt': 'Language Settings',
+        'bus_reminder': '🚌 Bus reminder\n{route} {schedule} departs at {time} (in about {minutes} min). Please be on time.'
+    },
+    'vi': {
+        'welcome': 'Chào mừng đến với Hệ thống Đặt xe & Đặt cơm!',
+        'bind_required': 'Vui lòng nhập mã nhân viên để liên kết\nĐịnh dạng: IGA1-02849',
+        'bind_success': '✅ Liên kết thành công! Chào mừng {}!',
+        'bind_failed': '❌ Liên kết thất bại: {}',
+        'main_menu_title': 'Hệ thống Đặt xe & Đặt cơm',
+        'main_menu_text': 'Vui lòng chọn chức năng bạn muốn sử dụng:',
+        'bus_booking': '🚌 Đặt xe',
+        'meal_booking': '🍱 Đặt cơm',
+        'view_booking': '📋 Xem đặt chỗ của tôi',
+        'cancel_booking': '❌ Hủy đặt chỗ',
+        'route_selection': 'Chọn tuyến xe',
+        'route_selection_text': 'Vui lòng chọn tuyến bạn muốn đặt:',
+        'schedule_selection_text': 'Vui lòng chọn giờ khởi hành:',
+        'meal_location': 'Chọn địa điểm ăn',
+        'meal_location_text': 'Vui lòng chọn nơi bạn muốn đặt cơm:',
+        'back_to_menu': '🔙 Về menu chính',
+        'booking_success': '✅ Đặt chỗ thành công!',
+        'booking_failed': '❌ Đặt chỗ thất bại: {}',
+        'time_limit_exceeded': '❌ Đã quá thời gian đặt chỗ',
+        'no_bookings': 'Bạn hiện tại không có đặt chỗ nào',
+        'qr_code_title': '🍱 Mã QR nhận cơm',
+        'qr_code_desc': 'Vui lòng xuất trình mã QR này cho nhân viên nhà hàng',
+        'qr_code_invalid': '❌ Không có đơn đặt cơm hôm nay, không thể tạo mã QR',
+        'language_changed': '✅ Đã chuyển ngôn ngữ sang: {}',
+        'cancel_success': '✅ Hủy thành công!',
+        'cancel_failed': '❌ Hủy thất bại: {}',
+        'nothing_to_cancel': '❌ Không có gì để hủy',
+        'bus_full': '❌ Chuyến xe đã hết chỗ, vui lòng chọn chuyến khác',
+        'bus_unavailable': '❌ Chuyến xe này không còn hoạt động, vui lòng chọn chuyến khác',
+        'seats_remaining': '💺 Số ghế còn lại: {}',
+        'cancel_menu_title': 'Hủy đặt chỗ',
+        'cancel_menu_text': 'Chọn mục cần hủy:',
+        'cancel_bus': '🚌 Hủy xe',
+        'cancel_meal': '🍱 Hủy cơm',
+        'cancel_type_bus': 'Xe',
+        'cancel_type_meal': 'Cơm',
+        'language_name': 'Tiếng Việt',
+        'language_label': 'Tiếng Việt 🇻🇳',
+        'language_menu_title': '語言設定 Language',
+        'language_menu_text': '選擇語言 Choose Language:',
+        'language_menu_alt': 'Language Settings',
+        'bus_reminder': '🚌 Nhắc nhở xe đưa đón\n{route} {schedule} khởi hành lúc {time} (khoảng {minutes} phút nữa). Vui lòng đúng giờ.'
+    }
+}
+
+
+class CatalogError(ValueError):
+    """訊息目錄缺少翻譯或參數不一致"""
+
+
+def _fields(text: str) -> Tuple[str, ...]:
+    """訊息中的參數 ({} 依出現順序編號)"""
+    fields = []
+    for _, name, _, _ in string.Formatter().parse(text):
+        if name is not None:
+            fields.append(name or str(len(fields)))
+    return tuple(sorted(fields))
+
+
+class Catalog:
+    """編譯後的訊息目錄"""
+    
+    def __init__(self, messages: Dict[str, Dict[str, str]], languages: Tuple[str, ...] = LANGUAGES,
+                 default: str = DEFAULT_LANGUAGE):
+        problems = self.validate(messages, languages)
+        if problems:
+            raise CatalogError('訊息目錄有誤：\n' + '\n'.join(problems))
+        self.languages = languages
+        self._tables = {lang: dict(messages[lang]) for lang in languages}
+        self._default = self._tables[default]
+    
+    @staticmethod
+    def validate(messages: Dict[str, Dict[str, str]], languages: Tuple[str, ...] = LANGUAGES) -> List[str]:
+        """回傳所有問題 (缺少語言、缺少 key、參數不一致)"""
+        problems = [f'缺少語言 {lang}' for lang in languages if lang not in messages]
+        keys = sorted({key for lang in languages for key in messages.get(lang, {})})
+        for key in keys:
+            fields = {}
+            for lang in languages:
+                text = messages.get(lang, {}).get(key)
+                if text is None:
+                    problems.append(f'{lang} 缺少 {key}')
+                else:
+                    fields[lang] = _fields(text)
+            if len(set(fields.values())) > 1:
+                problems.append(f'{key} 各語言參數不一致：{fields}')
+        return problems
+    
+    def get(self, key: str, lang: str = DEFAULT_LANGUAGE, *args) -> str:
+        """取得訊息 ({} 依序代入 args)，不支援的語言以中文顯示，未知的 key 原樣回傳"""
+        text = self._tables.get(lang, self._default).get(key, key)
+        if args:
+            return text.format(*args)
+        return text
+    
+    def format(self, key: str, lang: str = DEFAULT_LANGUAGE, **fields) -> str:
+        """取得有具名參數 ({route} 等) 的訊息"""
+        return self._tables.get(lang, self._default).get(key, key).format(**fields)
+    
+    def table(self, lang: str) -> Dict[str, str]:
+        """某語言的完整字串表"""
+        return self._tables.get(lang, self._default)
+
+
+class StaticMessages:
+    """每種語言只建立一次的固定訊息 (LINE 訊息物件只讀，可在多個回覆間共用)"""
+    
+    def __init__(self, languages: Tuple[str, ...] = LANGUAGES, default: str = DEFAULT_LANGUAGE):
+        self.languages = languages
+        self.default = default
+        self._builders: Dict[str, Callable] = {}
+        self._built: Dict[Tuple[str, str], object] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.builds = 0
+    
+    def register(self, build: Callable[[str], object]) -> Callable[[str], object]:
+        """裝飾器：build(lang) 的結果依語言保存，原函式可由 __wrapped__ 取得"""
+        name = build.__name__
+        self._builders[name] = build
+        
+        @functools.wraps(build)
+        def get(lang: str = self.default):
+            key = (name, lang if lang in self.languages else self.default)
+            message = self._built.get(key)
+            if message is None:
+                with self._lock:
+                    message = self._built.get(key)
+                    if message is None:
+                        message = self._built[key] = build(key[1])
+                        self.builds += 1
+            else:
+                self.hits += 1
+            return message
+        return get
+    
+    def prebuild(self):
+        """預先建立所有語言的固定訊息 (需要載入 LINE SDK，適合在背景執行)"""
+        for name, build in self._builders.items():
+            for lang in self.languages:
+                key = (name, lang)
+                if key not in self._built:
+                    with self._lock:
+                        if key not in self._built:
+                            self._built[key] = build(lang)
+                            self.builds += 1
+    
+    def stats(self) -> Dict:
+        return {
+            'messages': len(self._built),
+            'hits': self.hits,
+            'builds': self.builds
+        }
+
+
+CATALOG = Catalog(MESSAGES)
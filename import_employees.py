@@ -0,0 +1,246 @@
+"""員工資料批次匯入
+
+讀取人資系統匯出的 CSV 或 JSONL (一行一筆 JSON)，逐行檢查後每 CHUNK_SIZE 筆
+以 storage.employees.upsert_many 寫入 (一個交易)，檔案再大也不會整份載入記憶體。
+經由 Storage 寫入，SQLite 與 PostgreSQL (DATABASE_URL) 後端都適用。
+
+欄位：employee_id (IGA1-xxxxx)、name、dept_code、shift_type (day/night)，
+      選填 preferred_language (zh/en/vi，只在新增員工時使用) 與 status (active/inactive)
+
+已存在的員工只有資料不同時才會更新；指定 --deactivate-missing 時，
+檔案中沒有出現的在職員工會被標記為 inactive (視為完整名冊)。
+
+命令列：python import_employees.py 員工.csv [--format csv|jsonl] [--deactivate-missing]
+"""
+import re
+import sys
+import csv
+import json
+import argparse
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from database import DatabaseManager
+
+CHUNK_SIZE = 500
+EMPLOYEE_ID_PATTERN = re.compile(r'^IGA1-\d{5}$')
+SHIFT_TYPES = {'day': 'day', 'night': 'night', '日班': 'day', '夜班': 'night'}
+LANGUAGES = ('zh', 'en', 'vi')
+STATUSES = ('active', 'inactive')
+# 錯誤訊息最多保留幾筆
+MAX_ERRORS = 20
+
+UPSERT_SQL = '''
+    INSERT INTO employees (employee_id, name, department_id, shift_type, preferred_language, status)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (employee_id) DO UPDATE SET
+        name = excluded.name,
+        department_id = excluded.department_id,
+        shift_type = excluded.shift_type,
+        status = excluded.status,
+        updated_at = CURRENT_TIMESTAMP
+'''
+
+
+class RowError(ValueError):
+    """單筆資料格式錯誤"""
+
+
+def read_rows(path: str, fmt: Optional[str] = None) -> Iterator[Tuple[int, Dict]]:
+    """逐行讀取檔案，產生 (行號, 欄位) ；path 為 - 時讀取標準輸入"""
+    fmt = fmt or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+    f = sys.stdin if path == '-' else open(path, encoding='utf-8-sig', newline='')
+    try:
+        if fmt == 'jsonl':
+            for line_no, line in enumerate(f, 1):
+                if line.strip():
+                    try:
+                        yield line_no, json.loads(line)
+                    except ValueError:
+                        yield line_no, None
+        else:
+            # 第 1 行為標題
+            for line_no, row in enumerate(csv.DictReader(f), 2):
+                yield line_no, row
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def validate_row(row: Optional[Dict], departments: Dict[str, int]) -> Tuple:
+    """檢查並轉成寫入用的 tuple，格式錯誤時丟出 RowError"""
+    if not isinstance(row, dict):
+        raise RowError('無法解析')
+
+    employee_id = str(row.get('employee_id') or '').strip().upper()
+    if not EMPLOYEE_ID_PATTERN.match(employee_id):
+        raise RowError(f'員工編號格式錯誤：{employee_id or "(空白)"}')
+
+    name = str(row.get('name') or '').strip()
+    if not name:
+        raise RowError(f'{employee_id} 缺少姓名')
+
+    dept_code = str(row.get('dept_code') or '').strip().upper()
+    department_id = departments.get(dept_code) if dept_code else None
+    if dept_code and department_id is None:
+        raise RowError(f'{employee_id} 部門代碼不存在：{dept_code}')
+
+    shift_type = SHIFT_TYPES.get(str(row.get('shift_type') or '').strip().lower())
+    if shift_type is None:
+        raise RowError(f'{employee_id} 班別錯誤：{row.get("shift_type")}')
+
+    language = str(row.get('preferred_language') or 'zh').strip().lower()
+    if language not in LANGUAGES:
+        raise RowError(f'{employee_id} 語言錯誤：{language}')
+
+    status = str(row.get('status') or 'active').strip().lower()
+    if status not in STATUSES:
+        raise RowError(f'{employee_id} 狀態錯誤：{status}')
+
+    return (employee_id, name, department_id, shift_type, language, status)
+
+
+def _chunks(rows: Iterable, size: int) -> Iterator[List]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def classify_changes(records: Dict[str, Tuple], existing: Dict[str, Tuple]) -> Tuple[List[Tuple], Dict[str, int]]:
+    """比對一批資料與資料庫中的員工 (employee_id -> (name, department_id, shift_type, status))
+
+    回傳 (需要寫入的資料, 各類筆數)，兩個後端的 upsert_many 共用
+    """
+    counts = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'deactivated': 0}
+    changed = []
+    for employee_id, record in records.items():
+        current = existing.get(employee_id)
+        if current is None:
+            counts['inserted'] += 1
+        elif current == (record[1], record[2], record[3], record[5]):
+            counts['unchanged'] += 1
+            continue
+        elif current[3] == 'active' and record[5] == 'inactive':
+            counts['deactivated'] += 1
+        else:
+            counts['updated'] += 1
+        changed.append(record)
+    return changed, counts
+
+
+def upsert_employees(conn, chunk: List[Tuple]) -> Dict[str, int]:
+    """SQLite：寫入一批資料 (一個交易)，並依原本的資料分類計數"""
+    # 同一批內重複的員工編號以最後一筆為準
+    records = {record[0]: record for record in chunk}
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        placeholders = ','.join('?' * len(records))
+        cursor.execute(f'''
+            SELECT employee_id, name, department_id, shift_type, status
+            FROM employees WHERE employee_id IN ({placeholders})
+        ''', list(records))
+        changed, counts = classify_changes(records, {row[0]: row[1:] for row in cursor.fetchall()})
+        if changed:
+            cursor.executemany(UPSERT_SQL, changed)
+        conn.commit()
+        return counts
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def deactivate_missing_employees(conn, employee_ids: Iterable[str]) -> int:
+    """SQLite：停用名冊外的在職員工 (一個交易)，回傳停用筆數"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute('CREATE TEMP TABLE IF NOT EXISTS import_seen (employee_id TEXT PRIMARY KEY)')
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('DELETE FROM temp.import_seen')
+        cursor.executemany('INSERT OR IGNORE INTO temp.import_seen (employee_id) VALUES (?)',
+                           [(employee_id,) for employee_id in employee_ids])
+        cursor.execute('''
+            UPDATE employees SET status = 'inactive', updated_at = CURRENT_TIMESTAMP
+            WHERE status = 'active'
+              AND employee_id NOT IN (SELECT employee_id FROM temp.import_seen)
+        ''')
+        deactivated = cursor.rowcount
+        cursor.execute('DELETE FROM temp.import_seen')
+        conn.commit()
+        return deactivated
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def import_employees(storage, rows: Iterable[Tuple[int, Dict]],
+                     deactivate_missing: bool = False, chunk_size: int = CHUNK_SIZE) -> Dict:
+    """匯入員工資料 (storage 為 repository.Storage)，回傳各類筆數與錯誤訊息
+
+    rows 為 (行號, 欄位) 的序列，通常來自 read_rows()
+    """
+    result = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'deactivated': 0, 'rejected': 0, 'errors': []}
+
+    def valid_rows(departments: Dict[str, int]) -> Iterator[Tuple]:
+        for line_no, row in rows:
+            try:
+                yield validate_row(row, departments)
+            except RowError as e:
+                result['rejected'] += 1
+                if len(result['errors']) < MAX_ERRORS:
+                    result['errors'].append(f'第 {line_no} 行：{e}')
+
+    employees = storage.employees
+    # 完整名冊時記下出現過的員工編號 (只有編號，名冊再大也只佔少量記憶體)
+    seen: Set[str] = set()
+    for chunk in _chunks(valid_rows(employees.department_ids()), chunk_size):
+        for key, count in employees.upsert_many(chunk).items():
+            result[key] += count
+        if deactivate_missing:
+            seen.update(record[0] for record in chunk)
+
+    if deactivate_missing:
+        if result['rejected']:
+            # 有資料沒讀進來時不能確定誰真的離職，避免誤停用
+            result['errors'].append('有格式錯誤的資料，略過停用名冊外員工')
+        else:
+            result['deactivated'] += employees.deactivate_missing(seen)
+
+    # 停用或改名的員工不能再沿用快取
+    employees.cache.clear()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批次匯入員工資料')
+    parser.add_argument('path', help='CSV 或 JSONL 檔案 (- 表示標準輸入)')
+    parser.add_argument('--format', choices=('csv', 'jsonl'), help='預設依副檔名判斷')
+    parser.add_argument('--deactivate-missing', action='store_true', help='檔案為完整名冊，停用未出現的員工')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    from logs import configure_logging
+    from repository import open_storage
+    configure_logging(fmt='text')
+    db = DatabaseManager()
+    storage = open_storage(db)
+    try:
+        result = import_employees(storage, read_rows(args.path, args.format),
+                                  deactivate_missing=args.deactivate_missing, chunk_size=args.chunk_size)
+    finally:
+        storage.close()
+        db.pool.close_all()
+
+    for error in result['errors']:
+        print(f"❌ {error}")
+    print(f"✅ 新增 {result['inserted']}，更新 {result['updated']}，未變動 {result['unchanged']}，"
+          f"停用 {result['deactivated']}，錯誤 {result['rejected']}")
+    sys.exit(1 if result['rejected'] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""廚房看板：各餐廳訂餐數
+
+訂單數由 booking.py 在訂餐/取消的交易中累加到 meal_counts，看板查詢只讀這張小表。
+reconcile_meal_counts 以原始訂單重新計算並比對，可排程執行確認計數沒有偏差
+(命令列經由 Storage 的 orders.reconcile_counts，PostgreSQL 後端也適用)。
+
+命令列：python kitchen.py [--date 2024-06-01 | --all] [--fix]
+"""
+import sys
+import argparse
+from datetime import date
+from typing import Dict, List, Optional
+
+from database import DatabaseManager
+from settings import taipei_today
+
+
+def kitchen_counts(conn, day: date, floor: Optional[str] = None) -> List[Dict]:
+    """指定日期各餐廳的有效訂單數 (依樓層排序)"""
+    sql = '''
+        SELECT r.id, r.floor, r.name_zh, r.name_en, r.name_vi, mc.ordered
+        FROM meal_counts mc
+        JOIN restaurants r ON r.id = mc.restaurant_id
+        WHERE mc.order_date = ? AND mc.ordered > 0
+    '''
+    params = [day]
+    if floor:
+        sql += ' AND r.floor = ?'
+        params.append(floor)
+    sql += ' ORDER BY r.floor, r.id'
+    return [{
+        'restaurant_id': row[0],
+        'floor': row[1],
+        'name_zh': row[2],
+        'name_en': row[3],
+        'name_vi': row[4],
+        'ordered': row[5],
+    } for row in conn.execute(sql, params).fetchall()]
+
+
+def reconcile_meal_counts(conn, day: Optional[date] = None, fix: bool = False) -> List[Dict]:
+    """比對 meal_counts 與實際有效訂單數，回傳不一致的項目；fix=True 時以實際數修正"""
+    counts_filter = 'WHERE order_date = ?' if day else ''
+    orders_filter = "WHERE order_date = ? AND status = 'active'" if day else "WHERE status = 'active'"
+    params = [day] if day else []
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE' if fix else 'BEGIN')
+        cursor.execute(f'''
+            SELECT order_date, restaurant_id, SUM(counted), SUM(actual) FROM (
+                SELECT order_date, restaurant_id, ordered AS counted, 0 AS actual
+                FROM meal_counts {counts_filter}
+                UNION ALL
+                SELECT order_date, restaurant_id, 0, COUNT(*)
+                FROM meal_orders {orders_filter}
+                GROUP BY order_date, restaurant_id
+            )
+            GROUP BY order_date, restaurant_id
+            HAVING SUM(counted) <> SUM(actual)
+            ORDER BY order_date, restaurant_id
+        ''', params + params)
+        mismatches = [{
+            'order_date': str(row[0]),
+            'restaurant_id': row[1],
+            'counted': row[2],
+            'actual': row[3],
+        } for row in cursor.fetchall()]
+
+        if fix and mismatches:
+            cursor.executemany('''
+                INSERT OR REPLACE INTO meal_counts (order_date, restaurant_id, ordered) VALUES (?, ?, ?)
+            ''', [(m['order_date'], m['restaurant_id'], m['actual']) for m in mismatches])
+        conn.commit()
+        return mismatches
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description='核對各餐廳訂餐數')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--date', type=date.fromisoformat, help='日期 (YYYY-MM-DD)，預設台北時間今天')
+    group.add_argument('--all', action='store_true', help='核對所有日期')
+    parser.add_argument('--fix', action='store_true', help='以實際訂單數修正不一致的計數')
+    args = parser.parse_args()
+
+    from logs import configure_logging
+    from repository import open_storage
+    configure_logging(fmt='text')
+    db = DatabaseManager()
+    storage = open_storage(db)
+    day = None if args.all else (args.date or taipei_today())
+    try:
+        mismatches = storage.orders.reconcile_counts(day, fix=args.fix)
+    finally:
+        storage.close()
+        db.pool.close_all()
+
+    if not mismatches:
+        print("✅ 訂餐數與訂單一致")
+        return
+    for m in mismatches:
+        print(f"⚠️ {m['order_date']} 餐廳 {m['restaurant_id']}: 計數 {m['counted']}，實際 {m['actual']}")
+    print(f"{'✅ 已修正' if args.fix else '❌ 發現'} {len(mismatches)} 筆不一致")
+    sys.exit(0 if args.fix else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""延遲載入大型模組
+
+LINE SDK 的 linebot.v3.messaging / linebot.v3.webhooks 一載入就會匯入上百個模型與 API 類別，
+約需 1 秒。以 LazyClass 代替類別名稱，第一次建立物件或做 isinstance 檢查時才真正 import，
+程序啟動時不必等待；warm_up 可在背景執行緒先行載入。
+
+SDK 套件之間互相 import，兩個執行緒同時載入可能觸發 Python 的模組鎖死結偵測 (_DeadlockError)，
+因此所有延遲載入都經過 import_module()，同一時間只有一個執行緒在匯入。
+"""
+import logging
+import importlib
+import threading
+from typing import Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_import_lock = threading.RLock()
+
+
+def import_module(name: str):
+    """依序匯入模組 (已載入時直接回傳)"""
+    with _import_lock:
+        return importlib.import_module(name)
+
+
+class LazyClass:
+    """第一次使用時才匯入的類別代理"""
+    
+    __slots__ = ('_module', '__name__', '_target')
+    
+    def __init__(self, module: str, name: str):
+        self._module = module
+        self.__name__ = name  # LINE SDK 以 __name__ 組 handler key，不需要真的載入
+        self._target = None
+    
+    def resolve(self) -> type:
+        """取得真正的類別 (必要時匯入模組)"""
+        target = self._target
+        if target is None:
+            target = self._target = getattr(import_module(self._module), self.__name__)
+        return target
+    
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+    
+    def __getattr__(self, attr: str):
+        return getattr(self.resolve(), attr)
+    
+    def __instancecheck__(self, obj) -> bool:
+        return isinstance(obj, self.resolve())
+    
+    def __repr__(self) -> str:
+        state = 'loaded' if self._target is not None else 'lazy'
+        return f'<LazyClass {self._module}.{self.__name__} ({state})>'
+
+
+def lazy_classes(module: str, *names: str) -> Tuple[LazyClass, ...]:
+    """一次建立同一模組的多個 LazyClass"""
+    return tuple(LazyClass(module, name) for name in names)
+
+
+def warm_up(*modules: str, then: Optional[Callable[[], None]] = None) -> threading.Thread:
+    """在背景執行緒預先匯入模組，讓第一個請求不必等待；then 於匯入後執行 (例如預先建立訊息)"""
+    def load():
+        for module in modules:
+            try:
+                import_module(module)
+            except Exception as e:
+                logger.warning("⚠️ 預先載入 %s 失敗: %s", module, e)
+        if then is not None:
+            try:
+                then()
+            except Exception as e:
+                logger.warning("⚠️ 預先載入後續工作失敗: %s", e)
+    
+    thread = threading.Thread(target=load, name='sdk-warm-up', daemon=True)
+    thread.start()
+    return thread
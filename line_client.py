@@ -0,0 +1,179 @@
+"""共用的 LINE Messaging API 用戶端
+
+整個程序共用一個 ApiClient，底層 urllib3 連線池會保留 keep-alive 連線，
+避免每次回覆都重新建立 TCP/TLS 連線。MessagingApi 可在多執行緒下共用。
+asyncio 版 (asgi.py) 則在事件迴圈內共用一個 AsyncApiClient (aiohttp 連線池)。
+linebot.v3.messaging 載入很慢，第一次需要時才匯入。
+"""
+import os
+import time
+import socket
+import threading
+from typing import List, Optional, Tuple
+
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
+
+from lazy_import import lazy_classes
+from metrics import Counter, Histogram
+
+Configuration, ApiClient, MessagingApi, ReplyMessageRequest, MulticastRequest = lazy_classes(
+    'linebot.v3.messaging', 'Configuration', 'ApiClient', 'MessagingApi', 'ReplyMessageRequest', 'MulticastRequest'
+)
+AsyncApiClient, AsyncMessagingApi = lazy_classes('linebot.v3.messaging', 'AsyncApiClient', 'AsyncMessagingApi')
+
+LINE_REPLY_SECONDS = Histogram('linebot_line_reply_seconds', '呼叫 LINE reply API 的時間')
+LINE_REPLY_TOTAL = Counter('linebot_line_reply_total', '呼叫 LINE reply API 的次數', ['result'])
+LINE_MULTICAST_SECONDS = Histogram('linebot_line_multicast_seconds', '呼叫 LINE multicast API 的時間')
+LINE_MULTICAST_TOTAL = Counter('linebot_line_multicast_total', '呼叫 LINE multicast API 的次數', ['result'])
+
+
+def make_configuration(access_token: Optional[str] = None, host: Optional[str] = None,
+                       pool_maxsize: Optional[int] = None) -> 'Configuration':
+    """建立調校過連線池的 LINE SDK 設定 (LINE_API_HOST 可指向本機模擬伺服器)"""
+    configuration = Configuration(
+        host=host or os.getenv('LINE_API_HOST') or None,
+        access_token=access_token or os.getenv('CHANNEL_ACCESS_TOKEN')
+    )
+    configuration.connection_pool_maxsize = pool_maxsize or int(os.getenv('LINE_POOL_MAXSIZE', '20'))
+    # 只重試連線失敗；reply token 只能用一次，讀取逾時不可重送
+    configuration.retries = Retry(total=2, connect=2, read=0, status=0, other=0, redirect=0)
+    configuration.socket_options = HTTPConnection.default_socket_options + [
+        (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    ]
+    return configuration
+
+
+class LineApiHolder:
+    """程序內共用、執行緒安全的 MessagingApi
+    
+    未指定 configuration 時，第一次使用才以 make_configuration() 建立 (連同載入 SDK)。
+    """
+    
+    def __init__(self, configuration=None, timeout: Optional[Tuple[float, float]] = None):
+        self.configuration = configuration
+        # (連線逾時, 讀取逾時) 秒
+        self.timeout = timeout or (
+            float(os.getenv('LINE_CONNECT_TIMEOUT', '3')),
+            float(os.getenv('LINE_READ_TIMEOUT', '10'))
+        )
+        self._lock = threading.Lock()
+        self._api_client = None
+        self._messaging_api = None
+    
+    def get(self) -> 'MessagingApi':
+        """取得共用的 MessagingApi，第一次使用時才建立"""
+        api = self._messaging_api
+        if api is None:
+            with self._lock:
+                if self._messaging_api is None:
+                    if self.configuration is None:
+                        self.configuration = make_configuration()
+                    self._api_client = ApiClient(self.configuration)
+                    self._messaging_api = MessagingApi(self._api_client)
+                api = self._messaging_api
+        return api
+    
+    def reply(self, reply_token: str, messages: List):
+        """以共用連線送出回覆訊息"""
+        api = self.get()
+        start = time.perf_counter()
+        try:
+            response = api.reply_message_with_http_info(
+                ReplyMessageRequest(reply_token=reply_token, messages=messages),
+                _request_timeout=self.timeout
+            )
+        except Exception:
+            LINE_REPLY_TOTAL.labels('error').inc()
+            raise
+        finally:
+            LINE_REPLY_SECONDS.observe(time.perf_counter() - start)
+        LINE_REPLY_TOTAL.labels('ok').inc()
+        return response
+    
+    def multicast(self, to: List[str], messages: List, retry_key: Optional[str] = None):
+        """同一則訊息送給多位使用者 (最多 500 位)；帶相同 retry_key 重送時 LINE 不會重複發送"""
+        api = self.get()
+        start = time.perf_counter()
+        try:
+            response = api.multicast_with_http_info(
+                MulticastRequest(to=to, messages=messages),
+                x_line_retry_key=retry_key,
+                _request_timeout=self.timeout
+            )
+        except Exception:
+            LINE_MULTICAST_TOTAL.labels('error').inc()
+            raise
+        finally:
+            LINE_MULTICAST_SECONDS.observe(time.perf_counter() - start)
+        LINE_MULTICAST_TOTAL.labels('ok').inc()
+        return response
+    
+    def close(self):
+        """關閉連線池 (程序結束或測試清理時使用)"""
+        with self._lock:
+            if self._api_client is not None:
+                self._api_client.rest_client.pool_manager.clear()
+                self._api_client.close()
+            self._api_client = None
+            self._messaging_api = None
+
+
+class AsyncLineApiHolder:
+    """事件迴圈內共用的 AsyncMessagingApi
+    
+    aiohttp 的連線池綁定建立時的事件迴圈，所以第一次在迴圈中使用時才建立，
+    並在同一個迴圈結束前呼叫 close()。
+    """
+    
+    def __init__(self, configuration=None, timeout: Optional[Tuple[float, float]] = None,
+                 pool_maxsize: Optional[int] = None):
+        self.configuration = configuration
+        # (連線逾時, 讀取逾時) 秒
+        self.timeout = timeout or (
+            float(os.getenv('LINE_CONNECT_TIMEOUT', '3')),
+            float(os.getenv('LINE_READ_TIMEOUT', '10'))
+        )
+        # 同時送往 LINE 的請求上限；不必像執行緒版受限於執行緒數，可以設得比較大
+        self.pool_maxsize = pool_maxsize or int(os.getenv('LINE_ASYNC_POOL_MAXSIZE', '100'))
+        self._api_client = None
+        self._messaging_api = None
+        self._request_timeout = None
+    
+    def get(self) -> 'AsyncMessagingApi':
+        """取得共用的 AsyncMessagingApi (只在事件迴圈的執行緒呼叫，不需要鎖)"""
+        if self._messaging_api is None:
+            import aiohttp  # SDK 的 async 用戶端本身就依賴 aiohttp
+            
+            if self.configuration is None:
+                self.configuration = make_configuration(pool_maxsize=self.pool_maxsize)
+            self._api_client = AsyncApiClient(self.configuration)
+            self._messaging_api = AsyncMessagingApi(self._api_client)
+            # SDK 直接把 _request_timeout 交給 aiohttp，不接受 (連線, 讀取) tuple
+            connect, read = self.timeout
+            self._request_timeout = aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+        return self._messaging_api
+    
+    async def reply(self, reply_token: str, messages: List):
+        """送出回覆訊息，等待 LINE 回應時不佔用執行緒"""
+        api = self.get()
+        start = time.perf_counter()
+        try:
+            response = await api.reply_message_with_http_info(
+                ReplyMessageRequest(reply_token=reply_token, messages=messages),
+                _request_timeout=self._request_timeout
+            )
+        except Exception:
+            LINE_REPLY_TOTAL.labels('error').inc()
+            raise
+        finally:
+            LINE_REPLY_SECONDS.observe(time.perf_counter() - start)
+        LINE_REPLY_TOTAL.labels('ok').inc()
+        return response
+    
+    async def close(self):
+        """關閉 aiohttp 連線池"""
+        if self._api_client is not None:
+            await self._api_client.close()
+        self._api_client = None
+        self._messaging_api = None
@@ -0,0 +1,270 @@
+"""結構化日誌
+
+每筆日誌輸出成一行 JSON (LOG_FORMAT=text 改為一般文字)，並帶上目前的 request_id / event_id
+(以 log_context() 設定，跨執行緒時需自行傳遞 contextvars)。
+
+寫出不在請求執行緒進行：QueueHandler 只合併訊息參數後放進有界佇列，由背景的 QueueListener
+格式化並寫到 stderr。stderr 被管線塞住或寫得很慢時 webhook 也不會跟著等待；
+佇列滿時直接丟棄該筆並計入 linebot_log_dropped_total。
+
+webhook 內容含 LINE user ID 與使用者輸入的文字 (員工編號等)，不記錄原文：WebhookBody 在背景執行緒
+才解析，只留下事件類型、webhookEventId、postback data 與文字長度，user ID 以雜湊代替。
+LOG_WEBHOOK_SAMPLE 為記錄比例 (預設 0.01 只記錄約 1% 的 webhook，1 為全部記錄，0 為不記錄)。
+"""
+import os
+import sys
+import copy
+import json
+import uuid
+import queue
+import atexit
+import random
+import hashlib
+import logging
+import logging.handlers
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from metrics import Counter
+
+LOG_DROPPED = Counter('linebot_log_dropped_total', '日誌佇列已滿而丟棄的紀錄數')
+
+_context: contextvars.ContextVar = contextvars.ContextVar('log_context', default={})
+
+# LogRecord 本身的屬性，其餘屬性 (extra=... 與 log_context 的欄位) 才輸出
+_RECORD_ATTRS = set(logging.makeLogRecord({}).__dict__) | {'message', 'asctime', 'taskName'}
+
+
+@contextmanager
+def log_context(**fields):
+    """區塊內的日誌都帶上這些欄位 (例如 request_id、event_id)"""
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def bind_log_context(**fields) -> contextvars.Token:
+    """不使用 with 區塊時設定欄位，結束時以 unbind_log_context(token) 還原"""
+    return _context.set({**_context.get(), **fields})
+
+
+def unbind_log_context(token: contextvars.Token):
+    _context.reset(token)
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def pseudonym(value: Optional[str]) -> Optional[str]:
+    """LINE user ID 等識別碼的雜湊 (同一個值結果相同，可用來串起同一位使用者的紀錄)"""
+    if not value:
+        return value
+    return hashlib.blake2b(value.encode('utf-8'), digest_size=6).hexdigest()
+
+
+def webhook_summary(body: str) -> Dict:
+    """去除個資的 webhook 摘要"""
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return {'bytes': len(body), 'invalid_json': True}
+    events = []
+    for event in payload.get('events') or []:
+        item = {
+            'type': event.get('type'),
+            'id': event.get('webhookEventId'),
+            'user': pseudonym((event.get('source') or {}).get('userId')),
+            'redelivery': (event.get('deliveryContext') or {}).get('isRedelivery'),
+        }
+        message = event.get('message')
+        if message:
+            item['message'] = message.get('type')
+            if 'text' in message:
+                item['text_len'] = len(message['text'])
+        postback = event.get('postback')
+        if postback:
+            item['postback'] = postback.get('data')
+        events.append(item)
+    return {'bytes': len(body), 'events': events}
+
+
+class WebhookBody:
+    """延後到寫出時才解析的 webhook 內容，輸出時只會變成 webhook_summary()"""
+
+    __slots__ = ('body',)
+
+    def __init__(self, body: str):
+        self.body = body
+
+    def to_log(self) -> Dict:
+        return webhook_summary(self.body)
+
+    def __str__(self) -> str:
+        return json.dumps(self.to_log(), ensure_ascii=False)
+
+    __repr__ = __str__
+
+
+DEFAULT_WEBHOOK_SAMPLE = '0.01'
+_webhook_sample = float(os.getenv('LOG_WEBHOOK_SAMPLE', DEFAULT_WEBHOOK_SAMPLE))
+
+
+def should_log_webhook(rate: Optional[float] = None) -> bool:
+    """這次 webhook 是否記錄 (rate 預設為 configure_logging 時的 LOG_WEBHOOK_SAMPLE)"""
+    rate = _webhook_sample if rate is None else rate
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+def _json_default(value):
+    to_log = getattr(value, 'to_log', None)
+    return to_log() if to_log else str(value)
+
+
+def _extra_fields(record: logging.LogRecord) -> Dict:
+    return {key: value for key, value in record.__dict__.items()
+            if key not in _RECORD_ATTRS and not key.startswith('_')}
+
+
+class JsonFormatter(logging.Formatter):
+    """一筆紀錄一行 JSON：ts、level、logger、msg，加上 context 與 extra 欄位"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        entry.update(_extra_fields(record))
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=_json_default)
+
+
+class TextFormatter(logging.Formatter):
+    """一般文字格式 (命令列工具與本機開發)，context 與 extra 欄位接在訊息後面"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        fields = _extra_fields(record)
+        if fields:
+            text += ' ' + ' '.join(f'{key}={value}' for key, value in fields.items())
+        return text
+
+
+class ContextFilter(logging.Filter):
+    """把目前的 log_context 欄位寫進紀錄 (在產生紀錄的執行緒執行)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for key, value in _context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """放進有界佇列就返回，佇列滿時丟棄"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.addFilter(ContextFilter())
+        self._exc_formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 請求執行緒只合併訊息參數、把例外轉成文字 (traceback 不能跨執行緒保留)，JSON 格式化交給背景執行緒。
+        # 合併參數不影響其他 handler 的輸出，直接修改；有例外時才複製，其他 handler 仍看得到 exc_info
+        if record.exc_info:
+            record = copy.copy(record)
+            record.exc_text = self._exc_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_DROPPED.inc()
+
+
+class LogListener(logging.handlers.QueueListener):
+    """背景寫出的執行緒；佇列已滿時 stop() 等待空位放入結束標記 (原版會拋出 queue.Full)"""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+class StderrHandler(logging.StreamHandler):
+    """每次寫出時才取 sys.stderr (測試或工具替換 stderr 後仍寫到目前的位置)"""
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+
+    @property
+    def stream(self):
+        return sys.stderr
+
+
+_listener: Optional[LogListener] = None
+_handler: Optional[NonBlockingQueueHandler] = None
+_options: Dict = {}
+
+
+def configure_logging(level: Optional[str] = None, fmt: Optional[str] = None,
+                      queue_size: Optional[int] = None, stream=None) -> LogListener:
+    """root logger 改由背景執行緒寫出 (重複呼叫時取代前一次的設定)
+
+    level 預設 LOG_LEVEL (INFO)，fmt 為 'json' (預設，LOG_FORMAT) 或 'text'，
+    queue_size 預設 LOG_QUEUE_SIZE (10000)，stream 預設 stderr。
+    """
+    global _listener, _handler, _options, _webhook_sample
+    stop_logging()
+    _options = {'level': level, 'fmt': fmt, 'queue_size': queue_size, 'stream': stream}
+    _webhook_sample = float(os.getenv('LOG_WEBHOOK_SAMPLE', DEFAULT_WEBHOOK_SAMPLE))
+    fmt = fmt or os.getenv('LOG_FORMAT', 'json')
+    output = logging.StreamHandler(stream) if stream is not None else StderrHandler()
+    output.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+
+    log_queue = queue.Queue(maxsize=queue_size or int(os.getenv('LOG_QUEUE_SIZE', '10000')))
+    root = logging.getLogger()
+    if _handler is not None:
+        root.removeHandler(_handler)
+    _handler = NonBlockingQueueHandler(log_queue)
+    root.addHandler(_handler)
+    root.setLevel(level or os.getenv('LOG_LEVEL', 'INFO'))
+
+    _listener = LogListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """寫完佇列中剩下的紀錄並停止背景執行緒"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _after_fork_in_child():
+    # 背景執行緒不會跟著 fork，佇列的鎖也可能停在父程序的狀態：子程序重新建立一份
+    global _listener
+    if _listener is not None:
+        _listener = None
+        configure_logging(**_options)
+
+
+atexit.register(stop_logging)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
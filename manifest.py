@@ -0,0 +1,184 @@
+"""交通車乘客名單匯出
+
+依日期 (可再指定路線、班次) 列出每個班次的乘客，供調度人員使用。
+資料經由 Storage 的 reservations (repository.py) 讀取，SQLite 與 PostgreSQL 後端都適用。
+乘客資料以游標分批讀取、逐行產生 CSV / JSON，不會把整天的名單放進記憶體；
+各班次人數直接取自 bus_seat_counters，不必另外 COUNT(*)。
+
+命令列：python manifest.py [--date 2024-06-01] [--route A] [--schedule 3] [--format csv|json] [-o 檔案]
+"""
+import io
+import sys
+import csv
+import json
+import argparse
+from datetime import date
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from database import DatabaseManager
+from settings import taipei_today
+
+# 每次從游標取出的筆數
+FETCH_SIZE = 500
+
+CSV_COLUMNS = [
+    'route_code', 'route_name', 'schedule_id', 'shift_type', 'departure_time', 'schedule_name',
+    'headcount', 'employee_id', 'name', 'department', 'reserved_at',
+]
+
+HEADCOUNT_SQL = '''
+    SELECT bs.id, br.route_code, br.route_name_zh, bs.shift_type, bs.departure_time,
+           bs.schedule_name_zh, bs.seat_limit, COALESCE(c.booked, 0)
+    FROM bus_schedules bs
+    JOIN bus_routes br ON bs.route_id = br.id
+    LEFT JOIN bus_seat_counters c ON c.schedule_id = bs.id AND c.reservation_date = ?
+    WHERE (bs.is_active = TRUE OR c.booked > 0) {filters}
+    ORDER BY br.route_code, bs.departure_time, bs.id
+'''
+
+# 依 (日期, 班次, 員工) 索引順序讀取，不需要額外排序
+PASSENGER_SQL = '''
+    SELECT bresv.schedule_id, e.employee_id, e.name, d.dept_name_zh, bresv.reserved_at
+    FROM bus_reservations bresv
+    JOIN bus_schedules bs ON bresv.schedule_id = bs.id
+    JOIN bus_routes br ON bs.route_id = br.id
+    JOIN employees e ON bresv.employee_id = e.id
+    LEFT JOIN departments d ON e.department_id = d.id
+    WHERE bresv.reservation_date = ? AND bresv.status = 'active' {filters}
+    ORDER BY bresv.schedule_id, bresv.employee_id
+'''
+
+
+def _filters(route_code: Optional[str], schedule_id: Optional[int]):
+    clauses, params = [], []
+    if route_code:
+        clauses.append('AND br.route_code = ?')
+        params.append(route_code)
+    if schedule_id is not None:
+        clauses.append('AND bs.id = ?')
+        params.append(schedule_id)
+    return ' '.join(clauses), params
+
+
+def headcounts(conn, day: date, route_code: Optional[str] = None,
+               schedule_id: Optional[int] = None) -> List[Dict]:
+    """各班次當天的預約人數 (含尚無人預約的啟用中班次)"""
+    filters, params = _filters(route_code, schedule_id)
+    rows = conn.execute(HEADCOUNT_SQL.format(filters=filters), [day] + params).fetchall()
+    return [{
+        'schedule_id': row[0],
+        'route_code': row[1],
+        'route_name': row[2],
+        'shift_type': row[3],
+        'departure_time': str(row[4]),
+        'schedule_name': row[5],
+        'seat_limit': row[6],
+        'headcount': row[7],
+    } for row in rows]
+
+
+def passenger_rows(conn, day: date, route_code: Optional[str] = None,
+                   schedule_id: Optional[int] = None) -> Iterator[Tuple]:
+    """分批讀取乘客：(班次 id, 員工編號, 姓名, 部門, 預約時間)，依班次、員工排序"""
+    filters, params = _filters(route_code, schedule_id)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(PASSENGER_SQL.format(filters=filters), [day] + params)
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cursor.close()
+
+
+def iter_passengers(rows: Iterator[Tuple], schedules: Dict[int, Dict]) -> Iterator[Dict]:
+    """逐筆產生乘客資料，附上所屬班次的資訊"""
+    for schedule, employee_code, name, department, reserved_at in rows:
+        info = schedules.get(schedule, {})
+        yield {
+            'route_code': info.get('route_code'),
+            'route_name': info.get('route_name'),
+            'schedule_id': schedule,
+            'shift_type': info.get('shift_type'),
+            'departure_time': info.get('departure_time'),
+            'schedule_name': info.get('schedule_name'),
+            'headcount': info.get('headcount'),
+            'employee_id': employee_code,
+            'name': name,
+            'department': department,
+            'reserved_at': str(reserved_at) if reserved_at is not None else None,
+        }
+
+
+def stream_manifest(storage, day: date, fmt: str = 'csv', route_code: Optional[str] = None,
+                    schedule_id: Optional[int] = None) -> Iterator[str]:
+    """產生名單內容的文字片段，連線在產生完畢 (或中途停止) 時歸還連線池"""
+    reservations = storage.reservations
+    counts = reservations.headcounts(day, route_code, schedule_id)
+    schedules = {item['schedule_id']: item for item in counts}
+    rows = reservations.passengers(day, route_code, schedule_id)
+    try:
+        passengers = iter_passengers(rows, schedules)
+        if fmt == 'json':
+            yield from _json_chunks(day, counts, passengers)
+        else:
+            yield from _csv_chunks(passengers)
+    finally:
+        rows.close()
+
+
+def _csv_chunks(passengers: Iterator[Dict]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_COLUMNS)
+    writer.writeheader()
+    count = 0
+    for row in passengers:
+        writer.writerow(row)
+        count += 1
+        if count % FETCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _json_chunks(day: date, counts: List[Dict], passengers: Iterator[Dict]) -> Iterator[str]:
+    yield '{"date": %s, "headcounts": %s, "passengers": [' % (
+        json.dumps(day.isoformat()), json.dumps(counts, ensure_ascii=False))
+    separator = '\n'
+    for row in passengers:
+        yield separator + json.dumps(row, ensure_ascii=False)
+        separator = ',\n'
+    yield '\n]}\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='匯出交通車乘客名單')
+    parser.add_argument('--date', type=date.fromisoformat, help='日期 (YYYY-MM-DD)，預設台北時間今天')
+    parser.add_argument('--route', help='路線代碼')
+    parser.add_argument('--schedule', type=int, help='班次 ID')
+    parser.add_argument('--format', choices=('csv', 'json'), default='csv')
+    parser.add_argument('-o', '--output', help='輸出檔案，預設輸出到螢幕')
+    args = parser.parse_args()
+
+    # 日誌寫到 stderr，不會混進輸出的名單
+    from logs import configure_logging
+    from repository import open_storage
+    configure_logging(fmt='text')
+    db = DatabaseManager()
+    storage = open_storage(db)
+    out = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    try:
+        for chunk in stream_manifest(storage, args.date or taipei_today(), args.format, args.route, args.schedule):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+        storage.close()
+        db.pool.close_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""行程內的 Prometheus 指標
+
+Counter / Gauge / Histogram 皆在本程序內累計，/metrics 以 Prometheus 文字格式輸出。
+每個標籤組合各自持有一把小鎖，記錄時只做幾個加法；
+收集 (scrape) 時逐一複製數值，不會擋住處理事件的執行緒太久。
+
+數值只屬於目前這個程序：gunicorn 有多個 worker 時，每次 scrape 只會拿到其中一個 worker 的數值。
+因此每筆數值都帶上 pid 標籤 (METRICS_WORKER_LABEL 可改名，設為空字串則不加)，
+各 worker 成為各自的時間序列，計數器不會因為換到另一個 worker 而看似歸零；
+彙總時以 sum without (pid) 加總，要完整數值請讓每個 worker 各自被 scrape。
+"""
+import os
+import abc
+import time
+import bisect
+import inspect
+import threading
+from contextlib import ContextDecorator
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# 預設時間區間 (秒)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Tuple = ()) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Registry:
+    """指標註冊表，worker_label 為標示程序的標籤名稱 (None 則不加)"""
+    
+    def __init__(self, worker_label: Optional[str] = None):
+        self.worker_label = worker_label
+        self._metrics: List = []
+        self._names = set()
+        self._lock = threading.Lock()
+    
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._names:
+                raise ValueError(f'重複的指標名稱：{metric.name}')
+            self._names.add(metric.name)
+            self._metrics.append(metric)
+        return metric
+    
+    def render(self) -> str:
+        """輸出 Prometheus 文字格式"""
+        with self._lock:
+            metrics = list(self._metrics)
+        # fork 後的 worker 各自取得自己的 pid
+        const = ((self.worker_label, str(os.getpid())),) if self.worker_label else ()
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.collect(const))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry(worker_label=os.getenv('METRICS_WORKER_LABEL', 'pid') or None)
+
+
+class _Metric(abc.ABC):
+    type = 'untyped'
+    
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), registry: Optional[Registry] = REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple, object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+        if registry is not None:
+            registry.register(self)
+    
+    @abc.abstractmethod
+    def _new_child(self):
+        """建立一組標籤值的子指標"""
+    
+    @abc.abstractmethod
+    def collect(self, const: Tuple = ()) -> List[str]:
+        """輸出各組標籤的數值，const 為每筆都要加上的 (標籤, 值)"""
+    
+    def labels(self, *values):
+        """取得某組標籤值的子指標 (可保留下來重複使用)"""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f'{self.name} 需要標籤 {self.labelnames}')
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+    
+    def _items(self):
+        with self._lock:
+            return sorted(self._children.items())
+
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+    
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+    
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    """只增不減的計數器"""
+    type = 'counter'
+    
+    def _new_child(self):
+        return _CounterChild()
+    
+    def inc(self, amount: float = 1.0):
+        self._children[()].inc(amount)
+    
+    def collect(self, const: Tuple = ()) -> List[str]:
+        return [f'{self.name}{_format_labels(self.labelnames, key, const)} {_format_value(child.value)}'
+                for key, child in self._items()]
+
+
+class _Timer(ContextDecorator):
+    """記錄區塊或函式執行時間的計時器"""
+    
+    def __init__(self, child: '_HistogramChild'):
+        self.child = child
+        self._starts = threading.local()
+    
+    def __enter__(self):
+        stack = getattr(self._starts, 'stack', None)
+        if stack is None:
+            stack = self._starts.stack = []
+        stack.append(time.perf_counter())
+        return self
+    
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self._starts.stack.pop())
+        return False
+    
+    def __call__(self, func):
+        wrapped = super().__call__(func)
+        # 保留原函式簽章：line-bot-sdk 依 getfullargspec 的參數數量決定怎麼呼叫 handler
+        wrapped.__signature__ = inspect.signature(func)
+        return wrapped
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', 'count', '_lock')
+    
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+    
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+    
+    def time(self) -> '_Timer':
+        """計時器，可當 with 區塊或函式裝飾器使用"""
+        return _Timer(self)
+    
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        """(各區間筆數, 總和, 筆數)"""
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+class Histogram(_Metric):
+    """數值分布 (通常為處理時間，單位秒)"""
+    type = 'histogram'
+    
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: Optional[Registry] = REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames, registry)
+    
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+    
+    def observe(self, value: float):
+        self._children[()].observe(value)
+    
+    def time(self) -> '_Timer':
+        return self._children[()].time()
+    
+    def collect(self, const: Tuple = ()) -> List[str]:
+        lines = []
+        for key, child in self._items():
+            counts, total, count = child.snapshot()
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, const + (('le', _format_value(float(bound))),))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key, const)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class GaugeFunc:
+    """收集時才呼叫函式取值的指標 (佇列深度、連線池使用量等)
+    
+    fn 回傳單一數值，或 {標籤值 tuple: 數值}。
+    """
+    
+    def __init__(self, name: str, help: str, fn: Callable, labelnames: Sequence[str] = (),
+                 type: str = 'gauge', registry: Optional[Registry] = REGISTRY):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+        self.type = type
+        if registry is not None:
+            registry.register(self)
+    
+    def collect(self, const: Tuple = ()) -> List[str]:
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        if value is None:
+            return []
+        if not isinstance(value, dict):
+            value = {(): value}
+        return [f'{self.name}{_format_labels(self.labelnames, key, const)} {_format_value(float(v))}'
+                for key, v in sorted(value.items())]
+
@@ -0,0 +1,230 @@
+"""資料庫結構版本管理
+
+每個 migration 為 (版本, 說明, SQL 清單)，依版本順序套用，
+已套用的版本記錄在 schema_version 資料表，啟動時只會執行尚未套用的步驟。
+新增結構變更時，請在 MIGRATIONS 最後加上新版本，不要修改已發佈的步驟。
+"""
+import logging
+import sqlite3
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 已處理的 webhookEventId，LINE 重送時略過；received_at 為 Unix 時間，超過保存期限即刪除
+# (預約資料在 PostgreSQL 時，本機 SQLite 只建立這個資料表，見 EventDeduplicator.init_table)
+WEBHOOK_EVENTS_DDL = [
+    '''CREATE TABLE IF NOT EXISTS webhook_events (
+           event_id VARCHAR(64) PRIMARY KEY,
+           received_at REAL NOT NULL
+       ) WITHOUT ROWID''',
+    '''CREATE INDEX IF NOT EXISTS idx_webhook_events_received ON webhook_events (received_at)''',
+]
+
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (1, '熱門查詢索引', [
+        # 預約/訂餐以 (員工, 日期) 查詢有效紀錄：view_booking、generate_qr、覆蓋與取消
+        '''CREATE INDEX IF NOT EXISTS idx_bus_reservations_active
+           ON bus_reservations (employee_id, reservation_date) WHERE status = 'active' ''',
+        '''CREATE INDEX IF NOT EXISTS idx_meal_orders_active
+           ON meal_orders (employee_id, order_date) WHERE status = 'active' ''',
+        # 由員工反查 LINE 帳號
+        '''CREATE INDEX IF NOT EXISTS idx_line_users_employee
+           ON line_users (employee_id) WHERE is_bound = TRUE''',
+        # 選單：啟用中的路線、班次、餐廳
+        '''CREATE INDEX IF NOT EXISTS idx_bus_routes_active
+           ON bus_routes (id) WHERE is_active = TRUE''',
+        '''CREATE INDEX IF NOT EXISTS idx_bus_schedules_route_shift
+           ON bus_schedules (route_id, shift_type) WHERE is_active = TRUE''',
+        '''CREATE INDEX IF NOT EXISTS idx_restaurants_active
+           ON restaurants (floor, id) WHERE is_active = TRUE''',
+    ]),
+    (2, '選單目錄版本號', [
+        '''CREATE TABLE IF NOT EXISTS catalog_version (
+               id INTEGER PRIMARY KEY CHECK (id = 1),
+               version INTEGER NOT NULL DEFAULT 0
+           )''',
+        'INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0)',
+    ] + [
+        # 路線、班次、餐廳任何異動都讓版本號 +1，選單快取據此失效
+        f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_catalog_version
+            AFTER {event} ON {table}
+            BEGIN
+                UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+            END'''
+        for table in ('bus_routes', 'bus_schedules', 'restaurants')
+        for event in ('INSERT', 'UPDATE', 'DELETE')
+    ]),
+    (3, '交通車座位計數', [
+        # 每個 (班次, 日期) 已預約人數，預約時在同一交易中更新，不必每次 COUNT(*)
+        '''CREATE TABLE IF NOT EXISTS bus_seat_counters (
+               schedule_id INTEGER NOT NULL,
+               reservation_date DATE NOT NULL,
+               booked INTEGER NOT NULL DEFAULT 0,
+               PRIMARY KEY (schedule_id, reservation_date),
+               FOREIGN KEY (schedule_id) REFERENCES bus_schedules(id)
+           ) WITHOUT ROWID''',
+        '''INSERT OR REPLACE INTO bus_seat_counters (schedule_id, reservation_date, booked)
+           SELECT schedule_id, reservation_date, COUNT(*)
+           FROM bus_reservations WHERE status = 'active'
+           GROUP BY schedule_id, reservation_date''',
+    ]),
+    (4, '每人每天唯一有效預約', [
+        # 先整理重複的有效紀錄：同一員工同一天只保留最新一筆
+        '''UPDATE bus_reservations SET status = 'cancelled', updated_at = CURRENT_TIMESTAMP
+           WHERE status = 'active' AND id NOT IN (
+               SELECT MAX(id) FROM bus_reservations WHERE status = 'active'
+               GROUP BY employee_id, reservation_date)''',
+        '''UPDATE meal_orders SET status = 'cancelled', updated_at = CURRENT_TIMESTAMP
+           WHERE status = 'active' AND id NOT IN (
+               SELECT MAX(id) FROM meal_orders WHERE status = 'active'
+               GROUP BY employee_id, order_date)''',
+        'DELETE FROM bus_seat_counters',
+        '''INSERT INTO bus_seat_counters (schedule_id, reservation_date, booked)
+           SELECT schedule_id, reservation_date, COUNT(*)
+           FROM bus_reservations WHERE status = 'active'
+           GROUP BY schedule_id, reservation_date''',
+        # 有效紀錄改為唯一索引，預約以 INSERT ... ON CONFLICT DO UPDATE 一次寫入
+        'DROP INDEX IF EXISTS idx_bus_reservations_active',
+        '''CREATE UNIQUE INDEX idx_bus_reservations_active
+           ON bus_reservations (employee_id, reservation_date) WHERE status = 'active' ''',
+        'DROP INDEX IF EXISTS idx_meal_orders_active',
+        '''CREATE UNIQUE INDEX idx_meal_orders_active
+           ON meal_orders (employee_id, order_date) WHERE status = 'active' ''',
+        # 覆蓋預約時原紀錄就地更新，觸發器把舊內容另存一筆 cancelled 保留歷史
+        '''CREATE TRIGGER IF NOT EXISTS trg_bus_reservations_history
+           AFTER UPDATE OF schedule_id ON bus_reservations
+           WHEN OLD.status = 'active' AND NEW.status = 'active' AND OLD.schedule_id <> NEW.schedule_id
+           BEGIN
+               INSERT INTO bus_reservations (employee_id, schedule_id, reservation_date, status,
+                                             notes, reserved_at, updated_at)
+               VALUES (OLD.employee_id, OLD.schedule_id, OLD.reservation_date, 'cancelled',
+                       OLD.notes, OLD.reserved_at, CURRENT_TIMESTAMP);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_meal_orders_history
+           AFTER UPDATE OF restaurant_id ON meal_orders
+           WHEN OLD.status = 'active' AND NEW.status = 'active' AND OLD.restaurant_id <> NEW.restaurant_id
+           BEGIN
+               INSERT INTO meal_orders (employee_id, restaurant_id, order_date, menu_id, special_request,
+                                        price, status, ordered_at, updated_at)
+               VALUES (OLD.employee_id, OLD.restaurant_id, OLD.order_date, OLD.menu_id, OLD.special_request,
+                       OLD.price, 'cancelled', OLD.ordered_at, CURRENT_TIMESTAMP);
+           END''',
+    ]),
+    (5, '乘客名單索引', [
+        # 乘客名單依 (日期, 班次, 員工) 順序讀取，歷史資料再多也只走當天的範圍
+        '''CREATE INDEX IF NOT EXISTS idx_bus_reservations_manifest
+           ON bus_reservations (reservation_date, schedule_id, employee_id) WHERE status = 'active' ''',
+    ]),
+    (6, '各餐廳訂餐數', [
+        # 每個 (日期, 餐廳) 有效訂單數，訂餐/取消時在同一交易中更新，廚房看板不必 GROUP BY
+        '''CREATE TABLE IF NOT EXISTS meal_counts (
+               order_date DATE NOT NULL,
+               restaurant_id INTEGER NOT NULL,
+               ordered INTEGER NOT NULL DEFAULT 0,
+               PRIMARY KEY (order_date, restaurant_id),
+               FOREIGN KEY (restaurant_id) REFERENCES restaurants(id)
+           ) WITHOUT ROWID''',
+        '''INSERT OR REPLACE INTO meal_counts (order_date, restaurant_id, ordered)
+           SELECT order_date, restaurant_id, COUNT(*)
+           FROM meal_orders WHERE status = 'active'
+           GROUP BY order_date, restaurant_id''',
+    ]),
+    (7, '發車提醒發送紀錄', [
+        # 每位乘客每個 (日期, 班次) 一筆，已送出的提醒不會重送
+        '''CREATE TABLE IF NOT EXISTS reminder_deliveries (
+               reservation_date DATE NOT NULL,
+               schedule_id INTEGER NOT NULL,
+               employee_id INTEGER NOT NULL,
+               line_user_id VARCHAR(100) NOT NULL,
+               language VARCHAR(5),
+               status VARCHAR(20) NOT NULL,  -- sent, failed
+               attempts INTEGER NOT NULL DEFAULT 0,
+               request_id VARCHAR(64),
+               error TEXT,
+               updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+               PRIMARY KEY (reservation_date, schedule_id, employee_id),
+               FOREIGN KEY (schedule_id) REFERENCES bus_schedules(id),
+               FOREIGN KEY (employee_id) REFERENCES employees(id)
+           ) WITHOUT ROWID''',
+    ]),
+    (8, '歷史資料封存', [
+        # 封存時依日期搬移 (含 cancelled)，有效預約的部分索引用不上
+        '''CREATE INDEX IF NOT EXISTS idx_bus_reservations_date ON bus_reservations (reservation_date)''',
+        '''CREATE INDEX IF NOT EXISTS idx_meal_orders_date ON meal_orders (order_date)''',
+        # 已封存的月份與封存檔，報表據此決定要附加哪些檔案
+        '''CREATE TABLE IF NOT EXISTS archived_months (
+               month VARCHAR(7) PRIMARY KEY,  -- YYYY-MM
+               archive_file TEXT NOT NULL,
+               rows_moved INTEGER NOT NULL DEFAULT 0,
+               archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+           )''',
+    ]),
+    (9, 'Webhook 事件去重', WEBHOOK_EVENTS_DDL),
+    (10, '員工快取版本號', [
+        # 多個 worker 程序各有自己的員工快取，綁定或改語言後其他程序據此清除快取
+        '''CREATE TABLE IF NOT EXISTS employee_cache_version (
+               id INTEGER PRIMARY KEY CHECK (id = 1),
+               version INTEGER NOT NULL DEFAULT 0
+           )''',
+        'INSERT OR IGNORE INTO employee_cache_version (id, version) VALUES (1, 0)',
+    ] + [
+        f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_employee_cache_version
+            AFTER {event} ON {table}
+            BEGIN
+                UPDATE employee_cache_version SET version = version + 1 WHERE id = 1;
+            END'''
+        for table, events in (('employees', ('UPDATE', 'DELETE')), ('line_users', ('INSERT', 'UPDATE', 'DELETE')))
+        for event in events
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def ensure_version_table(conn: sqlite3.Connection):
+    """建立 schema_version 資料表"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description VARCHAR(255),
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    """目前資料庫的結構版本，尚未建立版本表時為 0"""
+    try:
+        row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] or 0
+
+
+def apply_migrations(conn: sqlite3.Connection) -> List[int]:
+    """依序套用尚未執行的 migration，回傳本次套用的版本"""
+    ensure_version_table(conn)
+    conn.commit()
+    
+    applied = []
+    version = current_version(conn)
+    for target, description, statements in MIGRATIONS:
+        if target <= version:
+            continue
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            # 多個程序同時啟動時，拿到寫入鎖後再確認一次
+            if current_version(conn) >= target:
+                conn.rollback()
+                continue
+            for sql in statements:
+                conn.execute(sql)
+            conn.execute('INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                         (target, description))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(target)
+        logger.info("✅ 資料庫結構升級至第 %d 版：%s", target, description)
+    return applied
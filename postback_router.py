@@ -0,0 +1,128 @@
+"""Postback 動作路由
+
+每個 action 以 @router.action('名稱', 參數=型別) 註冊一次，
+收到 postback 時以 dict 查表分派，並記錄各 action 的呼叫次數與處理時間分布。
+處理函式回傳要回覆的訊息 (單一或 list)，由呼叫端統一送出。
+"""
+import time
+import logging
+from typing import Callable, Dict, List, Optional
+
+from metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+_REQUIRED = object()
+
+POSTBACK_SECONDS = Histogram('linebot_postback_action_seconds', 'postback action 處理時間 (不含送出回覆)', ['action'])
+POSTBACK_ERRORS = Counter('linebot_postback_action_errors_total', 'postback action 處理失敗或參數錯誤次數', ['action'])
+
+
+class PostbackParamError(ValueError):
+    """postback 參數缺少或格式錯誤"""
+
+
+def parse_postback_data(data: str) -> Dict[str, str]:
+    """解析 'action=xxx&key=value' 格式的 postback data"""
+    params = {}
+    for param in (data or '').split('&'):
+        if '=' in param:
+            key, value = param.split('=', 1)
+            params[key] = value
+    return params
+
+
+class Route:
+    """單一 action 的處理函式與參數定義"""
+    
+    def __init__(self, name: str, func: Callable, schema: Dict):
+        self.name = name
+        self.func = func
+        # 參數 -> (型別, 預設值)，未給預設值代表必填
+        self.schema = {
+            key: spec if isinstance(spec, tuple) else (spec, _REQUIRED)
+            for key, spec in schema.items()
+        }
+        self.latency = POSTBACK_SECONDS.labels(name)
+        self.errors = POSTBACK_ERRORS.labels(name)
+    
+    def convert(self, params: Dict[str, str]) -> Dict:
+        """依參數定義轉換型別"""
+        values = {}
+        for key, (kind, default) in self.schema.items():
+            raw = params.get(key)
+            if raw is None or raw == '':
+                if default is _REQUIRED:
+                    raise PostbackParamError(f'{self.name} 缺少參數 {key}')
+                values[key] = default
+                continue
+            try:
+                values[key] = kind(raw)
+            except (TypeError, ValueError):
+                raise PostbackParamError(f'{self.name} 參數 {key} 格式錯誤：{raw}')
+        return values
+
+
+class PostbackRouter:
+    """postback action 註冊表"""
+    
+    def __init__(self):
+        self._routes: Dict[str, Route] = {}
+        self._fallback: Optional[Callable] = None
+    
+    def action(self, name: str, **schema):
+        """註冊 action 處理函式：func(ctx, **參數)"""
+        def decorator(func: Callable) -> Callable:
+            if name in self._routes:
+                raise ValueError(f'重複註冊 postback action：{name}')
+            self._routes[name] = Route(name, func, schema)
+            return func
+        return decorator
+    
+    def fallback(self, func: Callable) -> Callable:
+        """註冊未知 action 或參數錯誤時的處理函式：func(ctx)"""
+        self._fallback = func
+        return func
+    
+    def dispatch(self, ctx, data: str) -> List:
+        """分派 postback，回傳要回覆的訊息清單"""
+        params = parse_postback_data(data)
+        route = self._routes.get(params.get('action'))
+        if route is None:
+            return _as_list(self._fallback(ctx))
+        
+        start = time.perf_counter()
+        try:
+            result = route.func(ctx, **route.convert(params))
+        except PostbackParamError as e:
+            route.errors.inc()
+            logger.warning("⚠️ postback 參數錯誤：%s", e)
+            result = self._fallback(ctx)
+        except Exception:
+            route.errors.inc()
+            raise
+        finally:
+            route.latency.observe(time.perf_counter() - start)
+        return _as_list(result)
+    
+    def actions(self) -> List[str]:
+        return sorted(self._routes)
+    
+    def stats(self) -> Dict:
+        """各 action 的呼叫次數、錯誤數與平均處理時間 (完整分布見 /metrics)"""
+        stats = {}
+        for name, route in sorted(self._routes.items()):
+            _, total, count = route.latency.snapshot()
+            stats[name] = {
+                'count': count,
+                'errors': int(route.errors.value),
+                'avg_seconds': total / count if count else 0.0
+            }
+        return stats
+
+
+def _as_list(result) -> List:
+    if result is None:
+        return []
+    if isinstance(result, (list, tuple)):
+        return list(result)
+    return [result]
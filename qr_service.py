@@ -0,0 +1,68 @@
+"""領餐 QR 碼本機產生服務
+
+在本機把 QR 碼畫成 PNG (不依賴 Pillow)，依 (員工, 日期, 餐廳) 快取圖片，
+並以 HMAC 簽章保護圖片網址，避免被人猜網址取得他人的領餐資料。
+"""
+import io
+import hmac
+import hashlib
+from datetime import date
+from typing import Optional, Tuple
+
+import qrcode
+from qrcode.image.pure import PyPNGImage
+
+from cache import TTLCache
+
+
+def render_qr_png(content: str, box_size: int = 10, border: int = 4) -> bytes:
+    """把文字內容畫成 QR 碼 PNG"""
+    qr = qrcode.QRCode(box_size=box_size, border=border, image_factory=PyPNGImage)
+    qr.add_data(content)
+    qr.make(fit=True)
+    
+    buffer = io.BytesIO()
+    qr.make_image().save(buffer)
+    return buffer.getvalue()
+
+
+class QRCodeService:
+    """領餐 QR 碼的網址簽章與圖片快取"""
+    
+    def __init__(self, secret: str, maxsize: int = 2000, ttl: float = 86400):
+        if not secret:
+            # 沒有金鑰時任何人都能算出簽章，拒絕啟動
+            raise ValueError('QR 碼網址需要簽章金鑰：請設定 QR_SIGNING_KEY 或 CHANNEL_SECRET')
+        self._secret = secret.encode('utf-8')
+        # key: (employee_id, 日期, restaurant_id) -> (png, etag)
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+    
+    def sign(self, employee_id: int, day: date, restaurant_id: int) -> str:
+        """圖片網址的簽章"""
+        message = f'{employee_id}:{day.isoformat()}:{restaurant_id}'.encode('utf-8')
+        return hmac.new(self._secret, message, hashlib.sha256).hexdigest()[:32]
+    
+    def verify(self, employee_id: int, day: date, restaurant_id: int, signature: str) -> bool:
+        """檢查網址簽章"""
+        return hmac.compare_digest(self.sign(employee_id, day, restaurant_id), signature or '')
+    
+    def image_path(self, employee_id: int, day: date, restaurant_id: int) -> str:
+        """圖片的相對網址 (含簽章)"""
+        signature = self.sign(employee_id, day, restaurant_id)
+        return f'/qr/meal/{employee_id}/{day.isoformat()}/{restaurant_id}.png?sig={signature}'
+    
+    def get(self, employee_id: int, day: date, restaurant_id: int) -> Optional[Tuple[bytes, str]]:
+        """取得快取中的 (PNG, ETag)"""
+        return self.cache.get((employee_id, day, restaurant_id))
+    
+    def render(self, employee_id: int, day: date, restaurant_id: int, content: str) -> Tuple[bytes, str]:
+        """產生圖片並放入快取，回傳 (PNG, ETag)"""
+        key = (employee_id, day, restaurant_id)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        
+        png = render_qr_png(content)
+        etag = hashlib.sha1(png).hexdigest()
+        self.cache.set(key, (png, etag))
+        return png, etag
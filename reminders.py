@@ -0,0 +1,262 @@
+"""交通車發車提醒
+
+每個班次發車前 lead_minutes 分鐘 (台北時間)，找出當天有有效預約、且已綁定 LINE 的乘客，
+依語言分組後以 multicast 發送，每批最多 MULTICAST_LIMIT 人。
+
+- 限速：所有批次共用一個 RateLimiter，每秒最多 rate 個請求
+- 重試：429、5xx 與連線錯誤以指數退避重試 (429 依 Retry-After)。重試沿用同一個 X-Line-Retry-Key，
+  LINE 已經收過的批次會回 409，視為已送出
+- 紀錄：每位乘客的結果寫入 reminder_deliveries，已送出的不會再送，
+  所以排程每分鐘執行也不會重複提醒，服務中斷後補跑只會送還沒送到的人
+- 班次、乘客與發送紀錄經由 Storage 的 reminders (repository.py) 讀寫，SQLite 與 PostgreSQL 後端都適用
+
+命令列：python reminders.py [--lead 15] [--once] [--interval 60]
+      (LINE_API_HOST 可指向 stub_line_server.py)
+"""
+import time
+import uuid
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time as clock, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from urllib3.exceptions import HTTPError
+
+from database import DatabaseManager
+from i18n import CATALOG, DEFAULT_LANGUAGE
+from lazy_import import lazy_classes
+from line_client import LineApiHolder
+from settings import TAIPEI_TZ, taipei_now
+
+TextMessage, = lazy_classes('linebot.v3.messaging', 'TextMessage')
+
+# LINE multicast 一次最多 500 位收件者
+MULTICAST_LIMIT = 500
+LEAD_MINUTES = 15
+
+SCHEDULES_SQL = '''
+    SELECT bs.id, bs.departure_time, bs.schedule_name_zh, bs.schedule_name_en, bs.schedule_name_vi,
+           br.route_name_zh, br.route_name_en, br.route_name_vi
+    FROM bus_schedules bs
+    JOIN bus_routes br ON bs.route_id = br.id
+    WHERE bs.is_active = TRUE
+    ORDER BY bs.departure_time, bs.id
+'''
+
+RECIPIENTS_SQL = '''
+    SELECT bresv.employee_id, lu.line_user_id, e.preferred_language
+    FROM bus_reservations bresv
+    JOIN employees e ON e.id = bresv.employee_id
+    JOIN line_users lu ON lu.employee_id = e.id AND lu.is_bound = TRUE
+    LEFT JOIN reminder_deliveries rd
+           ON rd.reservation_date = bresv.reservation_date
+          AND rd.schedule_id = bresv.schedule_id
+          AND rd.employee_id = bresv.employee_id
+          AND rd.status = 'sent'
+    WHERE bresv.reservation_date = ? AND bresv.schedule_id = ? AND bresv.status = 'active'
+      AND e.status = 'active' AND rd.employee_id IS NULL
+    ORDER BY bresv.employee_id
+'''
+
+RECORD_SQL = '''
+    INSERT INTO reminder_deliveries
+        (reservation_date, schedule_id, employee_id, line_user_id, language, status, attempts, request_id, error)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (reservation_date, schedule_id, employee_id) DO UPDATE SET
+        line_user_id = excluded.line_user_id,
+        status = excluded.status,
+        attempts = attempts + excluded.attempts,
+        request_id = excluded.request_id,
+        error = excluded.error,
+        updated_at = CURRENT_TIMESTAMP
+'''
+
+
+class RateLimiter:
+    """每秒最多 rate 次，請求平均分散；多執行緒共用"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def due_schedules(storage, now: datetime, lead_minutes: int = LEAD_MINUTES) -> List[Dict]:
+    """now 時已進入提醒時間 (發車前 lead_minutes 分鐘內) 且尚未發車的班次"""
+    now = now.astimezone(TAIPEI_TZ)
+    schedules = []
+    for row in storage.reminders.schedules():
+        departure = datetime.combine(now.date(), clock.fromisoformat(str(row[1])), TAIPEI_TZ)
+        if departure - timedelta(minutes=lead_minutes) <= now < departure:
+            schedules.append({
+                'schedule_id': row[0],
+                'departure_time': departure.strftime('%H:%M'),
+                'minutes': max(1, round((departure - now).total_seconds() / 60)),
+                'schedule_names': {'zh': row[2], 'en': row[3], 'vi': row[4]},
+                'route_names': {'zh': row[5], 'en': row[6], 'vi': row[7]},
+            })
+    return schedules
+
+
+def reminder_recipients(storage, day: date, schedule_id: int) -> Dict[str, List[Tuple[int, str]]]:
+    """尚未收到提醒的乘客，依語言分組：{語言: [(員工 id, LINE user ID)]}"""
+    groups: Dict[str, List[Tuple[int, str]]] = {}
+    seen = set()
+    for employee_id, line_user_id, language in storage.reminders.recipients(day, schedule_id):
+        if employee_id in seen:
+            continue
+        seen.add(employee_id)
+        lang = language if language in CATALOG.languages else DEFAULT_LANGUAGE
+        groups.setdefault(lang, []).append((employee_id, line_user_id))
+    return groups
+
+
+def reminder_text(schedule: Dict, lang: str) -> str:
+    return CATALOG.format(
+        'bus_reminder', lang,
+        route=schedule['route_names'].get(lang) or schedule['route_names']['zh'],
+        schedule=schedule['schedule_names'].get(lang) or schedule['schedule_names']['zh'] or '',
+        time=schedule['departure_time'],
+        minutes=schedule['minutes']
+    )
+
+
+def _header(headers, name: str) -> Optional[str]:
+    if not headers:
+        return None
+    for key, value in dict(headers).items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def send_batch(line_api: LineApiHolder, to: List[str], text: str, limiter: RateLimiter,
+               max_attempts: int = 4, backoff: float = 0.5) -> Dict:
+    """送出一批 multicast，回傳 {'status', 'attempts', 'request_id', 'error'}"""
+    retry_key = str(uuid.uuid4())
+    messages = [TextMessage(text=text)]
+    attempt = 0
+    while True:
+        attempt += 1
+        limiter.wait()
+        try:
+            response = line_api.multicast(to, messages, retry_key=retry_key)
+            return {'status': 'sent', 'attempts': attempt,
+                    'request_id': _header(response.headers, 'x-line-request-id'), 'error': None}
+        except Exception as e:
+            status = getattr(e, 'status', None)
+            headers = getattr(e, 'headers', None)
+            if status == 409:
+                # 同一個 retry key 已被接受 (前一次其實成功了)
+                return {'status': 'sent', 'attempts': attempt,
+                        'request_id': _header(headers, 'x-line-accepted-request-id'), 'error': None}
+
+            retryable = status == 429 or (status or 0) >= 500 or (status is None and isinstance(e, (HTTPError, OSError)))
+            error = f'HTTP {status}' if status else f'{type(e).__name__}: {e}'
+            if not retryable or attempt >= max_attempts:
+                return {'status': 'failed', 'attempts': attempt, 'request_id': None, 'error': error[:500]}
+
+            delay = min(backoff * 2 ** (attempt - 1), 30.0)
+            retry_after = _header(headers, 'retry-after')
+            if status == 429 and retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            time.sleep(delay)
+
+
+def send_reminders(storage, line_api: LineApiHolder, day: date, schedule: Dict,
+                   workers: int = 4, rate: float = 50.0, max_attempts: int = 4, backoff: float = 0.5,
+                   limiter: Optional[RateLimiter] = None) -> Dict:
+    """提醒單一班次的乘客，回傳各項筆數"""
+    schedule_id = schedule['schedule_id']
+    groups = reminder_recipients(storage, day, schedule_id)
+
+    batches = []
+    for lang, recipients in groups.items():
+        for i in range(0, len(recipients), MULTICAST_LIMIT):
+            batches.append((lang, recipients[i:i + MULTICAST_LIMIT]))
+
+    result = {'schedule_id': schedule_id, 'recipients': sum(len(r) for r in groups.values()),
+              'batches': len(batches), 'sent': 0, 'failed': 0, 'retries': 0}
+    if not batches:
+        return result
+
+    limiter = limiter or RateLimiter(rate)
+    texts = {lang: reminder_text(schedule, lang) for lang in groups}
+    lock = threading.Lock()
+
+    def deliver(batch):
+        lang, recipients = batch
+        outcome = send_batch(line_api, [line_user_id for _, line_user_id in recipients], texts[lang],
+                             limiter, max_attempts=max_attempts, backoff=backoff)
+        storage.reminders.record([
+            (day, schedule_id, employee_id, line_user_id, lang, outcome['status'],
+             outcome['attempts'], outcome['request_id'], outcome['error'])
+            for employee_id, line_user_id in recipients
+        ])
+        with lock:
+            result[outcome['status']] += len(recipients)
+            result['retries'] += outcome['attempts'] - 1
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(batches))), thread_name_prefix='reminder') as pool:
+        list(pool.map(deliver, batches))
+    return result
+
+
+def run_due_reminders(storage, line_api: LineApiHolder, now: Optional[datetime] = None,
+                      lead_minutes: int = LEAD_MINUTES, **options) -> List[Dict]:
+    """提醒所有已進入提醒時間的班次 (可重複執行，已送出的不會重送)"""
+    now = now or taipei_now()
+    schedules = due_schedules(storage, now, lead_minutes)
+    limiter = options.pop('limiter', None) or RateLimiter(options.pop('rate', 50.0))
+    return [send_reminders(storage, line_api, now.astimezone(TAIPEI_TZ).date(), schedule, limiter=limiter, **options)
+            for schedule in schedules]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='交通車發車提醒')
+    parser.add_argument('--lead', type=int, default=LEAD_MINUTES, help='發車前幾分鐘提醒')
+    parser.add_argument('--once', action='store_true', help='只檢查一次 (給 cron 使用)')
+    parser.add_argument('--interval', type=float, default=60, help='常駐時的檢查間隔秒數')
+    parser.add_argument('--workers', type=int, default=4, help='同時送出的批次數')
+    parser.add_argument('--rate', type=float, default=50, help='每秒最多幾個 multicast 請求')
+    args = parser.parse_args()
+
+    from logs import configure_logging
+    from repository import open_storage
+    configure_logging(fmt='text')
+    db = DatabaseManager()
+    storage = open_storage(db)
+    if storage.backend != 'sqlite':
+        # reminder_deliveries 是第 2 版才加入的資料表
+        storage.init_schema()
+    line_api = LineApiHolder()
+    try:
+        while True:
+            for result in run_due_reminders(storage, line_api, lead_minutes=args.lead,
+                                            workers=args.workers, rate=args.rate):
+                print(f"🚌 班次 {result['schedule_id']}：{result['recipients']} 人，{result['batches']} 批，"
+                      f"送出 {result['sent']}，失敗 {result['failed']}，重試 {result['retries']} 次")
+            if args.once:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        line_api.close()
+        storage.close()
+        db.pool.close_all()
+
+
+if __name__ == "__main__":
+    main()
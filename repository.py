@@ -0,0 +1,394 @@
+"""資料存取介面 (repository)
+
+app.py 的處理函式只透過 Storage 的各個 repository 讀寫員工、綁定、交通車預約、訂餐、目錄與系統設定，
+不直接操作資料庫連線。後端由 DATABASE_URL 決定：
+
+- 未設定 (預設)：SQLiteStorage，沿用 DatabaseManager、booking.py 的交易與各項快取
+- postgresql://...：PostgresStorage (repository_pg.py)，以連線池連到 PostgreSQL，
+  多台機器可同時寫入，不受 SQLite 單一寫入者限制
+
+乘客名單 (manifest.py)、發車提醒 (reminders.py) 與訂餐數核對 (kitchen.py) 也經由 Storage 讀寫。
+Webhook 事件去重仍使用各程序本機的 SQLite 資料庫；封存 (archive.py) 是把 SQLite 的舊月份搬到
+另一個檔案，只支援 SQLite 後端。兩個後端的行為由 test_repository.py 的同一組測試確認。
+"""
+import os
+import abc
+import sqlite3
+from datetime import date
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from booking import book_bus, book_meal, cancel_bus, cancel_meal
+from catalog import CatalogData, load_catalog
+from database import DatabaseManager
+from import_employees import deactivate_missing_employees, upsert_employees
+from kitchen import kitchen_counts, reconcile_meal_counts
+from manifest import headcounts, passenger_rows
+from reminders import RECIPIENTS_SQL, RECORD_SQL, SCHEDULES_SQL
+
+
+class EmployeeRepository(abc.ABC):
+    """員工資料 (以 LINE user ID 查詢，結果快取在 cache)"""
+
+    cache = None
+
+    @abc.abstractmethod
+    def get(self, line_user_id: str) -> Optional[Dict]:
+        """已綁定且在職的員工：{'id', 'employee_id', 'name', 'shift_type', 'preferred_language', 'department'}"""
+
+    @abc.abstractmethod
+    def set_language(self, employee_id: int, lang: str):
+        """變更偏好語言"""
+
+    @abc.abstractmethod
+    def department_ids(self) -> Dict[str, int]:
+        """部門代碼 (大寫) -> 部門 id，匯入員工時檢查 dept_code"""
+
+    @abc.abstractmethod
+    def upsert_many(self, records: List[Tuple]) -> Dict[str, int]:
+        """新增或更新一批員工 (一個交易，欄位同 import_employees.validate_row)，只寫入有變動的資料
+
+        回傳 {'inserted', 'updated', 'unchanged', 'deactivated'} 筆數
+        """
+
+    @abc.abstractmethod
+    def deactivate_missing(self, employee_ids: Iterable[str]) -> int:
+        """停用不在 employee_ids (完整名冊) 中的在職員工，回傳停用筆數"""
+
+    def invalidate(self, line_user_id: str):
+        """員工資料異動後清除快取"""
+        self.cache.invalidate(line_user_id)
+
+
+class BindingRepository(abc.ABC):
+    """LINE 帳號與員工綁定"""
+
+    @abc.abstractmethod
+    def bind(self, line_user_id: str, employee_code: str) -> Dict:
+        """回傳 {'success': bool, 'message': 訊息}，失敗時不拋出例外"""
+
+
+class ReservationRepository(abc.ABC):
+    """交通車預約 (每人每天最多一筆有效預約，座位數由計數表控管)"""
+
+    @abc.abstractmethod
+    def book(self, employee_id: int, schedule_id: int, day: date) -> Dict:
+        """預約 (覆蓋當天舊預約)，回傳 {'success', 'full', 'unavailable' (班次不存在或已停用), 'remaining'}"""
+
+    @abc.abstractmethod
+    def cancel(self, employee_id: int, day: date) -> int:
+        """取消當天預約並釋出座位，回傳取消筆數"""
+
+    @abc.abstractmethod
+    def for_day(self, employee_id: int, day: date) -> Optional[Tuple]:
+        """當天有效預約：(路線名稱, 發車時間 HH:MM, 班次名稱)"""
+
+    @abc.abstractmethod
+    def headcounts(self, day: date, route_code: Optional[str] = None,
+                   schedule_id: Optional[int] = None) -> List[Dict]:
+        """乘客名單的各班次人數 (格式同 manifest.headcounts)"""
+
+    @abc.abstractmethod
+    def passengers(self, day: date, route_code: Optional[str] = None,
+                   schedule_id: Optional[int] = None) -> Iterator[Tuple]:
+        """分批讀取當天乘客：(班次 id, 員工編號, 姓名, 部門, 預約時間)；產生器關閉時歸還連線"""
+
+
+class OrderRepository(abc.ABC):
+    """訂餐 (每人每天最多一筆有效訂單，各餐廳訂單數另有計數表)"""
+
+    @abc.abstractmethod
+    def book(self, employee_id: int, restaurant_id: int, day: date) -> bool:
+        """訂餐 (覆蓋當天舊訂單)，已訂同一家餐廳時回傳 False"""
+
+    @abc.abstractmethod
+    def cancel(self, employee_id: int, day: date) -> int:
+        """取消當天訂單並減少餐廳訂單數，回傳取消筆數"""
+
+    @abc.abstractmethod
+    def for_day(self, employee_id: int, day: date) -> Optional[Tuple]:
+        """當天有效訂單：(餐廳名稱, 樓層, 訂餐時間, 餐廳 id)"""
+
+    @abc.abstractmethod
+    def pickup(self, employee_id: int, day: date, restaurant_id: int) -> Optional[Tuple]:
+        """領餐 QR 碼內容：(員工編號, 姓名, 餐廳名稱, 樓層)，沒有這筆有效訂單時為 None"""
+
+    @abc.abstractmethod
+    def kitchen_counts(self, day: date, floor: Optional[str] = None) -> List[Dict]:
+        """廚房看板：各餐廳有效訂單數 (格式同 kitchen.kitchen_counts)"""
+
+    @abc.abstractmethod
+    def reconcile_counts(self, day: Optional[date] = None, fix: bool = False) -> List[Dict]:
+        """比對訂餐數與實際訂單 (格式同 kitchen.reconcile_meal_counts)，day 為 None 時核對所有日期"""
+
+
+class ReminderRepository(abc.ABC):
+    """發車提醒 (reminders.py) 的班次、收件者與發送紀錄"""
+
+    @abc.abstractmethod
+    def schedules(self) -> List[Tuple]:
+        """啟用中的班次：(id, 發車時間 HH:MM, 班次名稱 zh/en/vi, 路線名稱 zh/en/vi)，依發車時間排序"""
+
+    @abc.abstractmethod
+    def recipients(self, day: date, schedule_id: int) -> List[Tuple]:
+        """有效預約、已綁定且尚未送出提醒的乘客：(員工 id, LINE user ID, 語言)"""
+
+    @abc.abstractmethod
+    def record(self, rows: List[Tuple]):
+        """寫入發送結果 (欄位順序同 reminders.RECORD_SQL)，同一位乘客再次寫入時累加嘗試次數"""
+
+
+class CatalogRepository(abc.ABC):
+    """路線、班次、餐廳目錄 (CatalogCache 的資料來源)"""
+
+    @abc.abstractmethod
+    def version(self) -> int:
+        """目錄版本號，路線、班次、餐廳異動後改變"""
+
+    @abc.abstractmethod
+    def load(self) -> CatalogData:
+        """啟用中的目錄資料，version 為同一交易讀到的版本號"""
+
+
+class SettingsRepository(abc.ABC):
+    """system_settings (SettingsCache 的資料來源)"""
+
+    @abc.abstractmethod
+    def version(self) -> int:
+        """設定可能有變動時改變的值 (SettingsCache 重新讀取後會再比對內容)"""
+
+    @abc.abstractmethod
+    def load(self) -> Dict[str, str]:
+        """所有設定：{setting_key: setting_value}"""
+
+    def close(self):
+        pass
+
+
+class Storage(abc.ABC):
+    """各 repository 的集合"""
+
+    backend = ''
+    employees: EmployeeRepository
+    bindings: BindingRepository
+    reservations: ReservationRepository
+    orders: OrderRepository
+    reminders: ReminderRepository
+    catalog: CatalogRepository
+    settings: SettingsRepository
+
+    @abc.abstractmethod
+    def init_schema(self) -> List[int]:
+        """建立或升級資料表，回傳本次套用的版本"""
+
+    def stats(self) -> Dict:
+        return {'backend': self.backend}
+
+    def close(self):
+        self.settings.close()
+
+
+# ---- SQLite ----
+
+class SQLiteEmployees(EmployeeRepository):
+    def __init__(self, db: DatabaseManager):
+        self.db = db
+        self.cache = db.employee_cache
+
+    def get(self, line_user_id: str) -> Optional[Dict]:
+        return self.db.get_employee_by_line_id(line_user_id)
+
+    def set_language(self, employee_id: int, lang: str):
+        def update_language(conn):
+            conn.execute('UPDATE employees SET preferred_language = ? WHERE id = ?', (lang, employee_id))
+            conn.commit()
+        self.db.run_write(update_language)
+
+    def department_ids(self) -> Dict[str, int]:
+        with self.db.connection() as conn:
+            return {code.upper(): dept_id for dept_id, code in
+                    conn.execute('SELECT id, dept_code FROM departments').fetchall()}
+
+    def upsert_many(self, records: List[Tuple]) -> Dict[str, int]:
+        return self.db.run_write(upsert_employees, records)
+
+    def deactivate_missing(self, employee_ids: Iterable[str]) -> int:
+        return self.db.run_write(deactivate_missing_employees, list(employee_ids))
+
+
+class SQLiteBindings(BindingRepository):
+    def __init__(self, db: DatabaseManager):
+        self.db = db
+
+    def bind(self, line_user_id: str, employee_code: str) -> Dict:
+        return self.db.bind_line_user(line_user_id, employee_code)
+
+
+class SQLiteReservations(ReservationRepository):
+    def __init__(self, db: DatabaseManager):
+        self.db = db
+
+    def book(self, employee_id: int, schedule_id: int, day: date) -> Dict:
+        return self.db.run_write(book_bus, employee_id, schedule_id, day)
+
+    def cancel(self, employee_id: int, day: date) -> int:
+        return self.db.run_write(cancel_bus, employee_id, day)
+
+    def for_day(self, employee_id: int, day: date) -> Optional[Tuple]:
+        with self.db.connection() as conn:
+            return conn.execute('''
+                SELECT br.route_name_zh, bs.departure_time, bs.schedule_name_zh
+                FROM bus_reservations bresv
+                JOIN bus_schedules bs ON bresv.schedule_id = bs.id
+                JOIN bus_routes br ON bs.route_id = br.id
+                WHERE bresv.employee_id = ? AND bresv.reservation_date = ? AND bresv.status = 'active'
+            ''', (employee_id, day)).fetchone()
+
+    def headcounts(self, day: date, route_code: Optional[str] = None,
+                   schedule_id: Optional[int] = None) -> List[Dict]:
+        with self.db.connection() as conn:
+            return headcounts(conn, day, route_code, schedule_id)
+
+    def passengers(self, day: date, route_code: Optional[str] = None,
+                   schedule_id: Optional[int] = None) -> Iterator[Tuple]:
+        with self.db.connection() as conn:
+            yield from passenger_rows(conn, day, route_code, schedule_id)
+
+
+class SQLiteOrders(OrderRepository):
+    def __init__(self, db: DatabaseManager):
+        self.db = db
+
+    def book(self, employee_id: int, restaurant_id: int, day: date) -> bool:
+        return self.db.run_write(book_meal, employee_id, restaurant_id, day)
+
+    def cancel(self, employee_id: int, day: date) -> int:
+        return self.db.run_write(cancel_meal, employee_id, day)
+
+    def for_day(self, employee_id: int, day: date) -> Optional[Tuple]:
+        with self.db.connection() as conn:
+            return conn.execute('''
+                SELECT r.name_zh, r.floor, mo.ordered_at, mo.restaurant_id
+                FROM meal_orders mo
+                JOIN restaurants r ON mo.restaurant_id = r.id
+                WHERE mo.employee_id = ? AND mo.order_date = ? AND mo.status = 'active'
+            ''', (employee_id, day)).fetchone()
+
+    def pickup(self, employee_id: int, day: date, restaurant_id: int) -> Optional[Tuple]:
+        with self.db.connection() as conn:
+            return conn.execute('''
+                SELECT e.employee_id, e.name, r.name_zh, r.floor
+                FROM meal_orders mo
+                JOIN employees e ON mo.employee_id = e.id
+                JOIN restaurants r ON mo.restaurant_id = r.id
+                WHERE mo.employee_id = ? AND mo.order_date = ? AND mo.restaurant_id = ? AND mo.status = 'active'
+            ''', (employee_id, day, restaurant_id)).fetchone()
+
+    def kitchen_counts(self, day: date, floor: Optional[str] = None) -> List[Dict]:
+        with self.db.connection() as conn:
+            return kitchen_counts(conn, day, floor)
+
+    def reconcile_counts(self, day: Optional[date] = None, fix: bool = False) -> List[Dict]:
+        with self.db.connection() as conn:
+            return reconcile_meal_counts(conn, day, fix)
+
+
+class SQLiteReminders(ReminderRepository):
+    def __init__(self, db: DatabaseManager):
+        self.db = db
+
+    def schedules(self) -> List[Tuple]:
+        with self.db.connection() as conn:
+            return conn.execute(SCHEDULES_SQL).fetchall()
+
+    def recipients(self, day: date, schedule_id: int) -> List[Tuple]:
+        with self.db.connection() as conn:
+            return conn.execute(RECIPIENTS_SQL, (day, schedule_id)).fetchall()
+
+    def record(self, rows: List[Tuple]):
+        def record_rows(conn):
+            try:
+                conn.executemany(RECORD_SQL, rows)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        self.db.run_write(record_rows)
+
+
+class SQLiteCatalog(CatalogRepository):
+    def __init__(self, db: DatabaseManager):
+        self.db = db
+
+    def version(self) -> int:
+        with self.db.connection() as conn:
+            return conn.execute('SELECT version FROM catalog_version WHERE id = 1').fetchone()[0]
+
+    def load(self) -> CatalogData:
+        with self.db.connection() as conn:
+            # 讀取交易：版本號與各資料表來自同一個快照
+            conn.execute('BEGIN')
+            try:
+                return load_catalog(conn)
+            finally:
+                conn.rollback()
+
+
+class SQLiteSettings(SettingsRepository):
+    """以 PRAGMA data_version 偵測變動：其他連線或其他程序提交寫入後這個值才會改變
+
+    data_version 只能在同一條連線上比較，所以持有一條專用連線，不向連線池借用；
+    任何資料表寫入都會改變這個值，SettingsCache 重新讀取後會比對內容。
+    """
+
+    def __init__(self, db: DatabaseManager):
+        self.db = db
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db.db_path, timeout=5, check_same_thread=False)
+        return self._conn
+
+    def version(self) -> int:
+        return self._connection().execute('PRAGMA data_version').fetchone()[0]
+
+    def load(self) -> Dict[str, str]:
+        return dict(self._connection().execute('SELECT setting_key, setting_value FROM system_settings').fetchall())
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class SQLiteStorage(Storage):
+    """本機 SQLite 資料庫 (預設)"""
+
+    backend = 'sqlite'
+
+    def __init__(self, db: DatabaseManager):
+        self.db = db
+        self.employees = SQLiteEmployees(db)
+        self.bindings = SQLiteBindings(db)
+        self.reservations = SQLiteReservations(db)
+        self.orders = SQLiteOrders(db)
+        self.reminders = SQLiteReminders(db)
+        self.catalog = SQLiteCatalog(db)
+        self.settings = SQLiteSettings(db)
+
+    def init_schema(self) -> List[int]:
+        return self.db.init_database()
+
+    def stats(self) -> Dict:
+        return {'backend': self.backend, 'pool': self.db.pool.stats()}
+
+
+def open_storage(db: DatabaseManager, url: Optional[str] = None) -> Storage:
+    """依 DATABASE_URL 建立儲存後端，未設定時使用 db 的 SQLite 資料庫"""
+    url = url if url is not None else os.getenv('DATABASE_URL', '')
+    if url.startswith(('postgresql://', 'postgres://')):
+        from repository_pg import PostgresStorage
+        return PostgresStorage(url)
+    if url:
+        raise ValueError(f'不支援的 DATABASE_URL：{url.split(":", 1)[0]}')
+    return SQLiteStorage(db)
@@ -0,0 +1,134 @@
+"""系統設定快取與預約截止時間
+
+system_settings 只有幾筆、很少修改 (disable_time_check.py 等工具會直接改資料表)，載入一次後放在記憶體。
+快取每隔 check_interval 秒向 SettingsRepository (repository.py) 取得版本值，改變時才重新讀取設定。
+SQLite 的版本值是 PRAGMA data_version，任何資料表寫入後都會變，所以重新讀取後會比對內容，
+設定沒變就沿用已解析的結果。
+
+截止時間一律以台北時間 (UTC+8，無日光節約時間) 判斷，與伺服器所在時區無關。
+"""
+import time
+import logging
+import threading
+from datetime import date, datetime, time as clock, timedelta, timezone
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TAIPEI_TZ = timezone(timedelta(hours=8), 'Asia/Taipei')
+
+# system_settings 沒有設定或格式錯誤時使用
+DEFAULT_DEADLINES = {
+    ('bus', 'day'): '14:30',
+    ('bus', 'night'): '09:00',
+    ('meal', 'day'): '09:00',
+    ('meal', 'night'): '21:00',
+}
+
+
+def taipei_now() -> datetime:
+    """目前的台北時間"""
+    return datetime.now(TAIPEI_TZ)
+
+
+def taipei_today() -> date:
+    """台北時間的今天 (預約日期一律以此為準)"""
+    return taipei_now().date()
+
+
+class SettingsCache:
+    """以版本值偵測變動的 system_settings 快取"""
+
+    def __init__(self, source, check_interval: float = 5.0):
+        self.source = source
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+        self._values: Optional[Dict[str, str]] = None
+        self._derived: Dict[Hashable, object] = {}
+        self.checks = 0
+        self.reloads = 0
+
+    def _is_fresh(self) -> bool:
+        return self._values is not None and time.monotonic() - self._checked_at < self.check_interval
+
+    def _refresh(self):
+        """超過檢查間隔時比對版本值，有變動才重新讀取設定"""
+        if self._is_fresh():
+            return
+        with self._lock:
+            if self._is_fresh():
+                return
+            version = self.source.version()
+            self.checks += 1
+            if self._values is None or version != self._version:
+                values = self.source.load()
+                if values != self._values:
+                    self._values = values
+                    self._derived = {}
+                    self.reloads += 1
+                self._version = version
+            self._checked_at = time.monotonic()
+
+    def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        """取得設定值"""
+        self._refresh()
+        return self._values.get(key, default)
+
+    def derived(self, key: Hashable, build: Callable[[Dict[str, str]], object]):
+        """取得由設定推導出的資料 (例如解析後的截止時間)，設定變動後才以 build(設定) 重建"""
+        self._refresh()
+        derived = self._derived
+        value = derived.get(key)
+        if value is None:
+            value = derived[key] = build(self._values)
+        return value
+
+    def invalidate(self):
+        """本程序修改設定後呼叫 (SQLite 同一條連線的寫入不會改變 data_version)"""
+        with self._lock:
+            self._values = None
+            self._derived = {}
+
+    def close(self):
+        with self._lock:
+            self.source.close()
+
+    def stats(self) -> Dict:
+        return {
+            'keys': len(self._values or ()),
+            'checks': self.checks,
+            'reloads': self.reloads
+        }
+
+
+def parse_deadlines(values: Dict[str, str]) -> Dict[Tuple[str, str], clock]:
+    """將 bus_day_deadline 等設定解析成 {(預約類型, 班別): 截止時間}"""
+    deadlines = {}
+    for (booking_type, shift_type), default in DEFAULT_DEADLINES.items():
+        key = f'{booking_type}_{shift_type}_deadline'
+        raw = values.get(key) or default
+        try:
+            deadlines[booking_type, shift_type] = clock.fromisoformat(raw.strip())
+        except ValueError:
+            logger.warning("⚠️ 系統設定 %s 格式錯誤 (%s)，改用預設 %s", key, raw, default)
+            deadlines[booking_type, shift_type] = clock.fromisoformat(default)
+    return deadlines
+
+
+class DeadlineEvaluator:
+    """依 system_settings 判斷現在是否還能預約 (台北時間)"""
+
+    def __init__(self, settings: SettingsCache):
+        self.settings = settings
+
+    def deadline(self, booking_type: str, shift_type: Optional[str]) -> clock:
+        """截止時間；班別不是 day 時視為夜班"""
+        deadlines = self.settings.derived('deadlines', parse_deadlines)
+        return deadlines[booking_type, 'day' if shift_type == 'day' else 'night']
+
+    def is_open(self, booking_type: str, shift_type: Optional[str], now: Optional[datetime] = None) -> bool:
+        """截止時間那一分鐘內仍可預約 (設為 23:59 等於整天開放)"""
+        now = (now or taipei_now()).astimezone(TAIPEI_TZ)
+        return now.time().replace(second=0, microsecond=0) <= self.deadline(booking_type, shift_type)
@@ -0,0 +1,151 @@
+"""本機 LINE Messaging API 模擬伺服器
+
+給測試、壓力測試與效能評估使用，不會真的發送訊息。
+支援 reply / push / multicast，可設定模擬延遲與錯誤，並統計請求數與 TCP 連線數。
+
+單獨執行：python stub_line_server.py [port] [延遲毫秒]
+之後以 LINE_API_HOST=http://127.0.0.1:<port> 啟動 app.py 即可。
+"""
+import sys
+import json
+import time
+import uuid
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+MESSAGE_PATHS = {
+    '/v2/bot/message/reply': 'reply',
+    '/v2/bot/message/push': 'push',
+    '/v2/bot/message/multicast': 'multicast'
+}
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # 支援 keep-alive
+    disable_nagle_algorithm = True  # 標頭與內容分兩次寫出，避免 keep-alive 連線卡在 Nagle 延遲
+    
+    def setup(self):
+        super().setup()
+        self.server.stub.record_connection()
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def do_POST(self):
+        stub = self.server.stub
+        length = int(self.headers.get('Content-Length', 0))
+        raw = self.rfile.read(length) if length else b''
+        kind = MESSAGE_PATHS.get(self.path.split('?', 1)[0])
+        if kind is None:
+            self._send(404, {'message': 'Not found'})
+            return
+        
+        try:
+            payload = json.loads(raw or b'{}')
+        except ValueError:
+            self._send(400, {'message': 'The request body has 1 error(s)'})
+            return
+        
+        if stub.latency:
+            time.sleep(stub.latency)
+        
+        status = stub.next_status()
+        stub.record_request(kind, payload, status)
+        if status != 200:
+            self._send(status, {'message': 'stub error'})
+            return
+        
+        if kind == 'reply' or kind == 'push':
+            body = {'sentMessages': [{'id': uuid.uuid4().hex[:18]} for _ in payload.get('messages', [])]}
+        else:
+            body = {}
+        self._send(200, body)
+    
+    def _send(self, status: int, body: Dict):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        if status == 429:
+            self.send_header('Retry-After', '1')
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class StubLineServer:
+    """在背景執行緒執行的 LINE API 模擬伺服器"""
+    
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency_ms: float = 0,
+                 keep_requests: bool = True):
+        self.latency = latency_ms / 1000
+        self.keep_requests = keep_requests
+        self.requests: List[Dict] = []
+        self.counts: Dict[str, int] = {}
+        self.connections = 0
+        self.failures: List[int] = []  # 依序回傳的錯誤狀態碼，例如 [429, 500]
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _StubHandler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread: Optional[threading.Thread] = None
+    
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+    
+    def start(self) -> 'StubLineServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='stub-line-server', daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread:
+            self._thread.join()
+    
+    def __enter__(self) -> 'StubLineServer':
+        return self.start()
+    
+    def __exit__(self, *exc):
+        self.stop()
+    
+    def fail_next(self, *statuses: int):
+        """讓接下來的請求依序回傳指定錯誤碼"""
+        with self._lock:
+            self.failures.extend(statuses)
+    
+    def next_status(self) -> int:
+        with self._lock:
+            return self.failures.pop(0) if self.failures else 200
+    
+    def record_connection(self):
+        with self._lock:
+            self.connections += 1
+    
+    def record_request(self, kind: str, payload: Dict, status: int):
+        with self._lock:
+            key = kind if status == 200 else f'{kind}_{status}'
+            self.counts[key] = self.counts.get(key, 0) + 1
+            if self.keep_requests:
+                self.requests.append({'kind': kind, 'status': status, 'payload': payload})
+    
+    def reset(self):
+        with self._lock:
+            self.requests.clear()
+            self.counts.clear()
+            self.connections = 0
+            self.failures.clear()
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8088
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0
+    server = StubLineServer(port=port, latency_ms=latency, keep_requests=False)
+    print(f"🧪 LINE API 模擬伺服器：{server.url} (延遲 {latency}ms)")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"📊 請求統計：{server.counts}，連線數：{server.connections}")
@@ -0,0 +1,83 @@
+import os
+import sqlite3
+from datetime import date
+
+import pytest
+
+from archive import archive_closed_months, daily_summary, history
+from database import DatabaseManager
+
+TODAY = date(2024, 6, 15)
+DAYS = [date(2024, month, day) for month in (1, 2, 3, 4, 5, 6) for day in (3, 17)]
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = DatabaseManager(os.path.join(tmp_path, 'test.db'))
+    db.insert_initial_data()
+    with db.connection() as conn:
+        conn.executemany('''
+            INSERT INTO employees (employee_id, name, department_id, shift_type) VALUES (?, ?, 1, 'day')
+        ''', [(f'IGA1-{i:05d}', f'員工{i}') for i in range(1, 4)])
+        for day in DAYS:
+            conn.executemany('''
+                INSERT INTO bus_reservations (employee_id, schedule_id, reservation_date, status) VALUES (?, 1, ?, ?)
+            ''', [(1, day, 'cancelled'), (1, day, 'active'), (2, day, 'active')])
+            conn.executemany('''
+                INSERT INTO meal_orders (employee_id, restaurant_id, order_date, status) VALUES (?, 1, ?, ?)
+            ''', [(1, day, 'active'), (3, day, 'cancelled')])
+            conn.execute('INSERT INTO meal_counts (order_date, restaurant_id, ordered) VALUES (?, 1, 1)', (day,))
+        conn.commit()
+    yield db
+    db.pool.close_all()
+
+
+def count(db, sql):
+    with db.connection() as conn:
+        return conn.execute(sql).fetchone()[0]
+
+
+def test_closed_months_move_to_archives_and_reports_union_them(db, tmp_path):
+    archive_dir = os.path.join(tmp_path, 'archive')
+    with history(db, archive_dir=archive_dir) as conn:
+        before = daily_summary(conn, DAYS[0], DAYS[-1])
+
+    moved = archive_closed_months(db, keep_months=3, today=TODAY, archive_dir=archive_dir)
+    # 保留 4~6 月；1~3 月每月 2 天 × (3 預約 + 2 訂餐 + 1 計數)
+    assert moved == {'2024-01': 12, '2024-02': 12, '2024-03': 12}
+    assert sorted(os.listdir(archive_dir)) == [f'linebot_archive_2024-0{m}.db' for m in (1, 2, 3)]
+    assert count(db, 'SELECT MIN(reservation_date) FROM bus_reservations') == '2024-04-03'
+    assert count(db, 'SELECT MIN(order_date) FROM meal_counts') == '2024-04-03'
+
+    with history(db, archive_dir=archive_dir) as conn:
+        assert daily_summary(conn, DAYS[0], DAYS[-1]) == before
+        assert conn.execute('SELECT COUNT(*) FROM all_meal_counts').fetchone()[0] == len(DAYS)
+    # 只附加查詢期間的封存檔
+    with history(db, date(2024, 2, 1), date(2024, 4, 30), archive_dir) as conn:
+        attached = [row[1] for row in conn.execute('PRAGMA database_list')]
+        assert attached == ['main', 'temp', 'archive_2024_02', 'archive_2024_03']
+
+    # 再執行一次沒有事可做
+    assert archive_closed_months(db, keep_months=3, today=TODAY, archive_dir=archive_dir) == {}
+
+
+def test_interrupted_run_resumes_without_duplicates(db, tmp_path):
+    archive_dir = os.path.join(tmp_path, 'archive')
+    assert archive_closed_months(db, keep_months=6, today=TODAY, archive_dir=archive_dir) == {}
+
+    # 模擬中斷：1 月的資料已寫入封存檔，但主資料庫還沒刪除
+    os.makedirs(archive_dir)
+    archive = sqlite3.connect(os.path.join(archive_dir, 'linebot_archive_2024-01.db'))
+    archive.execute("ATTACH DATABASE ? AS main_db", (db.db_path,))
+    archive.execute("CREATE TABLE bus_reservations AS SELECT * FROM main_db.bus_reservations WHERE 0")
+    archive.execute("CREATE UNIQUE INDEX idx_id ON bus_reservations (id)")
+    archive.execute("INSERT INTO bus_reservations SELECT * FROM main_db.bus_reservations "
+                    "WHERE reservation_date < '2024-01-10'")
+    archive.commit()
+    archive.close()
+
+    moved = archive_closed_months(db, keep_months=5, today=TODAY, archive_dir=archive_dir)
+    assert moved == {'2024-01': 12}
+    with history(db, archive_dir=archive_dir) as conn:
+        assert conn.execute('SELECT COUNT(*), COUNT(DISTINCT id) FROM all_bus_reservations').fetchone() == (
+            3 * len(DAYS), 3 * len(DAYS))
@@ -0,0 +1,228 @@
+import os
+import hmac
+import json
+import base64
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+
+import pytest
+
+from webhook_queue import EventDispatcher
+
+# 與 Flask 版 callback 依序送出相同的事件，比較兩邊回覆給 LINE 的內容
+STEPS = [
+    ('message', 'hello'),                      # 未綁定
+    ('message', 'IGA1-00001'),                 # 綁定
+    ('message', 'menu'),
+    ('message', 'thanks'),
+    ('postback', 'action=language_menu'),
+    ('postback', 'action=change_language&lang=en'),
+    ('postback', 'action=bus_booking'),
+    ('postback', 'action=bus_route&route_id=1&route_code=R1'),
+    ('postback', 'action=bus_confirm&schedule_id=1&time=17:30'),
+    ('postback', 'action=meal_confirm&restaurant_ids=1&floor=1F'),
+    ('postback', 'action=view_booking'),
+    ('postback', 'action=generate_qr'),
+    ('postback', 'action=cancel_booking'),
+    ('postback', 'action=cancel_confirm&type=bus'),
+    ('postback', 'action=cancel_confirm&type=bus'),
+    ('postback', 'action=no_such_action'),
+]
+
+
+def webhook_body(kind: str, payload: str, event_id: str) -> bytes:
+    event = {
+        'type': kind, 'mode': 'active', 'timestamp': 1700000000000,
+        'webhookEventId': event_id, 'deliveryContext': {'isRedelivery': False},
+        'replyToken': f'token-{event_id}', 'source': {'type': 'user', 'userId': 'Uasgitest'},
+    }
+    if kind == 'message':
+        event['message'] = {'type': 'text', 'id': event_id, 'text': payload, 'quoteToken': 'q'}
+    else:
+        event['postback'] = {'data': payload}
+    return json.dumps({'destination': 'Ubot', 'events': [event]}).encode('utf-8')
+
+
+def sign(body: bytes) -> str:
+    return base64.b64encode(hmac.new(os.environ['CHANNEL_SECRET'].encode('utf-8'), body, hashlib.sha256).digest()).decode('ascii')
+
+
+@pytest.fixture(scope='module')
+def apps(bot):
+    """app (conftest.py 的 bot) 與 ASGI 進入點"""
+    import asgi
+    return bot, asgi
+
+
+def restore(bot, snapshot: sqlite3.Connection):
+    """還原到送出事件前的資料，清除程序內快取"""
+    with bot.db.connection() as conn:
+        snapshot.backup(conn)
+    bot.db.employee_cache.clear()
+    bot.menu_catalog.invalidate()
+    bot.system_settings.invalidate()
+
+
+def run_flask(bot, monkeypatch, prefix: str):
+    replies, statuses = [], []
+    monkeypatch.setattr(bot.line_api, 'reply', lambda token, messages: replies.append(
+        (token.replace(prefix, ''), [m.to_dict() for m in messages])))
+    client = bot.app.test_client()
+    for index, (kind, payload) in enumerate(STEPS):
+        body = webhook_body(kind, payload, f'{prefix}{index:04d}')
+        response = client.post('/callback', data=body, headers={'X-Line-Signature': sign(body)})
+        statuses.append(response.status_code)
+    return replies, statuses
+
+
+class RecordingLineApi:
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.replies = []
+
+    async def reply(self, token, messages):
+        await asyncio.sleep(0)
+        self.replies.append((token.replace(self.prefix, ''), [m.to_dict() for m in messages]))
+
+    async def close(self):
+        pass
+
+
+async def asgi_request(asgi_app, method: str, path: str, body: bytes = b'', headers=()):
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'client': ('127.0.0.1', 50000),
+             'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]}
+    await asgi_app(scope, receive, send)
+    return sent[0]['status'], b''.join(m.get('body', b'') for m in sent[1:])
+
+
+def test_async_replies_match_flask_handlers(apps, monkeypatch):
+    bot, asgi = apps
+    snapshot = sqlite3.connect(':memory:')
+    with bot.db.connection() as conn:
+        conn.backup(snapshot)
+
+    flask_replies, flask_statuses = run_flask(bot, monkeypatch, 'F')
+    restore(bot, snapshot)
+
+    line_api = RecordingLineApi('A')
+    monkeypatch.setattr(asgi.app, 'line_api', line_api)
+
+    async def run():
+        statuses = []
+        for index, (kind, payload) in enumerate(STEPS):
+            body = webhook_body(kind, payload, f'A{index:04d}')
+            status, _ = await asgi_request(asgi.app, 'POST', '/callback', body,
+                                           [('X-Line-Signature', sign(body))])
+            statuses.append(status)
+        return statuses
+
+    asgi_statuses = asyncio.run(run())
+    assert asgi_statuses == flask_statuses == [200] * len(STEPS)
+    assert len(line_api.replies) == len(STEPS)
+    assert line_api.replies == flask_replies
+
+
+def test_signature_redelivery_and_other_routes(apps, monkeypatch):
+    bot, asgi = apps
+    line_api = RecordingLineApi('R')
+    monkeypatch.setattr(asgi.app, 'line_api', line_api)
+    body = webhook_body('postback', 'action=main_menu', 'R0001')
+
+    async def run():
+        results = [
+            await asgi_request(asgi.app, 'POST', '/callback', body, [('X-Line-Signature', 'bad')]),
+            await asgi_request(asgi.app, 'POST', '/callback', body),
+            # 不是 UTF-8 的內容在驗證簽章前就回 400
+            await asgi_request(asgi.app, 'POST', '/callback', b'\xff\xfe', [('X-Line-Signature', sign(b'\xff\xfe'))]),
+            await asgi_request(asgi.app, 'POST', '/callback', body, [('X-Line-Signature', sign(body))]),
+            # 重送的事件只回覆一次
+            await asgi_request(asgi.app, 'POST', '/callback', body, [('X-Line-Signature', sign(body))]),
+            await asgi_request(asgi.app, 'GET', '/'),
+            await asgi_request(asgi.app, 'GET', '/stats'),
+        ]
+        return results
+
+    results = asyncio.run(run())
+    assert [status for status, _ in results] == [400, 400, 400, 200, 200, 200, 200]
+    assert len(line_api.replies) == 1
+    assert '交通車預約系統' in results[5][1].decode('utf-8')
+    assert 'db_pool' in json.loads(results[6][1])
+
+
+def test_request_and_event_ids_reach_log_records(apps, monkeypatch):
+    from logs import ContextFilter
+    bot, asgi = apps
+    records = []
+    handler = logging.Handler()
+    handler.addFilter(ContextFilter())
+    handler.emit = records.append
+    bot.logger.addHandler(handler)
+    monkeypatch.setattr(asgi.app, 'line_api', RecordingLineApi('L'))
+    # 產生回覆時記錄一筆 (ASGI 版在執行緒池中執行)
+    monkeypatch.setattr(bot, 'send_reply', lambda event, messages: bot.logger.info('reply'))
+    monkeypatch.setitem(bot.REPLY_BUILDERS, 'postback', lambda event: bot.logger.info('reply'))
+    try:
+        body = webhook_body('postback', 'action=main_menu', 'L0001')
+        response = bot.app.test_client().post('/callback', data=body, headers={
+            'X-Line-Signature': sign(body), 'X-Request-Id': 'req-flask'})
+        assert response.headers['X-Request-Id'] == 'req-flask'
+
+        body = webhook_body('postback', 'action=main_menu', 'L0002')
+        status, _ = asyncio.run(asgi_request(asgi.app, 'POST', '/callback', body, [
+            ('X-Line-Signature', sign(body)), ('X-Request-Id', 'req-asgi')]))
+        assert status == 200
+    finally:
+        bot.logger.removeHandler(handler)
+
+    fields = [(r.getMessage(), r.request_id, getattr(r, 'event_id', None)) for r in records]
+    assert fields == [('webhook received', 'req-flask', None), ('reply', 'req-flask', 'L0001'),
+                      ('webhook received', 'req-asgi', None), ('reply', 'req-asgi', 'L0002')]
+    # 原始內容 (LINE user ID) 不會出現在日誌
+    assert 'Uasgitest' not in str(records[0].webhook)
+
+
+def test_full_webhook_queue_returns_503(apps, monkeypatch):
+    bot, _ = apps
+    release, started = threading.Event(), threading.Event()
+    handled = []
+
+    def handle(event):
+        started.set()
+        release.wait(5)
+        handled.append(event.webhook_event_id)
+
+    dispatcher = EventDispatcher(handle, workers=1, queue_size=1, enqueue_timeout=0.05)
+    dispatcher.start()
+    monkeypatch.setattr(bot, 'event_dispatcher', dispatcher)
+    client = bot.app.test_client()
+
+    def post(event_id):
+        body = webhook_body('postback', 'action=main_menu', event_id)
+        return client.post('/callback', data=body, headers={'X-Line-Signature': sign(body)}).status_code
+
+    try:
+        assert post('Q0001') == 200
+        assert started.wait(5)
+        assert post('Q0002') == 200
+        # worker 忙碌且佇列已滿：回應 503 讓 LINE 稍後重送
+        assert post('Q0003') == 503
+    finally:
+        release.set()
+        dispatcher.stop()
+    # 被拒收的事件沒有登記為已處理，重送時照常處理
+    dispatcher.start()
+    assert post('Q0003') == 200
+    dispatcher.stop()
+    assert handled == ['Q0001', 'Q0002', 'Q0003']
+    assert dispatcher.stats()['rejected'] == 1
@@ -0,0 +1,135 @@
+import os
+import sqlite3
+import threading
+from datetime import date
+
+import pytest
+
+from booking import book_bus, book_meal, cancel_bus, cancel_meal
+from database import DatabaseManager
+from kitchen import reconcile_meal_counts
+
+TODAY = date.today()
+EMPLOYEES = 20
+TAPS = 4
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = DatabaseManager(os.path.join(tmp_path, 'test.db'), pool_size=16)
+    db.insert_initial_data()
+    with db.connection() as conn:
+        conn.executemany('''
+            INSERT INTO employees (employee_id, name, department_id, shift_type)
+            VALUES (?, ?, 1, 'day')
+        ''', [(f'IGA1-{i:05d}', f'員工{i}') for i in range(EMPLOYEES)])
+        conn.commit()
+    yield db
+    db.pool.close_all()
+
+
+def rows(db, sql, *params):
+    with db.connection() as conn:
+        return conn.execute(sql, params).fetchall()
+
+
+def test_double_taps_leave_one_active_booking_per_day(db):
+    # 每位員工同時連點數次，每次選不同班次/餐廳
+    start = threading.Barrier(EMPLOYEES * TAPS)
+
+    def tap(employee_id, n):
+        start.wait()
+        with db.connection() as conn:
+            book_bus(conn, employee_id, 1 + n % 2, TODAY)
+            book_meal(conn, employee_id, 1 + n % 3, TODAY)
+
+    threads = [threading.Thread(target=tap, args=(e + 1, n)) for e in range(EMPLOYEES) for n in range(TAPS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    bus = rows(db, '''
+        SELECT employee_id, COUNT(*) FROM bus_reservations
+        WHERE reservation_date = ? AND status = 'active' GROUP BY employee_id
+    ''', TODAY)
+    meal = rows(db, '''
+        SELECT employee_id, COUNT(*) FROM meal_orders
+        WHERE order_date = ? AND status = 'active' GROUP BY employee_id
+    ''', TODAY)
+    assert sorted(bus) == [(e + 1, 1) for e in range(EMPLOYEES)]
+    assert sorted(meal) == [(e + 1, 1) for e in range(EMPLOYEES)]
+
+    # 座位計數與有效預約一致
+    counters = dict(rows(db, 'SELECT schedule_id, booked FROM bus_seat_counters WHERE reservation_date = ?', TODAY))
+    active = dict(rows(db, '''
+        SELECT schedule_id, COUNT(*) FROM bus_reservations
+        WHERE reservation_date = ? AND status = 'active' GROUP BY schedule_id
+    ''', TODAY))
+    assert {k: v for k, v in counters.items() if v} == active
+    with db.connection() as conn:
+        assert reconcile_meal_counts(conn, TODAY) == []
+
+
+def test_rebooking_keeps_history(db):
+    with db.connection() as conn:
+        book_bus(conn, 1, 1, TODAY)
+        book_bus(conn, 1, 2, TODAY)
+        assert book_meal(conn, 1, 1, TODAY)
+        assert book_meal(conn, 1, 2, TODAY)
+        # 重複點同一家餐廳不會產生新紀錄
+        assert not book_meal(conn, 1, 2, TODAY)
+
+    assert rows(db, 'SELECT schedule_id, status FROM bus_reservations WHERE employee_id = 1 ORDER BY status') == [
+        (2, 'active'), (1, 'cancelled')]
+    assert rows(db, 'SELECT restaurant_id, status FROM meal_orders WHERE employee_id = 1 ORDER BY status') == [
+        (2, 'active'), (1, 'cancelled')]
+
+    with db.connection() as conn:
+        assert cancel_bus(conn, 1, TODAY) == 1
+        assert cancel_meal(conn, 1, TODAY) == 1
+        assert cancel_meal(conn, 1, TODAY) == 0
+    assert rows(db, "SELECT COUNT(*) FROM bus_reservations WHERE status = 'cancelled'") == [(2,)]
+    assert rows(db, "SELECT COUNT(*) FROM meal_orders WHERE status = 'cancelled'") == [(2,)]
+
+
+def test_second_active_row_is_rejected(db):
+    with db.connection() as conn:
+        conn.execute('INSERT INTO meal_orders (employee_id, restaurant_id, order_date) VALUES (1, 1, ?)', (TODAY,))
+        with pytest.raises(sqlite3.IntegrityError):
+            conn.execute('INSERT INTO meal_orders (employee_id, restaurant_id, order_date) VALUES (1, 2, ?)', (TODAY,))
+        conn.rollback()
+
+
+def test_migration_deduplicates_existing_rows(tmp_path):
+    path = os.path.join(tmp_path, 'legacy.db')
+    db = DatabaseManager(path)
+    db.insert_initial_data()
+    db.pool.close_all()
+
+    # 模擬第 4 版以前的資料庫：非唯一索引、同一天有多筆有效紀錄
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        DROP INDEX idx_bus_reservations_active;
+        DROP INDEX idx_meal_orders_active;
+        DROP TRIGGER trg_bus_reservations_history;
+        DROP TRIGGER trg_meal_orders_history;
+        DELETE FROM schema_version WHERE version >= 4;
+        INSERT INTO employees (employee_id, name, department_id, shift_type) VALUES ('IGA1-00001', '員工', 1, 'day');
+    ''')
+    conn.executemany('INSERT INTO bus_reservations (employee_id, schedule_id, reservation_date) VALUES (1, ?, ?)',
+                     [(1, TODAY), (2, TODAY)])
+    conn.executemany('INSERT INTO meal_orders (employee_id, restaurant_id, order_date) VALUES (1, ?, ?)',
+                     [(1, TODAY), (2, TODAY), (3, TODAY)])
+    conn.execute('INSERT INTO bus_seat_counters (schedule_id, reservation_date, booked) VALUES (1, ?, 1), (2, ?, 1)',
+                 (TODAY, TODAY))
+    conn.commit()
+    conn.close()
+
+    db = DatabaseManager(path)
+    try:
+        assert rows(db, "SELECT schedule_id FROM bus_reservations WHERE status = 'active'") == [(2,)]
+        assert rows(db, "SELECT restaurant_id FROM meal_orders WHERE status = 'active'") == [(3,)]
+        assert rows(db, 'SELECT schedule_id, booked FROM bus_seat_counters') == [(2, 1)]
+    finally:
+        db.pool.close_all()
@@ -0,0 +1,74 @@
+import os
+import threading
+from datetime import date
+
+import pytest
+
+from booking import book_bus, cancel_bus
+from database import DatabaseManager
+
+TODAY = date.today()
+SEAT_LIMIT = 10
+RIDERS = 60
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = DatabaseManager(os.path.join(tmp_path, 'test.db'), pool_size=16)
+    db.insert_initial_data()
+    with db.connection() as conn:
+        conn.executemany('''
+            INSERT INTO employees (employee_id, name, department_id, shift_type)
+            VALUES (?, ?, 1, 'day')
+        ''', [(f'IGA1-{i:05d}', f'員工{i}') for i in range(RIDERS)])
+        conn.execute('UPDATE bus_schedules SET seat_limit = ? WHERE id IN (1, 2)', (SEAT_LIMIT,))
+        conn.commit()
+    yield db
+    db.pool.close_all()
+
+
+def active_count(db, schedule_id):
+    with db.connection() as conn:
+        booked = conn.execute('''
+            SELECT COUNT(*) FROM bus_reservations
+            WHERE schedule_id = ? AND reservation_date = ? AND status = 'active'
+        ''', (schedule_id, TODAY)).fetchone()[0]
+        counter = conn.execute('''
+            SELECT COALESCE(MAX(booked), 0) FROM bus_seat_counters
+            WHERE schedule_id = ? AND reservation_date = ?
+        ''', (schedule_id, TODAY)).fetchone()[0]
+    return booked, counter
+
+
+def test_concurrent_bookings_never_exceed_seat_limit(db):
+    results = []
+    start = threading.Barrier(RIDERS)
+    
+    def rider(employee_id):
+        start.wait()
+        with db.connection() as conn:
+            results.append(book_bus(conn, employee_id, 1, TODAY))
+    
+    threads = [threading.Thread(target=rider, args=(i + 1,)) for i in range(RIDERS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    
+    assert sum(r['success'] for r in results) == SEAT_LIMIT
+    assert sum(r['full'] for r in results) == RIDERS - SEAT_LIMIT
+    assert active_count(db, 1) == (SEAT_LIMIT, SEAT_LIMIT)
+    assert sorted(r['remaining'] for r in results if r['success']) == list(range(SEAT_LIMIT))
+
+
+def test_switching_and_cancelling_release_seats(db):
+    with db.connection() as conn:
+        assert book_bus(conn, 1, 1, TODAY)['remaining'] == SEAT_LIMIT - 1
+        # 改訂其他班次：原班次座位釋出
+        assert book_bus(conn, 1, 2, TODAY)['remaining'] == SEAT_LIMIT - 1
+        assert active_count(db, 1) == (0, 0)
+        # 重複點同一班不會多佔位
+        assert book_bus(conn, 1, 2, TODAY)['remaining'] == SEAT_LIMIT - 1
+        assert cancel_bus(conn, 1, TODAY) == 1
+        assert cancel_bus(conn, 1, TODAY) == 0
+    assert active_count(db, 2) == (0, 0)
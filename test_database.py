@@ -0,0 +1,72 @@
+import os
+import sqlite3
+import threading
+from datetime import date
+
+import pytest
+
+from booking import book_bus
+from database import SQL_BUSY_RETRIES, DatabaseManager, is_busy_error
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    # 縮短 busy_timeout，讓鎖住的情況很快就變成 SQLITE_BUSY
+    monkeypatch.setenv('SQLITE_BUSY_TIMEOUT_MS', '50')
+    db = DatabaseManager(os.path.join(tmp_path, 'test.db'))
+    db.insert_initial_data()
+    with db.connection() as conn:
+        conn.execute("INSERT INTO employees (employee_id, name, department_id, shift_type) VALUES ('IGA1-00001', '員工1', 1, 'day')")
+        conn.commit()
+    yield db
+    db.pool.close_all()
+
+
+def test_write_retried_while_other_process_holds_lock(db):
+    # 另一個程序 (另一條連線) 持有寫入鎖 0.2 秒
+    other = sqlite3.connect(db.db_path, isolation_level=None, check_same_thread=False)
+    other.execute('BEGIN IMMEDIATE')
+    release = threading.Timer(0.2, other.execute, args=('COMMIT',))
+    release.start()
+
+    before = SQL_BUSY_RETRIES.labels().value
+    result = db.run_write(book_bus, 1, 1, date(2026, 1, 5))
+    release.join()
+    other.close()
+    assert result['success']
+    assert SQL_BUSY_RETRIES.labels().value > before
+
+    # 重試次數用完仍被鎖住時拋出原本的錯誤；其他錯誤不重試
+    db.busy_retries = 1
+    other = sqlite3.connect(db.db_path, isolation_level=None)
+    other.execute('BEGIN IMMEDIATE')
+    with pytest.raises(sqlite3.OperationalError) as excinfo:
+        db.run_write(book_bus, 1, 2, date(2026, 1, 5))
+    other.execute('ROLLBACK')
+    other.close()
+    assert is_busy_error(excinfo.value)
+
+    calls = []
+
+    def broken(conn):
+        calls.append(1)
+        conn.execute('SELECT * FROM no_such_table')
+
+    with pytest.raises(sqlite3.OperationalError):
+        db.run_write(broken)
+    assert len(calls) == 1
+
+
+def test_employee_cache_follows_changes_from_other_processes(db):
+    db.employee_check_interval = 0
+    other = DatabaseManager(db.db_path)  # 另一個 worker 程序
+    assert db.get_employee_by_line_id('U1') is None
+
+    assert other.bind_line_user('U1', 'IGA1-00001')['success']
+    assert db.get_employee_by_line_id('U1')['preferred_language'] == 'zh'
+
+    with other.connection() as conn:
+        conn.execute("UPDATE employees SET preferred_language = 'vi' WHERE employee_id = 'IGA1-00001'")
+        conn.commit()
+    assert db.get_employee_by_line_id('U1')['preferred_language'] == 'vi'
+    other.pool.close_all()
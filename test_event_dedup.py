@@ -0,0 +1,88 @@
+import os
+import sqlite3
+import threading
+
+import pytest
+
+from database import SQL_BUSY_RETRIES, DatabaseManager
+from event_dedup import EventDeduplicator
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = DatabaseManager(os.path.join(tmp_path, 'test.db'), pool_size=8)
+    yield db
+    db.pool.close_all()
+
+
+def test_redelivered_event_is_claimed_once(db):
+    dedup = EventDeduplicator(db)
+    assert dedup.claim('01HEVENT0001')
+    assert not dedup.claim('01HEVENT0001', redelivery=True)
+    # 沒有事件 ID 時無法判斷，照常處理
+    assert dedup.claim(None) and dedup.claim(None)
+
+    # 其他程序 (記憶體是空的) 也會從資料表判斷出重複
+    other = EventDeduplicator(db)
+    assert not other.claim('01HEVENT0001')
+    assert dedup.stats() == {'processed': 3, 'duplicates': 1, 'redeliveries': 1,
+                             'duplicate_rate': 0.25, 'memory_entries': 1}
+
+
+def test_concurrent_claims_only_one_wins(db):
+    # 多個 worker 程序同時收到同一個重送事件
+    instances = [EventDeduplicator(db) for _ in range(8)]
+    start = threading.Barrier(len(instances))
+    results = []
+
+    def claim(dedup):
+        start.wait()
+        results.append(dedup.claim('01HEVENT0002'))
+
+    threads = [threading.Thread(target=claim, args=(dedup,)) for dedup in instances]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(results) == [False] * 7 + [True]
+
+
+def test_expired_and_released_events_can_be_processed_again(db):
+    dedup = EventDeduplicator(db, ttl=60, purge_interval=0)
+    assert dedup.claim('old', now=1000.0)
+    assert not EventDeduplicator(db, ttl=60).claim('old', now=1059.0)
+    assert EventDeduplicator(db, ttl=60).claim('old', now=1061.0)
+
+    # 超過保存期限的紀錄在之後的登記時清除
+    assert dedup.claim('new', now=2000.0)
+    with db.connection() as conn:
+        assert conn.execute('SELECT event_id FROM webhook_events').fetchall() == [('new',)]
+
+    dedup.release('new')
+    assert dedup.claim('new', now=2001.0)
+
+
+def test_claim_and_release_retry_while_other_worker_holds_lock(tmp_path, monkeypatch):
+    # 縮短 busy_timeout，讓鎖住的情況很快就變成 SQLITE_BUSY
+    monkeypatch.setenv('SQLITE_BUSY_TIMEOUT_MS', '50')
+    db = DatabaseManager(os.path.join(tmp_path, 'busy.db'))
+    dedup = EventDeduplicator(db)
+    try:
+        for action in (lambda: dedup.claim('01HEVENT0003'), lambda: dedup.release('01HEVENT0003')):
+            # 另一個 worker 程序持有寫入鎖 0.2 秒
+            other = sqlite3.connect(db.db_path, isolation_level=None, check_same_thread=False)
+            other.execute('BEGIN IMMEDIATE')
+            release = threading.Timer(0.2, other.execute, args=('COMMIT',))
+            release.start()
+            before = SQL_BUSY_RETRIES.labels().value
+            try:
+                action()
+            finally:
+                release.join()
+                other.close()
+            assert SQL_BUSY_RETRIES.labels().value > before
+
+        # 取消登記已寫入資料表，其他程序可再次登記
+        assert EventDeduplicator(db).claim('01HEVENT0003')
+    finally:
+        db.pool.close_all()
@@ -0,0 +1,37 @@
+import pytest
+
+from i18n import CATALOG, LANGUAGES, MESSAGES, Catalog, CatalogError, StaticMessages
+
+
+def test_every_key_is_translated():
+    assert Catalog.validate(MESSAGES) == []
+    assert CATALOG.get('seats_remaining', 'vi', 3) == '💺 Số ghế còn lại: 3'
+    # 不支援的語言以中文顯示，未知的 key 原樣回傳
+    assert CATALOG.get('no_bookings', 'ja') == MESSAGES['zh']['no_bookings']
+    assert CATALOG.get('no_such_key', 'en') == 'no_such_key'
+
+
+def test_missing_translation_or_placeholder_fails_at_load():
+    messages = {lang: dict(MESSAGES[lang]) for lang in LANGUAGES}
+    del messages['vi']['bus_full']
+    messages['en']['seats_remaining'] = '💺 Seats left'
+    with pytest.raises(CatalogError) as excinfo:
+        Catalog(messages)
+    assert 'vi 缺少 bus_full' in str(excinfo.value)
+    assert 'seats_remaining 各語言參數不一致' in str(excinfo.value)
+
+
+def test_static_messages_are_built_once_per_language():
+    static = StaticMessages()
+    calls = []
+
+    @static.register
+    def menu(lang='zh'):
+        calls.append(lang)
+        return {'title': CATALOG.get('main_menu_title', lang)}
+
+    assert menu('en') is menu('en')
+    assert menu('ja') is menu('zh')
+    static.prebuild()
+    assert sorted(calls) == sorted(LANGUAGES)
+    assert menu.__wrapped__('vi') is not menu('vi')
@@ -0,0 +1,95 @@
+import os
+import json
+
+import pytest
+
+from database import DatabaseManager
+from import_employees import import_employees, read_rows
+from repository import SQLiteStorage
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = DatabaseManager(os.path.join(tmp_path, 'test.db'))
+    db.insert_initial_data()
+    yield db
+    db.pool.close_all()
+
+
+@pytest.fixture
+def storage(db):
+    storage = SQLiteStorage(db)
+    yield storage
+    storage.close()
+
+
+def write(tmp_path, name, text):
+    path = os.path.join(tmp_path, name)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return path
+
+
+def employees(db):
+    with db.connection() as conn:
+        return {row[0]: row[1:] for row in conn.execute(
+            'SELECT employee_id, name, shift_type, preferred_language, status FROM employees')}
+
+
+def test_csv_import_counts_and_validation(db, storage, tmp_path):
+    path = write(tmp_path, 'hr.csv', '\n'.join([
+        'employee_id,name,dept_code,shift_type,preferred_language',
+        'IGA1-00001,王小明,IT,day,zh',
+        'iga1-00002,Nguyen Van A,PROD,夜班,vi',
+        'IGA1-123,格式錯誤,IT,day,zh',
+        'IGA1-00003,部門錯誤,NOPE,day,zh',
+        'IGA1-00004,,IT,day,zh',
+    ]) + '\n')
+    result = import_employees(storage, read_rows(path), chunk_size=2)
+    
+    assert (result['inserted'], result['updated'], result['rejected']) == (2, 0, 3)
+    assert result['errors'][0].startswith('第 4 行')
+    assert employees(db)['IGA1-00002'] == ('Nguyen Van A', 'night', 'vi', 'active')
+
+
+def test_reimport_updates_only_changed_rows_and_keeps_language(db, storage, tmp_path):
+    first = write(tmp_path, 'a.jsonl', ''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in [
+        {'employee_id': 'IGA1-00001', 'name': '甲', 'dept_code': 'IT', 'shift_type': 'day'},
+        {'employee_id': 'IGA1-00002', 'name': '乙', 'dept_code': 'IT', 'shift_type': 'day'},
+    ]))
+    import_employees(storage, read_rows(first))
+    with db.connection() as conn:
+        conn.execute("UPDATE employees SET preferred_language = 'en' WHERE employee_id = 'IGA1-00002'")
+        conn.commit()
+    
+    second = write(tmp_path, 'b.jsonl', ''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in [
+        {'employee_id': 'IGA1-00001', 'name': '甲', 'dept_code': 'IT', 'shift_type': 'day'},
+        {'employee_id': 'IGA1-00002', 'name': '乙', 'dept_code': 'IT', 'shift_type': 'night', 'preferred_language': 'zh'},
+    ]))
+    result = import_employees(storage, read_rows(second))
+    
+    assert (result['inserted'], result['updated'], result['unchanged']) == (0, 1, 1)
+    assert employees(db)['IGA1-00002'] == ('乙', 'night', 'en', 'active')
+
+
+def test_full_roster_deactivates_missing_employees(db, storage, tmp_path):
+    roster = 'employee_id,name,dept_code,shift_type\nIGA1-00001,甲,IT,day\nIGA1-00002,乙,IT,day\n'
+    import_employees(storage, read_rows(write(tmp_path, 'a.csv', roster)))
+    db.bind_line_user('U2', 'IGA1-00002')
+    assert db.get_employee_by_line_id('U2')['employee_id'] == 'IGA1-00002'
+    
+    result = import_employees(storage, read_rows(write(tmp_path, 'b.csv', roster.rsplit('IGA1-00002', 1)[0])),
+                              deactivate_missing=True)
+    assert result['deactivated'] == 1
+    assert employees(db)['IGA1-00002'][-1] == 'inactive'
+    # 停用後不能再使用，也不能重新綁定
+    assert db.get_employee_by_line_id('U2') is None
+    assert not db.bind_line_user('U3', 'IGA1-00002')['success']
+
+
+def test_rejected_rows_skip_deactivation(db, storage, tmp_path):
+    import_employees(storage, read_rows(write(tmp_path, 'a.csv', 'employee_id,name,dept_code,shift_type\nIGA1-00001,甲,IT,day\n')))
+    result = import_employees(storage, read_rows(write(tmp_path, 'b.csv', 'employee_id,name,dept_code,shift_type\nBAD,甲,IT,day\n')),
+                              deactivate_missing=True)
+    assert result['deactivated'] == 0
+    assert employees(db)['IGA1-00001'][-1] == 'active'
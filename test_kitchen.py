@@ -0,0 +1,73 @@
+import os
+from datetime import date
+
+import pytest
+
+from booking import book_meal, cancel_meal
+from database import DatabaseManager
+from kitchen import kitchen_counts, reconcile_meal_counts
+
+TODAY = date.today()
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = DatabaseManager(os.path.join(tmp_path, 'test.db'))
+    db.insert_initial_data()
+    with db.connection() as conn:
+        conn.executemany('''
+            INSERT INTO employees (employee_id, name, department_id, shift_type)
+            VALUES (?, ?, 1, 'day')
+        ''', [(f'IGA1-{i:05d}', f'員工{i}') for i in range(5)])
+        conn.commit()
+    yield db
+    db.pool.close_all()
+
+
+def counts(db, floor=None):
+    with db.connection() as conn:
+        return {r['restaurant_id']: r['ordered'] for r in kitchen_counts(conn, TODAY, floor)}
+
+
+def test_counts_follow_orders_changes_and_cancellations(db):
+    with db.connection() as conn:
+        for employee_id in (1, 2, 3):
+            book_meal(conn, employee_id, 1, TODAY)
+        book_meal(conn, 4, 2, TODAY)
+        assert counts(db) == {1: 3, 2: 1}
+        
+        # 改訂：原餐廳 -1、新餐廳 +1；重複點同一家不變
+        book_meal(conn, 3, 2, TODAY)
+        book_meal(conn, 3, 2, TODAY)
+        assert counts(db) == {1: 2, 2: 2}
+        
+        cancel_meal(conn, 1, TODAY)
+        cancel_meal(conn, 1, TODAY)
+        assert counts(db) == {1: 1, 2: 2}
+        assert reconcile_meal_counts(conn, TODAY) == []
+
+
+def test_floor_filter(db):
+    with db.connection() as conn:
+        floors = dict(conn.execute('SELECT id, floor FROM restaurants').fetchall())
+        book_meal(conn, 1, 1, TODAY)
+        book_meal(conn, 2, 2, TODAY)
+    assert counts(db, floors[1]) == {r: n for r, n in {1: 1, 2: 1}.items() if floors[r] == floors[1]}
+
+
+def test_reconcile_reports_and_fixes_drift(db):
+    with db.connection() as conn:
+        book_meal(conn, 1, 1, TODAY)
+        book_meal(conn, 2, 1, TODAY)
+        conn.execute('UPDATE meal_counts SET ordered = 5 WHERE restaurant_id = 1')
+        conn.execute('INSERT INTO meal_counts (order_date, restaurant_id, ordered) VALUES (?, 2, 1)', (TODAY,))
+        conn.commit()
+        
+        mismatches = reconcile_meal_counts(conn, TODAY)
+        assert [(m['restaurant_id'], m['counted'], m['actual']) for m in mismatches] == [(1, 5, 2), (2, 1, 0)]
+        # 只檢查不修正
+        assert counts(db) == {1: 5, 2: 1}
+        
+        reconcile_meal_counts(conn, fix=True)
+        assert reconcile_meal_counts(conn) == []
+    assert counts(db) == {1: 2}
@@ -0,0 +1,30 @@
+from linebot.v3.messaging import ApiClient, MessagingApi, ReplyMessageRequest, TextMessage
+
+from line_client import LineApiHolder, make_configuration
+from stub_line_server import StubLineServer
+
+
+def test_shared_client_reuses_one_connection():
+    with StubLineServer() as stub:
+        holder = LineApiHolder(make_configuration('test-token', host=stub.url))
+        for i in range(20):
+            holder.reply(f'token-{i}', [TextMessage(text='hi')])
+        holder.close()
+    
+    assert stub.counts == {'reply': 20}
+    assert stub.connections == 1
+    assert stub.requests[0]['payload']['replyToken'] == 'token-0'
+
+
+def test_per_event_client_opens_connection_each_time():
+    # 舊做法：每次回覆都建立新的 ApiClient
+    with StubLineServer() as stub:
+        configuration = make_configuration('test-token', host=stub.url)
+        for i in range(5):
+            with ApiClient(configuration) as api_client:
+                MessagingApi(api_client).reply_message_with_http_info(
+                    ReplyMessageRequest(reply_token=f'token-{i}', messages=[TextMessage(text='hi')])
+                )
+    
+    assert stub.counts == {'reply': 5}
+    assert stub.connections == 5
@@ -0,0 +1,122 @@
+import io
+import os
+import sys
+import json
+import queue
+import logging
+import subprocess
+
+import pytest
+
+from logs import (LOG_DROPPED, JsonFormatter, LogListener, NonBlockingQueueHandler, WebhookBody, log_context,
+                  pseudonym, webhook_summary)
+
+BODY = json.dumps({
+    'destination': 'Udest',
+    'events': [
+        {'type': 'message', 'webhookEventId': '01HEVENT0001', 'replyToken': 'token-1',
+         'source': {'type': 'user', 'userId': 'U1234567890abcdef'},
+         'deliveryContext': {'isRedelivery': False},
+         'message': {'type': 'text', 'id': '1', 'text': 'IGA1-00001'}},
+        {'type': 'postback', 'webhookEventId': '01HEVENT0002', 'replyToken': 'token-2',
+         'source': {'type': 'user', 'userId': 'U1234567890abcdef'},
+         'deliveryContext': {'isRedelivery': True},
+         'postback': {'data': 'action=bus_menu'}},
+    ]
+}, ensure_ascii=False)
+
+
+@pytest.fixture
+def logger():
+    """獨立的 logger：經佇列由背景執行緒以 JSON 寫到 StringIO"""
+    stream = io.StringIO()
+    output = logging.StreamHandler(stream)
+    output.setFormatter(JsonFormatter())
+    log_queue = queue.Queue(maxsize=100)
+    listener = LogListener(log_queue, output)
+    listener.start()
+
+    logger = logging.getLogger('test_logs')
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    handler = NonBlockingQueueHandler(log_queue)
+    logger.addHandler(handler)
+
+    def records():
+        listener.stop()
+        return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    logger.records = records
+    yield logger
+    logger.removeHandler(handler)
+    if listener._thread is not None:
+        listener.stop()
+
+
+def test_records_carry_context_and_extra_fields(logger):
+    with log_context(request_id='req-1'):
+        logger.info('訂餐 %s 筆', 2, extra={'restaurant_id': 3})
+        with log_context(event_id='01HEVENT0001'):
+            try:
+                1 / 0
+            except ZeroDivisionError:
+                logger.exception('事件處理錯誤')
+    logger.warning('請求結束後')
+
+    first, second, third = logger.records()
+    assert (first['msg'], first['level'], first['logger']) == ('訂餐 2 筆', 'INFO', 'test_logs')
+    assert (first['request_id'], first['restaurant_id']) == ('req-1', 3)
+    assert 'event_id' not in first
+    assert (second['request_id'], second['event_id']) == ('req-1', '01HEVENT0001')
+    assert 'ZeroDivisionError' in second['exc']
+    assert 'request_id' not in third
+
+
+def test_webhook_body_is_summarized_without_personal_data(logger):
+    logger.info('webhook received', extra={'webhook': WebhookBody(BODY)})
+    record = logger.records()[0]
+    text = json.dumps(record, ensure_ascii=False)
+    assert 'U1234567890abcdef' not in text and 'IGA1-00001' not in text and 'token-1' not in text
+
+    summary = record['webhook']
+    assert summary == webhook_summary(BODY)
+    message, postback = summary['events']
+    assert message == {'type': 'message', 'id': '01HEVENT0001', 'user': pseudonym('U1234567890abcdef'),
+                       'redelivery': False, 'message': 'text', 'text_len': 10}
+    assert postback['postback'] == 'action=bus_menu' and postback['redelivery'] is True
+    assert webhook_summary('not json') == {'bytes': 8, 'invalid_json': True}
+
+
+def test_full_queue_drops_records_instead_of_blocking():
+    logger = logging.getLogger('test_logs.full')
+    logger.propagate = False
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=2))
+    logger.addHandler(handler)
+    try:
+        before = LOG_DROPPED.labels().value
+        # 沒有 listener 取走紀錄，第三筆起直接丟棄
+        for i in range(5):
+            logger.warning('紀錄 %d', i)
+        assert handler.queue.qsize() == 2
+        assert LOG_DROPPED.labels().value - before == 3
+
+        # 佇列已滿時停止背景執行緒仍會寫完剩下的紀錄
+        stream = io.StringIO()
+        listener = LogListener(handler.queue, logging.StreamHandler(stream))
+        listener.start()
+        listener.stop()
+        assert stream.getvalue() == '紀錄 0\n紀錄 1\n'
+    finally:
+        logger.removeHandler(handler)
+
+
+def test_importing_app_does_not_start_logging(tmp_path):
+    # import app 不應啟動背景執行緒；webhook 預設只取樣記錄
+    env = {k: v for k, v in os.environ.items() if k not in ('LOG_WEBHOOK_SAMPLE', 'DATABASE_URL')}
+    env.update(DATABASE_PATH=str(tmp_path / 'import.db'), CHANNEL_SECRET='secret', CHANNEL_ACCESS_TOKEN='token')
+    code = ('import threading, app, logs; '
+            'print(logs._listener is None, logs._webhook_sample, threading.active_count())')
+    result = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            env=env, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ['True', '0.01', '1']
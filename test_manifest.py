@@ -0,0 +1,63 @@
+import os
+import csv
+import io
+import json
+from datetime import date, timedelta
+
+import pytest
+
+from booking import book_bus
+from database import DatabaseManager
+from manifest import stream_manifest
+from repository import SQLiteStorage
+
+TODAY = date.today()
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = DatabaseManager(os.path.join(tmp_path, 'test.db'))
+    db.insert_initial_data()
+    with db.connection() as conn:
+        conn.executemany('''
+            INSERT INTO employees (employee_id, name, department_id, shift_type)
+            VALUES (?, ?, 1, 'day')
+        ''', [(f'IGA1-{i:05d}', f'員工{i}') for i in range(6)])
+        conn.commit()
+        # 今天：班次 1 三人、班次 2 兩人；昨天的紀錄不應出現
+        for employee_id, schedule_id in [(1, 1), (2, 1), (3, 1), (4, 2), (5, 2)]:
+            book_bus(conn, employee_id, schedule_id, TODAY)
+        book_bus(conn, 6, 1, TODAY - timedelta(days=1))
+        # 改訂後只留下新班次
+        book_bus(conn, 3, 2, TODAY)
+    yield db
+    db.pool.close_all()
+
+
+def test_csv_manifest_lists_active_passengers_with_headcounts(db):
+    rows = list(csv.DictReader(io.StringIO(''.join(stream_manifest(SQLiteStorage(db), TODAY, 'csv')))))
+    by_schedule = {}
+    for row in rows:
+        by_schedule.setdefault(row['schedule_id'], []).append(row)
+    
+    assert sorted(r['employee_id'] for r in by_schedule['1']) == ['IGA1-00000', 'IGA1-00001']
+    assert sorted(r['employee_id'] for r in by_schedule['2']) == ['IGA1-00002', 'IGA1-00003', 'IGA1-00004']
+    assert {r['headcount'] for r in by_schedule['1']} == {'2'}
+    assert {r['headcount'] for r in by_schedule['2']} == {'3'}
+
+
+def test_json_manifest_filters_by_schedule(db):
+    data = json.loads(''.join(stream_manifest(SQLiteStorage(db), TODAY, 'json', schedule_id=2)))
+    assert data['date'] == TODAY.isoformat()
+    assert [(h['schedule_id'], h['headcount']) for h in data['headcounts']] == [(2, 3)]
+    assert [p['schedule_id'] for p in data['passengers']] == [2, 2, 2]
+
+
+def test_stream_returns_connection_when_abandoned(db):
+    chunks = stream_manifest(SQLiteStorage(db), TODAY, 'json')
+    # 第一段是表頭與各班次人數，第二段起邊讀乘客邊輸出
+    next(chunks)
+    next(chunks)
+    assert db.pool.stats()['in_use'] == 1
+    chunks.close()
+    assert db.pool.stats()['in_use'] == 0
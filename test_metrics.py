@@ -0,0 +1,58 @@
+import os
+import re
+
+import pytest
+
+from metrics import Counter, Histogram, Registry, _Metric
+
+
+def test_metrics_render_webhook_and_sql_counters(bot):
+    client = bot.app.test_client()
+    # 簽章錯誤的 webhook 也會計入請求數與回應時間
+    assert client.post('/callback', data=b'{"events": []}', headers={'X-Line-Signature': 'bad'}).status_code == 400
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    text = response.get_data(as_text=True)
+    # 每筆數值都標示所屬的 worker 程序
+    pid = f'pid="{os.getpid()}"'
+    assert '# TYPE linebot_webhook_request_seconds histogram' in text
+    assert re.search(rf'^linebot_webhook_request_seconds_bucket\{{{pid},le="\+Inf"\}} [1-9]', text, re.M)
+    assert re.search(rf'^linebot_webhook_request_seconds_count\{{{pid}\}} [1-9]', text, re.M)
+    assert re.search(rf'^linebot_webhook_requests_total\{{status="400",{pid}\}} [1-9]', text, re.M)
+    assert '# TYPE linebot_sql_busy_retries_total counter' in text
+    assert re.search(rf'^linebot_sql_busy_retries_total\{{{pid}\}} \d', text, re.M)
+    assert 'linebot_db_pool_connections{state=' in text
+
+
+def test_monitoring_routes_require_local_address_or_token(bot, monkeypatch):
+    client = bot.app.test_client()
+    remote = {'REMOTE_ADDR': '203.0.113.5'}
+    monkeypatch.delenv('ADMIN_TOKEN', raising=False)
+    for path in ('/metrics', '/stats'):
+        assert client.get(path).status_code == 200
+        assert client.get(path, environ_base=remote).status_code == 403
+
+    monkeypatch.setenv('ADMIN_TOKEN', 'admin-secret')
+    for path in ('/metrics', '/stats'):
+        assert client.get(path, environ_base=remote, headers={'Authorization': 'Bearer wrong'}).status_code == 403
+        assert client.get(path, environ_base=remote,
+                          headers={'Authorization': 'Bearer admin-secret'}).status_code == 200
+    assert client.get('/stats').json['storage']['backend'] == 'sqlite'
+
+
+def test_registry_worker_label_and_abstract_metric():
+    registry = Registry()
+    counter = Counter('jobs_total', 'jobs', ['kind'], registry=registry)
+    counter.labels('a').inc(2)
+    Histogram('job_seconds', 'seconds', buckets=(1.0,), registry=registry).observe(0.5)
+    assert 'jobs_total{kind="a"} 2' in registry.render()
+
+    registry.worker_label = 'worker'
+    text = registry.render()
+    assert f'jobs_total{{kind="a",worker="{os.getpid()}"}} 2' in text
+    assert f'job_seconds_bucket{{worker="{os.getpid()}",le="1"}} 1' in text
+
+    with pytest.raises(TypeError):
+        _Metric('untyped', 'no children', registry=None)
@@ -0,0 +1,158 @@
+import os
+import re
+import hmac
+import json
+import base64
+import sqlite3
+import hashlib
+from datetime import datetime
+
+import pytest
+
+from database import DatabaseManager
+from migrations import LATEST_VERSION, current_version
+from reminders import due_schedules, reminder_recipients
+from settings import TAIPEI_TZ, taipei_today
+
+# 資料量會隨時間成長的資料表，熱門路徑上不能整表 (或整個索引) 掃描
+HOT_TABLES = ('employees', 'line_users', 'bus_reservations', 'bus_seat_counters', 'meal_orders', 'meal_counts',
+              'webhook_events', 'reminder_deliveries')
+SQL_KEYWORDS = {'WHERE', 'JOIN', 'LEFT', 'INNER', 'CROSS', 'ON', 'SET', 'ORDER', 'GROUP', 'VALUES', 'USING',
+                'LIMIT', 'DEFAULT', 'SELECT'}
+
+# 使用者會走過的流程：綁定、選單、改語言、預約交通車與訂餐、查詢、領餐 QR 碼、取消
+STEPS = [
+    ('message', 'IGA1-00077'),
+    ('message', 'menu'),
+    ('postback', 'action=change_language&lang=en'),
+    ('postback', 'action=bus_booking'),
+    ('postback', 'action=bus_route&route_id=1&route_code=R1'),
+    ('postback', 'action=bus_confirm&schedule_id=1&time=17:30'),
+    ('postback', 'action=meal_booking'),
+    ('postback', 'action=meal_confirm&restaurant_ids=1&floor=1F'),
+    ('postback', 'action=view_booking'),
+    ('postback', 'action=generate_qr'),
+    ('postback', 'action=cancel_booking'),
+]
+CANCEL_STEPS = [
+    ('postback', 'action=cancel_confirm&type=bus'),
+    ('postback', 'action=cancel_confirm&type=meal'),
+]
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = DatabaseManager(os.path.join(tmp_path, 'test.db'))
+    db.insert_initial_data()
+    yield db
+    db.pool.close_all()
+
+
+def test_migrations_recorded_and_idempotent(db):
+    with db.connection() as conn:
+        assert current_version(conn) == LATEST_VERSION
+
+    # 重新啟動不會重複套用
+    db.init_database()
+    with db.connection() as conn:
+        rows = conn.execute('SELECT version FROM schema_version').fetchall()
+    assert [r[0] for r in rows] == sorted({r[0] for r in rows})
+
+
+def webhook(kind: str, payload: str, event_id: str):
+    """簽好章的 webhook (body, headers)"""
+    event = {
+        'type': kind, 'mode': 'active', 'timestamp': 1700000000000,
+        'webhookEventId': event_id, 'deliveryContext': {'isRedelivery': False},
+        'replyToken': f'token-{event_id}', 'source': {'type': 'user', 'userId': 'Uplancheck'},
+    }
+    if kind == 'message':
+        event['message'] = {'type': 'text', 'id': event_id, 'text': payload, 'quoteToken': 'q'}
+    else:
+        event['postback'] = {'data': payload}
+    body = json.dumps({'destination': 'Ubot', 'events': [event]}).encode('utf-8')
+    digest = hmac.new(os.environ['CHANNEL_SECRET'].encode('utf-8'), body, hashlib.sha256).digest()
+    return body, {'X-Line-Signature': base64.b64encode(digest).decode('ascii')}
+
+
+@pytest.fixture
+def issued_sql(bot, monkeypatch):
+    """走過各個處理流程，收集連線池連線實際執行的 SQL (參數已代入)"""
+    statements = []
+    pool = bot.db.pool
+    checkout, checkin = pool.checkout, pool.checkin
+
+    def traced_checkout():
+        conn = checkout()
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    def untraced_checkin(conn):
+        conn.set_trace_callback(None)
+        checkin(conn)
+
+    monkeypatch.setattr(pool, 'checkout', traced_checkout)
+    monkeypatch.setattr(pool, 'checkin', untraced_checkin)
+    monkeypatch.setattr(bot.line_api, 'reply', lambda token, messages: None)
+    monkeypatch.setenv('ADMIN_TOKEN', 'plan-check')
+    with bot.db.connection() as conn:
+        conn.execute("INSERT OR IGNORE INTO employees (employee_id, name, department_id, shift_type) "
+                     "VALUES ('IGA1-00077', '查詢計畫', 1, 'day')")
+        conn.commit()
+        employee_id = conn.execute("SELECT id FROM employees WHERE employee_id = 'IGA1-00077'").fetchone()[0]
+    # 清掉程序內快取，查詢才會真的送到資料庫
+    bot.db.employee_cache.clear()
+    bot.menu_catalog.invalidate()
+    bot.kitchen_cache.clear()
+
+    today = taipei_today()
+    client = bot.app.test_client()
+    for index, (kind, payload) in enumerate(STEPS):
+        body, headers = webhook(kind, payload, f'P{index:04d}')
+        assert client.post('/callback', data=body, headers=headers).status_code == 200
+
+    bot.qr_service.cache.clear()
+    assert client.get(bot.qr_service.image_path(employee_id, today, 1)).status_code == 200
+    assert client.get(f'/kitchen/counts?date={today}').status_code == 200
+    manifest = client.get(f'/manifest/bus?date={today}&format=json', headers={'Authorization': 'Bearer plan-check'})
+    assert employee_id and manifest.status_code == 200 and b'IGA1-00077' in manifest.data
+    for schedule in due_schedules(bot.storage, datetime.now(TAIPEI_TZ), lead_minutes=24 * 60):
+        reminder_recipients(bot.storage, today, schedule['schedule_id'])
+    reminder_recipients(bot.storage, today, 1)
+
+    for index, (kind, payload) in enumerate(CANCEL_STEPS, start=len(STEPS)):
+        body, headers = webhook(kind, payload, f'P{index:04d}')
+        assert client.post('/callback', data=body, headers=headers).status_code == 200
+    return list(dict.fromkeys(statements))
+
+
+def hot_aliases(sql: str) -> dict:
+    """SQL 中熱門資料表的名稱與別名 -> 資料表"""
+    aliases = {}
+    for table in HOT_TABLES:
+        for match in re.finditer(rf'\b{table}\b(?:\s+(?:AS\s+)?(\w+))?', sql, re.I):
+            aliases[table] = table
+            if match.group(1) and match.group(1).upper() not in SQL_KEYWORDS:
+                aliases[match.group(1)] = table
+    return aliases
+
+
+def test_issued_queries_never_scan_hot_tables(bot, issued_sql):
+    queries = [sql for sql in issued_sql if re.match(r'\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b', sql, re.I)]
+    # 各流程都有執行到 (避免流程壞掉時測試變成什麼都沒檢查)
+    for fragment in ('line_users', 'bus_seat_counters', 'meal_counts', 'webhook_events', 'reminder_deliveries',
+                     "status = 'cancelled'", 'catalog_version'):
+        assert any(fragment in sql for sql in queries), f'沒有執行到含 {fragment} 的查詢'
+
+    conn = sqlite3.connect(bot.db.db_path)
+    try:
+        problems = []
+        for sql in queries:
+            aliases = hot_aliases(sql)
+            for row in conn.execute('EXPLAIN QUERY PLAN ' + sql):
+                match = re.match(r'SCAN (\w+)', row[3])
+                if match and match.group(1) in aliases:
+                    problems.append(f'{row[3]}\n{sql.strip()}')
+    finally:
+        conn.close()
+    assert not problems, '熱門資料表出現全表或整個索引掃描：\n\n' + '\n\n'.join(problems)
@@ -0,0 +1,69 @@
+import logging
+
+import pytest
+
+from postback_router import PostbackRouter, parse_postback_data
+
+
+@pytest.fixture
+def router():
+    router = PostbackRouter()
+
+    @router.fallback
+    def fallback(ctx):
+        return f'fallback:{ctx}'
+
+    @router.action('test_book', schedule_id=int, time=(str, ''))
+    def book(ctx, schedule_id, time):
+        return [f'{ctx}:{schedule_id}', time]
+
+    @router.action('test_none')
+    def nothing(ctx):
+        return None
+
+    @router.action('test_boom')
+    def boom(ctx):
+        raise RuntimeError('handler failed')
+
+    return router
+
+
+def test_dispatch_converts_parameters(router):
+    assert parse_postback_data('action=test_book&schedule_id=3&time=17:30') == {
+        'action': 'test_book', 'schedule_id': '3', 'time': '17:30'}
+    assert router.dispatch('u1', 'action=test_book&schedule_id=3&time=17:30') == ['u1:3', '17:30']
+    # 有預設值的參數可省略，回傳 None 表示不回覆
+    assert router.dispatch('u1', 'action=test_book&schedule_id=4') == ['u1:4', '']
+    assert router.dispatch('u1', 'action=test_none') == []
+    assert router.actions() == ['test_book', 'test_boom', 'test_none']
+
+    with pytest.raises(ValueError):
+        router.action('test_book')(lambda ctx: None)
+
+
+def test_unknown_action_uses_fallback(router):
+    assert router.dispatch('u1', 'action=no_such_action') == ['fallback:u1']
+    assert router.dispatch('u1', '') == ['fallback:u1']
+
+
+def test_parameter_errors_fall_back_and_are_logged(router, caplog):
+    errors = router.stats()['test_book']['errors']
+    with caplog.at_level(logging.WARNING, logger='postback_router'):
+        assert router.dispatch('u1', 'action=test_book') == ['fallback:u1']
+        assert router.dispatch('u1', 'action=test_book&schedule_id=abc') == ['fallback:u1']
+    assert [r.getMessage() for r in caplog.records] == [
+        '⚠️ postback 參數錯誤：test_book 缺少參數 schedule_id',
+        '⚠️ postback 參數錯誤：test_book 參數 schedule_id 格式錯誤：abc',
+    ]
+    # 用戶端送來的錯誤參數：警告即可，不附 traceback
+    assert all(r.levelname == 'WARNING' and not r.exc_info for r in caplog.records)
+    assert router.stats()['test_book']['errors'] == errors + 2
+
+
+def test_handler_errors_propagate_and_are_counted(router):
+    before = router.stats()['test_boom']
+    with pytest.raises(RuntimeError):
+        router.dispatch('u1', 'action=test_boom')
+    after = router.stats()['test_boom']
+    assert after['errors'] == before['errors'] + 1
+    assert after['count'] == before['count'] + 1
@@ -0,0 +1,46 @@
+from datetime import date
+
+import pytest
+
+from qr_service import QRCodeService
+
+DAY = date(2026, 1, 5)
+
+
+def test_signing_key_is_required():
+    for secret in (None, ''):
+        with pytest.raises(ValueError):
+            QRCodeService(secret)
+    service = QRCodeService('key-1')
+    assert service.verify(1, DAY, 2, service.sign(1, DAY, 2))
+    assert not QRCodeService('key-2').verify(1, DAY, 2, service.sign(1, DAY, 2))
+    assert not service.verify(1, DAY, 3, service.sign(1, DAY, 2))
+
+
+def test_meal_qr_route(bot):
+    with bot.db.connection() as conn:
+        employee_id = conn.execute("SELECT id FROM employees WHERE employee_id = 'IGA1-00001'").fetchone()[0]
+    assert bot.storage.orders.book(employee_id, 1, DAY)
+    bot.qr_service.cache.clear()
+    client = bot.app.test_client()
+    path = bot.qr_service.image_path(employee_id, DAY, 1)
+
+    response = client.get(path)
+    assert response.status_code == 200
+    assert response.mimetype == 'image/png' and response.data.startswith(b'\x89PNG')
+    etag = response.headers['ETag']
+    assert etag and response.headers['Cache-Control'] == f'private, max-age={bot.QR_IMAGE_MAX_AGE}'
+
+    assert client.get(path, headers={'If-None-Match': etag}).status_code == 304
+    # 簽章錯誤、缺少簽章或改了網址中的餐廳都拒絕
+    assert client.get(path[:-4] + '0000').status_code == 403
+    assert client.get(path.split('?')[0]).status_code == 403
+    assert client.get(path.replace(f'/{DAY}/1.png', f'/{DAY}/2.png')).status_code == 403
+    # 簽章正確但沒有這筆訂單
+    assert client.get(bot.qr_service.image_path(employee_id, DAY, 2)).status_code == 404
+
+    # 取消後即使圖片還在快取中也不再提供
+    assert bot.qr_service.get(employee_id, DAY, 1) is not None
+    assert bot.storage.orders.cancel(employee_id, DAY)
+    assert client.get(path).status_code == 404
+    assert client.get(path, headers={'If-None-Match': etag}).status_code == 404
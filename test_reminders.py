@@ -0,0 +1,101 @@
+import os
+from datetime import datetime
+
+import pytest
+
+from database import DatabaseManager
+from line_client import LineApiHolder, make_configuration
+from reminders import MULTICAST_LIMIT, run_due_reminders
+from repository import SQLiteStorage
+from settings import TAIPEI_TZ, taipei_today
+from stub_line_server import StubLineServer
+
+TODAY = taipei_today()
+# 班次 1 於 17:45 發車
+BEFORE_DEPARTURE = datetime.combine(TODAY, datetime.strptime('17:35', '%H:%M').time(), TAIPEI_TZ)
+LANGUAGES = ['zh'] * 11 + ['en']
+RIDERS = 1200
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = DatabaseManager(os.path.join(tmp_path, 'test.db'))
+    db.insert_initial_data()
+    with db.connection() as conn:
+        conn.execute('UPDATE bus_schedules SET seat_limit = ?', (RIDERS,))
+        conn.executemany('''
+            INSERT INTO employees (employee_id, name, department_id, shift_type, preferred_language)
+            VALUES (?, ?, 1, 'day', ?)
+        ''', [(f'IGA1-{i:05d}', f'員工{i}', LANGUAGES[i % len(LANGUAGES)]) for i in range(RIDERS)])
+        conn.execute('''
+            INSERT INTO line_users (line_user_id, employee_id, is_bound)
+            SELECT 'U' || id, id, TRUE FROM employees
+        ''')
+        conn.execute('''
+            INSERT INTO bus_reservations (employee_id, schedule_id, reservation_date)
+            SELECT id, 1, ? FROM employees
+        ''', (TODAY,))
+        conn.commit()
+    yield db
+    db.pool.close_all()
+
+
+@pytest.fixture
+def stub():
+    with StubLineServer() as stub:
+        yield stub
+
+
+@pytest.fixture
+def line_api(stub):
+    line_api = LineApiHolder(make_configuration('test-token', host=stub.url))
+    yield line_api
+    line_api.close()
+
+
+def delivery_status(db):
+    with db.connection() as conn:
+        return dict(conn.execute('SELECT status, COUNT(*) FROM reminder_deliveries GROUP BY status').fetchall())
+
+
+def test_riders_are_reminded_once_in_batches_by_language(db, stub, line_api):
+    results = run_due_reminders(SQLiteStorage(db), line_api, now=BEFORE_DEPARTURE, lead_minutes=15, rate=0)
+    # 17:45 發車的班次都會檢查，只有班次 1 有乘客
+    assert {r['schedule_id']: r['sent'] for r in results} == {1: RIDERS, 3: 0, 5: 0}
+
+    batches = [r['payload'] for r in stub.requests if r['kind'] == 'multicast']
+    assert len(batches) == 4  # 1100 位中文分 3 批，100 位英文 1 批
+    assert all(len(b['to']) <= MULTICAST_LIMIT for b in batches)
+    assert sum(len(b['to']) for b in batches) == RIDERS
+    english = [b for b in batches if b['messages'][0]['text'].startswith('🚌 Bus reminder')]
+    assert len(english) == 1 and len(english[0]['to']) == 100
+    assert delivery_status(db) == {'sent': RIDERS}
+
+    # 下一分鐘再執行不會重複提醒，發車後或提醒時間前都不會送
+    stub.reset()
+    results = run_due_reminders(SQLiteStorage(db), line_api, now=BEFORE_DEPARTURE.replace(minute=36), rate=0)
+    assert [r['batches'] for r in results] == [0, 0, 0]
+    assert run_due_reminders(SQLiteStorage(db), line_api, now=BEFORE_DEPARTURE.replace(minute=10), rate=0) == []
+    assert stub.requests == []
+
+
+def test_retries_transient_errors_and_records_failures(db, stub, line_api):
+    # 第一批遇到兩次 5xx 後才成功
+    stub.fail_next(500, 503)
+    results = run_due_reminders(SQLiteStorage(db), line_api, now=BEFORE_DEPARTURE, workers=1, rate=0, backoff=0.01)
+    assert results[0]['retries'] == 2
+    assert results[0]['failed'] == 0
+
+    with db.connection() as conn:
+        conn.execute("UPDATE reminder_deliveries SET status = 'failed' WHERE employee_id <= 10")
+        conn.commit()
+    stub.reset()
+    stub.fail_next(400)  # 直接被拒，不重試
+    results = run_due_reminders(SQLiteStorage(db), line_api, now=BEFORE_DEPARTURE, rate=0, backoff=0.01)
+    assert results[0]['recipients'] == 10 and results[0]['failed'] == 10
+    assert delivery_status(db) == {'sent': RIDERS - 10, 'failed': 10}
+
+    # 失敗的乘客下次執行會再送
+    results = run_due_reminders(SQLiteStorage(db), line_api, now=BEFORE_DEPARTURE, rate=0)
+    assert results[0]['sent'] == 10
+    assert delivery_status(db) == {'sent': RIDERS}
@@ -0,0 +1,369 @@
+import io
+import os
+import csv
+import uuid
+import shutil
+import socket
+import threading
+import subprocess
+from contextlib import contextmanager
+from datetime import date, datetime, time
+from urllib.parse import urlsplit
+
+import pytest
+
+from catalog import CatalogCache
+from database import DatabaseManager
+from import_employees import import_employees
+from manifest import stream_manifest
+from reminders import due_schedules, reminder_recipients
+from repository import OrderRepository, SQLiteStorage
+from settings import TAIPEI_TZ, SettingsCache
+
+DAY = date(2026, 1, 5)
+
+
+@pytest.fixture(scope='session')
+def postgres_url(tmp_path_factory):
+    """TEST_POSTGRES_URL，未設定時以 PATH 上的 initdb/pg_ctl 啟動一個暫時的 PostgreSQL"""
+    pytest.importorskip('psycopg2')
+    url = os.getenv('TEST_POSTGRES_URL')
+    if url:
+        yield url
+        return
+
+    initdb, pg_ctl = shutil.which('initdb'), shutil.which('pg_ctl')
+    if not (initdb and pg_ctl):
+        pytest.skip('未設定 TEST_POSTGRES_URL，PATH 上也沒有 initdb/pg_ctl')
+    if hasattr(os, 'geteuid') and os.geteuid() == 0:
+        pytest.skip('initdb 不能以 root 執行，請設定 TEST_POSTGRES_URL')
+    data = tmp_path_factory.mktemp('pgdata')
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    subprocess.run([initdb, '-D', str(data), '-U', 'postgres', '--auth=trust', '-E', 'UTF8'],
+                   check=True, capture_output=True)
+    subprocess.run([pg_ctl, '-D', str(data), '-l', str(data / 'server.log'), '-w', 'start',
+                    '-o', f'-p {port} -k {data} -c listen_addresses=127.0.0.1'],
+                   check=True, capture_output=True)
+    try:
+        yield f'postgresql://postgres@127.0.0.1:{port}/postgres'
+    finally:
+        subprocess.run([pg_ctl, '-D', str(data), '-m', 'immediate', 'stop'], capture_output=True)
+
+
+@pytest.fixture
+def seed_db(tmp_path):
+    """兩個後端共用的初始資料 (PostgreSQL 由這份 SQLite 資料庫搬移)"""
+    db = DatabaseManager(os.path.join(tmp_path, 'seed.db'))
+    db.insert_initial_data()
+    with db.connection() as conn:
+        conn.executemany('''
+            INSERT INTO employees (employee_id, name, department_id, shift_type) VALUES (?, ?, 1, 'day')
+        ''', [(f'IGA1-{i:05d}', f'員工{i}') for i in range(1, 11)])
+        conn.execute("INSERT INTO employees (employee_id, name, department_id, shift_type, status) "
+                     "VALUES ('IGA1-09999', '離職員工', 1, 'day', 'inactive')")
+        conn.execute('UPDATE bus_schedules SET seat_limit = 2 WHERE id = 1')
+        conn.commit()
+    yield db
+    db.pool.close_all()
+
+
+@contextmanager
+def postgres_storage(server: str, seed_path: str):
+    """在 server 上建立一個新的資料庫，建立資料表並搬入 seed_path 的資料"""
+    import psycopg2
+    from repository_pg import PostgresStorage
+
+    name = f'linebot_test_{uuid.uuid4().hex[:12]}'
+    admin = psycopg2.connect(server)
+    admin.autocommit = True
+    admin.cursor().execute(f'CREATE DATABASE {name}')
+    storage = PostgresStorage(urlsplit(server)._replace(path=f'/{name}').geturl(), pool_size=4)
+    try:
+        storage.init_schema()
+        storage.copy_from_sqlite(seed_path)
+        yield storage
+    finally:
+        storage.close()
+        admin.cursor().execute(f'DROP DATABASE {name}')
+        admin.close()
+
+
+@pytest.fixture(params=['sqlite', 'postgres'])
+def storage(request, seed_db):
+    if request.param == 'sqlite':
+        storage = SQLiteStorage(seed_db)
+        yield storage
+        storage.close()
+        return
+
+    # 每個測試使用一個新的資料庫
+    with postgres_storage(request.getfixturevalue('postgres_url'), seed_db.db_path) as storage:
+        yield storage
+
+
+def execute(storage, sql: str, params=()):
+    """直接修改資料表 (模擬管理工具或其他程序)"""
+    if storage.backend == 'sqlite':
+        with storage.db.connection() as conn:
+            conn.execute(sql, params)
+            conn.commit()
+    else:
+        storage.run_write(lambda cursor: cursor.execute(sql.replace('?', '%s'), params))
+
+
+def query(storage, sql: str, params=()):
+    if storage.backend == 'sqlite':
+        with storage.db.connection() as conn:
+            return [tuple(row) for row in conn.execute(sql, params).fetchall()]
+    return storage.query_all(sql.replace('?', '%s'), params)
+
+
+def test_backends_must_implement_every_operation():
+    class PartialOrders(OrderRepository):
+        def book(self, employee_id, restaurant_id, day):
+            return True
+
+    with pytest.raises(TypeError, match='cancel'):
+        PartialOrders()
+
+
+def test_binding_and_employee_lookup(storage):
+    employees = storage.employees
+    assert employees.get('U1') is None
+
+    assert not storage.bindings.bind('U1', 'IGA1-77777')['success']
+    assert not storage.bindings.bind('U1', 'IGA1-09999')['success']
+    result = storage.bindings.bind('U1', 'IGA1-00001')
+    assert result == {'success': True, 'message': '成功綁定員工：員工1'}
+
+    employee = employees.get('U1')
+    assert employee['employee_id'] == 'IGA1-00001'
+    assert (employee['name'], employee['shift_type'], employee['preferred_language']) == ('員工1', 'day', 'zh')
+    assert set(employee['department']) == {'zh', 'en', 'vi'}
+
+    employees.set_language(employee['id'], 'vi')
+    employees.invalidate('U1')
+    assert employees.get('U1')['preferred_language'] == 'vi'
+
+    # 同一個 LINE 帳號改綁其他員工
+    assert storage.bindings.bind('U1', 'IGA1-00002')['success']
+    assert employees.get('U1')['employee_id'] == 'IGA1-00002'
+
+
+def test_employee_import_and_full_roster(storage):
+    assert storage.employees.department_ids()['IT'] == 1
+    assert storage.bindings.bind('U3', 'IGA1-00003')['success']
+    assert storage.employees.get('U3')['name'] == '員工3'
+
+    roster = [{'employee_id': f'IGA1-{i:05d}', 'name': f'員工{i}', 'dept_code': 'IT', 'shift_type': 'day'}
+              for i in range(1, 11)]
+    roster[2]['name'] = '改名員工'
+    roster[3]['status'] = 'inactive'
+    roster.append({'employee_id': 'IGA1-00011', 'name': '新進員工', 'dept_code': 'HR', 'shift_type': 'night'})
+    del roster[9]
+    result = import_employees(storage, enumerate(roster, 2), deactivate_missing=True, chunk_size=4)
+    # IGA1-00004 由檔案停用、IGA1-00010 不在名冊中而停用
+    assert {k: result[k] for k in ('inserted', 'updated', 'unchanged', 'deactivated', 'rejected')} == {
+        'inserted': 1, 'updated': 1, 'unchanged': 7, 'deactivated': 2, 'rejected': 0}
+    assert query(storage, "SELECT employee_id FROM employees WHERE status = 'inactive' ORDER BY employee_id") == [
+        ('IGA1-00004',), ('IGA1-00010',), ('IGA1-09999',)]
+    # 匯入後不再使用快取中的舊資料
+    assert storage.employees.get('U3')['name'] == '改名員工'
+
+    result = import_employees(storage, enumerate(roster, 2), deactivate_missing=True)
+    assert (result['unchanged'], result['deactivated']) == (10, 0)
+
+
+def test_bus_reservations_respect_seat_limit(storage):
+    reservations = storage.reservations
+    assert reservations.book(1, 1, DAY) == {'success': True, 'full': False, 'unavailable': False, 'remaining': 1}
+    assert reservations.book(2, 1, DAY) == {'success': True, 'full': False, 'unavailable': False, 'remaining': 0}
+    assert reservations.book(3, 1, DAY) == {'success': False, 'full': True, 'unavailable': False, 'remaining': 0}
+    # 重複預約同一班不會再佔位
+    assert reservations.book(1, 1, DAY) == {'success': True, 'full': False, 'unavailable': False, 'remaining': 0}
+    assert reservations.for_day(1, DAY) == ('平鎮線', '17:45', '日班早下班')
+
+    # 改訂其他班次後釋出原本的座位
+    assert reservations.book(1, 2, DAY)['success']
+    assert reservations.for_day(1, DAY)[1:] == ('20:20', '日班晚下班')
+    assert reservations.book(3, 1, DAY)['remaining'] == 0
+
+    assert reservations.cancel(2, DAY) == 1
+    assert reservations.cancel(2, DAY) == 0
+    assert reservations.for_day(2, DAY) is None
+    assert reservations.book(4, 1, DAY)['success']
+
+
+def test_inactive_or_missing_schedule_is_unavailable(storage):
+    reservations = storage.reservations
+    unavailable = {'success': False, 'full': False, 'unavailable': True, 'remaining': 0}
+    assert reservations.book(1, 999, DAY) == unavailable
+    execute(storage, 'UPDATE bus_schedules SET is_active = FALSE WHERE id = 1')
+    assert reservations.book(1, 1, DAY) == unavailable
+    assert reservations.for_day(1, DAY) is None
+    assert reservations.book(1, 2, DAY)['success']
+
+
+def test_concurrent_bookings_do_not_oversell(storage):
+    results = []
+    lock = threading.Lock()
+
+    def book(employee_id):
+        result = storage.reservations.book(employee_id, 1, DAY)
+        with lock:
+            results.append(result['success'])
+
+    threads = [threading.Thread(target=book, args=(i,)) for i in range(1, 11)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(results) == [False] * 8 + [True] * 2
+    assert sum(storage.reservations.for_day(i, DAY) is not None for i in range(1, 11)) == 2
+
+
+def test_meal_orders_and_kitchen_counts(storage):
+    orders = storage.orders
+    assert orders.book(1, 1, DAY)
+    assert not orders.book(1, 1, DAY)
+    assert orders.book(2, 1, DAY)
+    assert orders.book(3, 2, DAY)
+    assert orders.book(1, 2, DAY)
+
+    counts = orders.kitchen_counts(DAY)
+    assert [(r['restaurant_id'], r['ordered']) for r in counts] == [(1, 1), (2, 2)]
+    assert {'floor', 'name_zh', 'name_en', 'name_vi'} <= set(counts[0])
+    floor = counts[0]['floor']
+    assert all(r['floor'] == floor for r in orders.kitchen_counts(DAY, floor))
+
+    name, record_floor, ordered_at, restaurant_id = orders.for_day(1, DAY)
+    assert restaurant_id == 2 and isinstance(ordered_at, datetime)
+    assert orders.pickup(1, DAY, 2) == ('IGA1-00001', '員工1', name, record_floor)
+    assert orders.pickup(1, DAY, 1) is None
+
+    assert orders.cancel(1, DAY) == 1
+    assert orders.cancel(1, DAY) == 0
+    assert orders.for_day(1, DAY) is None
+    assert [(r['restaurant_id'], r['ordered']) for r in orders.kitchen_counts(DAY)] == [(1, 1), (2, 1)]
+
+
+def test_catalog_and_settings_follow_changes(storage):
+    catalog = CatalogCache(storage.catalog, check_interval=0)
+    assert catalog.get('routes', lambda data: [r[2] for r in data.routes])[0] == '平鎮線'
+    schedules = storage.catalog.load().schedules_for(1, 'day')
+    assert [s[3] for s in schedules] == ['17:45', '20:20']
+
+    execute(storage, "UPDATE bus_routes SET route_name_zh = '平鎮新線' WHERE id = 1")
+    assert catalog.get('routes', lambda data: [r[2] for r in data.routes])[0] == '平鎮新線'
+    assert catalog.reloads == 2
+    # 快取記下的是與資料同一交易讀到的版本號
+    assert catalog.stats()['version'] == storage.catalog.version() == storage.catalog.load().version
+
+    # 產生選單期間目錄被修改並 invalidate()：舊資料產生的選單照樣回傳，但不放回快取
+    def stale_render(data):
+        execute(storage, "UPDATE bus_routes SET route_name_zh = '平鎮線' WHERE id = 1")
+        catalog.invalidate()
+        return [r[2] for r in data.routes]
+
+    assert catalog.get('stale', stale_render)[0] == '平鎮新線'
+    assert catalog.stats()['entries'] == 0
+    assert catalog.get('stale', lambda data: [r[2] for r in data.routes])[0] == '平鎮線'
+
+    settings = SettingsCache(storage.settings, check_interval=0)
+    assert settings.get('bus_day_deadline') == '14:30'
+    execute(storage, "UPDATE system_settings SET setting_value = '23:59' WHERE setting_key = 'bus_day_deadline'")
+    assert settings.get('bus_day_deadline') == '23:59'
+
+
+def test_bus_manifest_streams_active_passengers(storage):
+    for employee_id, schedule_id in [(1, 1), (2, 1), (3, 2)]:
+        assert storage.reservations.book(employee_id, schedule_id, DAY)['success']
+    assert storage.reservations.cancel(2, DAY) == 1
+
+    counts = {c['schedule_id']: c for c in storage.reservations.headcounts(DAY)}
+    assert (counts[1]['headcount'], counts[1]['departure_time'], counts[2]['headcount']) == (1, '17:45', 1)
+    assert [c['schedule_id'] for c in storage.reservations.headcounts(DAY, schedule_id=2)] == [2]
+
+    rows = list(csv.DictReader(io.StringIO(''.join(stream_manifest(storage, DAY, 'csv')))))
+    assert [(r['schedule_id'], r['employee_id'], r['departure_time'], r['headcount']) for r in rows] == [
+        ('1', 'IGA1-00001', '17:45', '1'), ('2', 'IGA1-00003', '20:20', '1')]
+    assert len(rows[0]['reserved_at']) == len('2026-01-05 08:00:00')
+
+    # 中途停止時歸還連線
+    chunks = stream_manifest(storage, DAY, 'json')
+    next(chunks)
+    next(chunks)
+    pool = storage.stats()['pool']
+    assert pool['in_use'] == 1 and pool['size'] == pool['idle'] + 1
+    chunks.close()
+    pool = storage.stats()['pool']
+    assert pool['in_use'] == 0 and pool['size'] == pool['idle'] >= 1
+
+
+def test_reminder_recipients_and_deliveries(storage):
+    for i in (1, 2, 3):
+        assert storage.bindings.bind(f'U{i}', f'IGA1-{i:05d}')['success']
+    storage.employees.set_language(2, 'en')
+    for employee_id, schedule_id in [(1, 1), (2, 1), (3, 2)]:
+        assert storage.reservations.book(employee_id, schedule_id, DAY)['success']
+
+    due = {s['schedule_id']: s for s in due_schedules(storage, datetime.combine(DAY, time(17, 35), TAIPEI_TZ),
+                                                     lead_minutes=15)}
+    assert (due[1]['departure_time'], due[1]['minutes'], due[1]['route_names']['zh']) == ('17:45', 10, '平鎮線')
+    assert 2 not in due
+    assert reminder_recipients(storage, DAY, 1) == {'zh': [(1, 'U1')], 'en': [(2, 'U2')]}
+
+    storage.reminders.record([(DAY, 1, 1, 'U1', 'zh', 'sent', 1, 'req-1', None),
+                              (DAY, 1, 2, 'U2', 'en', 'failed', 4, None, 'HTTP 500')])
+    assert reminder_recipients(storage, DAY, 1) == {'en': [(2, 'U2')]}
+    storage.reminders.record([(DAY, 1, 2, 'U2', 'en', 'sent', 1, 'req-2', None)])
+    assert reminder_recipients(storage, DAY, 1) == {}
+    assert query(storage, 'SELECT employee_id, status, attempts FROM reminder_deliveries ORDER BY employee_id') == [
+        (1, 'sent', 1), (2, 'sent', 5)]
+
+
+def test_reconcile_meal_counts(storage):
+    orders = storage.orders
+    assert orders.book(1, 1, DAY) and orders.book(2, 1, DAY) and orders.book(3, 2, DAY)
+    assert orders.reconcile_counts(DAY) == []
+
+    execute(storage, 'UPDATE meal_counts SET ordered = 5 WHERE order_date = ? AND restaurant_id = 1', (DAY,))
+    execute(storage, 'DELETE FROM meal_counts WHERE restaurant_id = 2')
+    expected = [{'order_date': DAY.isoformat(), 'restaurant_id': 1, 'counted': 5, 'actual': 2},
+                {'order_date': DAY.isoformat(), 'restaurant_id': 2, 'counted': 0, 'actual': 1}]
+    assert orders.reconcile_counts(DAY) == expected
+    assert orders.reconcile_counts(fix=True) == expected
+    assert orders.reconcile_counts() == []
+    assert [(r['restaurant_id'], r['ordered']) for r in orders.kitchen_counts(DAY)] == [(1, 2), (2, 1)]
+
+
+def test_postgres_schema_upgrade_and_copy_are_idempotent(postgres_url, seed_db):
+    from repository_pg import LATEST_VERSION
+
+    with postgres_storage(postgres_url, seed_db.db_path) as storage:
+        versions = [row[0] for row in query(storage, 'SELECT version FROM schema_version ORDER BY version')]
+        assert versions == list(range(1, LATEST_VERSION + 1))
+        assert storage.init_schema() == []
+
+        # 第 1 版的資料庫升級時補上提醒紀錄表
+        execute(storage, 'DROP TABLE reminder_deliveries')
+        execute(storage, 'DELETE FROM schema_version WHERE version = 2')
+        assert storage.init_schema() == [2]
+        assert query(storage, 'SELECT COUNT(*) FROM reminder_deliveries') == [(0,)]
+
+        # 重複搬移不會產生重複資料，序號接在搬入的最大 id 之後
+        storage.copy_from_sqlite(seed_db.db_path)
+        with seed_db.connection() as conn:
+            employees, max_id = conn.execute('SELECT COUNT(*), MAX(id) FROM employees').fetchone()
+        assert query(storage, 'SELECT COUNT(*) FROM employees') == [(employees,)]
+        execute(storage, "INSERT INTO employees (employee_id, name, department_id, shift_type) "
+                         "VALUES ('IGA1-20000', '新進員工', 1, 'day')")
+        assert query(storage, "SELECT id FROM employees WHERE employee_id = 'IGA1-20000'") == [(max_id + 1,)]
+
+        # 改訂班次時觸發器保留原本的預約
+        assert storage.reservations.book(1, 1, DAY)['success']
+        assert storage.reservations.book(1, 2, DAY)['success']
+        assert query(storage, 'SELECT schedule_id, status FROM bus_reservations WHERE employee_id = 1 ORDER BY id') == [
+            (2, 'active'), (1, 'cancelled')]
@@ -0,0 +1,89 @@
+import os
+import logging
+import sqlite3
+from datetime import datetime, time, timedelta, timezone
+
+import pytest
+
+from database import DatabaseManager
+from repository import SQLiteSettings
+from settings import TAIPEI_TZ, DeadlineEvaluator, SettingsCache, parse_deadlines
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = DatabaseManager(os.path.join(tmp_path, 'test.db'))
+    db.insert_initial_data()
+    yield db
+    db.pool.close_all()
+
+
+def set_deadline(db, key, value):
+    # 模擬 disable_time_check.py：由另一條連線直接修改資料表
+    conn = sqlite3.connect(db.db_path)
+    conn.execute('UPDATE system_settings SET setting_value = ? WHERE setting_key = ?', (value, key))
+    conn.commit()
+    conn.close()
+
+
+def taipei(hour, minute, second=0):
+    return datetime(2024, 6, 3, hour, minute, second, tzinfo=TAIPEI_TZ)
+
+
+def test_deadlines_follow_settings_in_taipei_time(db):
+    deadlines = DeadlineEvaluator(SettingsCache(SQLiteSettings(db), check_interval=0))
+    assert deadlines.deadline('bus', 'day') == time(14, 30)
+    assert deadlines.is_open('bus', 'day', taipei(14, 30, 59))
+    assert not deadlines.is_open('bus', 'day', taipei(14, 31))
+    assert not deadlines.is_open('meal', 'night', taipei(21, 1))
+
+    # 伺服器在 UTC 時區：06:00 UTC 是台北 14:00
+    assert deadlines.is_open('bus', 'day', datetime(2024, 6, 3, 6, 0, tzinfo=timezone.utc))
+    assert not deadlines.is_open('bus', 'day', datetime(2024, 6, 3, 6, 31, tzinfo=timezone.utc))
+    deadlines.settings.close()
+
+
+def test_malformed_deadline_falls_back_with_warning(caplog):
+    with caplog.at_level(logging.WARNING, logger='settings'):
+        deadlines = parse_deadlines({'bus_day_deadline': '25:99'})
+    assert deadlines['bus', 'day'] == time(14, 30)
+    assert [r.getMessage() for r in caplog.records] == ['⚠️ 系統設定 bus_day_deadline 格式錯誤 (25:99)，改用預設 14:30']
+
+
+def test_changes_from_other_connections_are_picked_up(db):
+    settings = SettingsCache(SQLiteSettings(db), check_interval=0)
+    deadlines = DeadlineEvaluator(settings)
+    assert not deadlines.is_open('meal', 'day', taipei(12, 0))
+    assert settings.reloads == 1
+
+    # 其他資料表的寫入只會重新讀取，不會重建
+    with db.connection() as conn:
+        conn.execute('''
+            INSERT INTO departments (dept_code, dept_name_zh, dept_name_en, dept_name_vi)
+            VALUES ('QA', '品保', 'QA', 'QA')
+        ''')
+        conn.commit()
+    assert deadlines.deadline('meal', 'day') == time(9, 0)
+    assert settings.reloads == 1
+
+    set_deadline(db, 'meal_day_deadline', '23:59')
+    assert deadlines.is_open('meal', 'day', taipei(12, 0))
+    assert settings.reloads == 2
+
+    set_deadline(db, 'meal_day_deadline', 'later')
+    assert deadlines.deadline('meal', 'day') == time(9, 0)
+    settings.close()
+
+
+def test_no_query_within_check_interval(db):
+    settings = SettingsCache(SQLiteSettings(db), check_interval=60)
+    deadlines = DeadlineEvaluator(settings)
+    for _ in range(100):
+        deadlines.is_open('bus', 'night', taipei(8, 0) + timedelta(minutes=1))
+    assert settings.checks == 1
+
+    set_deadline(db, 'bus_night_deadline', '08:00')
+    assert deadlines.is_open('bus', 'night', taipei(8, 1))
+    settings.invalidate()
+    assert not deadlines.is_open('bus', 'night', taipei(8, 1))
+    settings.close()
@@ -0,0 +1,136 @@
+import time
+import threading
+from types import SimpleNamespace
+
+from webhook_queue import EventDispatcher, event_user_key
+
+
+def make_event(user_id: str, seq: int):
+    return SimpleNamespace(source=SimpleNamespace(user_id=user_id), seq=seq)
+
+
+def test_events_of_same_user_are_processed_in_order():
+    handled = []
+    lock = threading.Lock()
+
+    def handle(event):
+        # 先到的事件處理較久，若同一位使用者的事件分到不同 worker 就會亂序
+        time.sleep(0.004 if event.seq % 2 == 0 else 0.0)
+        with lock:
+            handled.append((event.source.user_id, event.seq, threading.current_thread().name))
+
+    dispatcher = EventDispatcher(handle, workers=4, queue_size=400)
+    dispatcher.start()
+    users = [f'U{i}' for i in range(8)]
+    for seq in range(20):
+        for user in users:
+            assert dispatcher.submit(make_event(user, seq))
+    dispatcher.stop()
+
+    assert len(handled) == 20 * len(users)
+    for user in users:
+        records = [(seq, thread) for uid, seq, thread in handled if uid == user]
+        assert [seq for seq, _ in records] == list(range(20))
+        assert len({thread for _, thread in records}) == 1
+    assert dispatcher.stats()['processed'] == 160
+    assert event_user_key(SimpleNamespace(source=SimpleNamespace(user_id=None, group_id='C1'))) == 'C1'
+
+
+def test_full_queue_rejects_after_timeout():
+    release = threading.Event()
+    started = threading.Event()
+    handled = []
+
+    def handle(event):
+        started.set()
+        release.wait(5)
+        handled.append(event.seq)
+
+    dispatcher = EventDispatcher(handle, workers=1, queue_size=2, enqueue_timeout=0.05)
+    dispatcher.start()
+    try:
+        assert dispatcher.submit(make_event('U1', 0))
+        assert started.wait(5)
+        # worker 卡在第一個事件，佇列只放得下兩個
+        assert dispatcher.submit(make_event('U1', 1))
+        assert dispatcher.submit(make_event('U1', 2))
+        start = time.monotonic()
+        assert not dispatcher.submit(make_event('U1', 3))
+        assert time.monotonic() - start >= 0.05
+        stats = dispatcher.stats()
+        assert (stats['rejected'], stats['depth'], stats['capacity']) == (1, 2, 2)
+    finally:
+        release.set()
+        dispatcher.stop()
+    assert handled == [0, 1, 2]
+
+
+def test_full_queue_rejects_immediately_by_default():
+    release = threading.Event()
+    started = threading.Event()
+
+    def handle(event):
+        started.set()
+        release.wait(5)
+
+    dispatcher = EventDispatcher(handle, workers=1, queue_size=1)
+    dispatcher.start()
+    try:
+        assert dispatcher.submit(make_event('U1', 0))
+        assert started.wait(5)
+        assert dispatcher.submit(make_event('U1', 1))
+        start = time.monotonic()
+        assert not dispatcher.submit(make_event('U1', 2))
+        assert time.monotonic() - start < 0.05
+    finally:
+        release.set()
+        dispatcher.stop()
+
+
+def test_failed_event_releases_dedup_claim():
+    released = []
+
+    def handle(event):
+        if event.seq == 1:
+            raise RuntimeError('boom')
+
+    dispatcher = EventDispatcher(handle, workers=1, release_event=released.append)
+    dispatcher.start()
+    events = [make_event('U1', seq) for seq in range(3)]
+    for event in events:
+        assert dispatcher.submit(event)
+    dispatcher.stop()
+
+    # 只有處理失敗的事件取消登記，LINE 重送時才會再處理
+    assert released == [events[1]]
+    stats = dispatcher.stats()
+    assert (stats['processed'], stats['failed']) == (3, 1)
+
+
+def test_stop_does_not_hang_on_full_queue():
+    release = threading.Event()
+    started = threading.Event()
+    handled = []
+
+    def handle(event):
+        started.set()
+        release.wait(5)
+        handled.append(event.seq)
+
+    dispatcher = EventDispatcher(handle, workers=1, queue_size=1)
+    dispatcher.start()
+    threads = list(dispatcher._threads)
+    assert dispatcher.submit(make_event('U1', 0))
+    assert started.wait(5)
+    assert dispatcher.submit(make_event('U1', 1))
+
+    start = time.monotonic()
+    dispatcher.stop(timeout=0.2)
+    assert time.monotonic() - start < 1
+
+    # worker 忙完後仍會處理完佇列中剩下的事件再結束
+    release.set()
+    for thread in threads:
+        thread.join(5)
+        assert not thread.is_alive()
+    assert handled == [0, 1]
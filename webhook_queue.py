@@ -0,0 +1,143 @@
+"""Webhook 事件非同步處理
+
+/callback 驗證簽章後把事件放進佇列就立即回應 LINE，由背景 worker 執行實際處理。
+同一位使用者的事件固定分派到同一個 worker 的佇列，因此會依收到的順序處理。
+"""
+import time
+import zlib
+import queue
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+_STOP = object()
+
+
+def event_user_key(event) -> str:
+    """事件的排序鍵：使用者 ID，群組/聊天室則用其 ID"""
+    source = getattr(event, 'source', None)
+    for attr in ('user_id', 'group_id', 'room_id'):
+        value = getattr(source, attr, None)
+        if value:
+            return value
+    return ''
+
+
+class EventDispatcher:
+    """有界佇列 + 固定數量 worker 的事件分派器
+    
+    enqueue_timeout 預設 0：佇列滿時立即拒收 (webhook 回 503)，不佔住請求執行緒。
+    release_event 在事件處理失敗時呼叫，釋放去重登記讓重送的事件能再處理。
+    """
+    
+    def __init__(self, handle_event: Callable, workers: int = 4, queue_size: int = 1000,
+                 enqueue_timeout: float = 0.0, release_event: Optional[Callable] = None):
+        self.handle_event = handle_event
+        self.release_event = release_event
+        self.workers = max(1, workers)
+        self.enqueue_timeout = enqueue_timeout
+        per_worker = max(1, queue_size // self.workers)
+        self._queues: List[queue.Queue] = [queue.Queue(maxsize=per_worker) for _ in range(self.workers)]
+        self._threads: List[threading.Thread] = []
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {
+            'enqueued': 0,
+            'processed': 0,
+            'failed': 0,
+            'rejected': 0,
+            'max_depth': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0
+        }
+    
+    def start(self):
+        """啟動背景 worker"""
+        self._stopping.clear()
+        for index, q in enumerate(self._queues):
+            thread = threading.Thread(target=self._run, args=(q,), name=f'webhook-worker-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+    
+    def stop(self, timeout: float = 10.0):
+        """處理完佇列中剩餘事件後停止 worker，最多等待 timeout 秒"""
+        self._stopping.set()
+        for q in self._queues:
+            # 佇列已滿時放不進停止標記，worker 清空佇列後看到 _stopping 也會結束
+            try:
+                q.put_nowait(_STOP)
+            except queue.Full:
+                pass
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        self._threads = []
+    
+    def submit(self, event) -> bool:
+        """放入事件，佇列滿且等待逾時則回傳 False"""
+        q = self._queues[zlib.crc32(event_user_key(event).encode('utf-8')) % self.workers]
+        try:
+            if self.enqueue_timeout > 0:
+                q.put((time.monotonic(), event), timeout=self.enqueue_timeout)
+            else:
+                q.put_nowait((time.monotonic(), event))
+        except queue.Full:
+            with self._lock:
+                self._stats['rejected'] += 1
+            return False
+        
+        depth = q.qsize()
+        with self._lock:
+            self._stats['enqueued'] += 1
+            if depth > self._stats['max_depth']:
+                self._stats['max_depth'] = depth
+        return True
+    
+    def _run(self, q: queue.Queue):
+        while True:
+            try:
+                item = q.get(timeout=0.1)
+            except queue.Empty:
+                if self._stopping.is_set():
+                    break
+                continue
+            if item is _STOP:
+                break
+            enqueued_at, event = item
+            waited = time.monotonic() - enqueued_at
+            
+            failed = False
+            try:
+                self.handle_event(event)
+            except Exception:
+                failed = True
+                logger.exception("❌ 事件處理錯誤")
+                if self.release_event is not None:
+                    try:
+                        self.release_event(event)
+                    except Exception:
+                        logger.exception("❌ 釋放事件去重登記失敗")
+            
+            with self._lock:
+                self._stats['processed'] += 1
+                if failed:
+                    self._stats['failed'] += 1
+                self._stats['wait_seconds_total'] += waited
+                if waited > self._stats['wait_seconds_max']:
+                    self._stats['wait_seconds_max'] = waited
+    
+    def depth(self) -> int:
+        """目前所有佇列中待處理的事件數"""
+        return sum(q.qsize() for q in self._queues)
+    
+    def stats(self) -> Dict:
+        """背壓統計：佇列深度、排隊時間、拒收數"""
+        with self._lock:
+            stats = dict(self._stats)
+        processed = stats['processed']
+        stats['wait_seconds_avg'] = stats['wait_seconds_total'] / processed if processed else 0.0
+        stats['depth'] = self.depth()
+        stats['capacity'] = sum(q.maxsize for q in self._queues)
+        stats['workers'] = self.workers
+        return stats
@@ -0,0 +1,9 @@
+"""WSGI 進入點：gunicorn -c gunicorn.conf.py wsgi:app
+
+每個 worker 程序載入時各自執行 startup()，資料庫連線、背景 worker 與 SDK 預先載入都在 worker 內建立。
+"""
+from app import app, startup
+
+startup()
+
+application = app